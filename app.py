@@ -1,37 +1,81 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, abort, send_file, session, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, abort, send_file, session, flash, Response
 import datetime
 import json
 import os
 from werkzeug.utils import secure_filename
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
+from werkzeug.http import parse_content_range_header
 from io import BytesIO
 from collections import defaultdict
 from flask_moment import Moment
-from matplotlib.backends.backend_pdf import PdfPages
-from sqlalchemy import func
+from sqlalchemy import func, case, event, text, insert, inspect, extract
+from sqlalchemy.orm import validates
+import click
 import base64
+import calendar
+import hashlib
 
 #from weasyprint import HTML, CSS
 # App erstellen
-app = Flask(__name__)
+# INSTANCE_PATH (absolut) verlegt instance/ mit allen daraus abgeleiteten Dateien, z. B. für Tests
+app = Flask(__name__, instance_path=os.environ.get('INSTANCE_PATH'))
 app.secret_key = 'dein_geheimer_schlüssel_12345'
 
 # Flask-Moment initialisieren
 moment = Moment(app)
 
-# Datenbank konfigurieren (nur SQLite)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///local.db'
+# Datenbank konfigurieren: SQLite (Standard) oder PostgreSQL über DATABASE_URL
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///local.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 UPLOAD_PATH = os.path.join('static', 'Uploads')
 os.makedirs(UPLOAD_PATH, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_PATH
 
 # Datenbank initialisieren
-from database import db, init_db
+from database import db, init_db, upsert_insert
 init_db(app)
 
+# Versionszähler pro Tabelle, werden bei jedem Commit automatisch erhöht
+from content_versions import content_versions
+content_versions.init_app(app, db)
+
+# Seiten-Cache für anonyme Besucher
+from page_cache import page_cache
+page_cache.init_app(app)
+
+# Hintergrund-Jobs für PDFs, Diagramme und Exporte, Ergebnisse im Artefakt-Cache
+# matplotlib/seaborn/pandas werden erst mit dem ersten Bericht geladen (reporting.load)
+import reporting
+import sterbestatistik
+from artifact_cache import artifact_cache
+from report_jobs import report_jobs
+artifact_cache.init_app(app)
+report_jobs.init_app(app, db, artifact_cache, preload=reporting.PRELOAD_MODULES)
+from image_derivatives import image_derivatives, variant_files
+image_derivatives.init_app(app)
+
+# Uploads inhaltsadressiert unter UPLOAD_FOLDER/blobs, Verweise in upload_blob gezählt
+from upload_storage import upload_storage, is_blob
+upload_storage.init_app(app, db)
+
+# Statische Dateien unter /assets/<fingerprint>/ mit Cache-Control: immutable
+from static_assets import static_assets
+static_assets.init_app(app)
+
+# Header-Bilder der Startseite aus einem Manifest statt os.listdir pro Aufruf
+from header_images import header_images
+header_images.init_app(app)
+
+@app.cli.command('header-bilder')
+def header_bilder_command():
+    """Baut das Manifest der Header-Bilder neu auf und erzeugt fehlende Varianten."""
+    bilder = header_images.rebuild()
+    click.echo(f"{len(bilder)} Header-Bild(er) im Manifest.")
+
+@app.template_global()
+def upload_url(name, legacy_dir=''):
+    """URL einer hochgeladenen Datei; alte Dateinamen liegen unter uploads/<legacy_dir>/"""
+    return static_assets.url(upload_storage.static_path(name, legacy_dir))
+
 # Import der erweiterten Modelle aus models.py
 from models import (
     Subject, Teacher, TeacherSubject, TimeSlot, ScheduleEntry, 
@@ -50,10 +94,42 @@ class Kommentar(db.Model):
 class ahde_vefa(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    birth_date = db.Column(db.String(20))
-    death_date = db.Column(db.String(20))
+    # Früher String(20); Umstellung und Übernahme alter Texte per 'flask db upgrade'
+    birth_date = db.Column(db.Date)
+    death_date = db.Column(db.Date, index=True)
+    # Aus dem Datum abgeleitet (bzw. reine Jahresangabe), für Filter und Statistik
+    birth_year = db.Column(db.Integer, index=True)
+    death_year = db.Column(db.Integer, index=True)
+    # Nicht lesbare Altwerte aus der Übernahme, damit nichts verloren geht
+    date_note = db.Column(db.String(100))
     image_filename = db.Column(db.String(100))
 
+    # Sortierung der öffentlichen Liste (Keyset-Pagination nach Name)
+    __table_args__ = (
+        db.Index('ix_ahde_vefa_name_id', 'name', 'id'),
+    )
+
+    @validates('birth_date', 'death_date')
+    def _parse_date(self, key, value):
+        """Nimmt date-Objekte oder Formulartexte an und setzt das passende Jahr mit"""
+        date, year = sterbestatistik.parse_flexible_date(value)
+        setattr(self, key.replace('_date', '_year'), year)
+        return date
+
+class AhdeVefaJahr(db.Model):
+    """Geburten und Todesfälle je Jahr im ahde_vefa-Register.
+
+    Wird im selben Flush wie jeder Eintrag fortgeschrieben
+    (siehe _track_ahde_vefa_years), damit die Statistik nicht bei jedem
+    Aufruf über alle Einträge laufen muss.
+    """
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    geburten = db.Column(db.Integer, nullable=False, default=0)
+    tode = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<AhdeVefaJahr {self.year}: {self.geburten}/{self.tode}>"
+
 class GalerieAlbum(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -68,6 +144,23 @@ class GalerieBild(db.Model):
     titel = db.Column(db.String(100))
     beschreibung = db.Column(db.Text)
     upload_datum = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Maße des Originals (nach EXIF-Drehung) und erzeugte Varianten, siehe image_derivatives
+    breite = db.Column(db.Integer)
+    hoehe = db.Column(db.Integer)
+    varianten = db.Column(db.JSON)
+
+    def static_name(self, groesse=None, fmt='jpeg'):
+        """Pfad unter static/ für eine Variante, ohne passende Variante das Original"""
+        variante = (self.varianten or {}).get(groesse) or {}
+        return upload_storage.static_path(variante.get(fmt) or self.dateiname, 'galerie')
+
+    def srcset(self, fmt='jpeg'):
+        """srcset über alle Größen eines Formats, leer ohne Varianten"""
+        breiten = {variante[fmt]: variante['breite'] for variante in (self.varianten or {}).values() if variante.get(fmt)}
+        return ', '.join(
+            f"{static_assets.url(upload_storage.static_path(name, 'galerie'))} {breite}w"
+            for name, breite in sorted(breiten.items(), key=lambda item: item[1])
+        )
 
 class AktuellesPost(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -114,9 +207,34 @@ class Transaction(db.Model):
     is_approved = db.Column(db.Boolean, default=False)
     accounting_circle = db.Column(db.String(100), default='Hauptbuch')
 
+    # Indizes für die gruppierten Summen im Finanz-Dashboard
+    __table_args__ = (
+        db.Index('ix_transaction_cost_center_type', 'cost_center_id', 'type'),
+        db.Index('ix_transaction_process_type', 'process_id', 'type'),
+        db.Index('ix_transaction_date', 'date'),
+    )
+
     def __repr__(self):
         return f"<Transaction {self.description}>"
 
+class FinanceSummary(db.Model):
+    """Laufende Summen pro Kostenstelle, Vorgang, Monat und Kategorie.
+
+    Wird im selben Flush wie jede Transaktion fortgeschrieben
+    (siehe _track_finance_changes), ``flask finance-summary`` baut sie neu auf.
+    scope ist 'total', 'cost_center', 'process', 'month' oder 'category'.
+    """
+    scope = db.Column(db.String(20), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True, default='')
+    # Geldbeträge als Numeric; asdecimal=False, weil die Beträge in Transaction Float sind
+    income = db.Column(db.Numeric(14, 2, asdecimal=False), nullable=False, default=0.0)
+    expense = db.Column(db.Numeric(14, 2, asdecimal=False), nullable=False, default=0.0)
+    balance = db.Column(db.Numeric(14, 2, asdecimal=False), nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<FinanceSummary {self.scope}:{self.key} {self.balance}>"
+
 # Legacy Klassenbuch-Modelle für Kompatibilität
 class Klasse(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -144,6 +262,9 @@ class Unterrichtseinheit(db.Model):
 
 # Anwesenheit wird durch das neue Attendance-Modell ersetzt, aber für Kompatibilität beibehalten
 class Anwesenheit(db.Model):
+    # Ein Eintrag je Schüler und Unterrichtseinheit, Grundlage für den Upsert in anwesenheit_speichern
+    # (als Index, damit create_missing_indexes ihn auch bestehenden Tabellen hinzufügt)
+    __table_args__ = (db.Index('uq_anwesenheit_schueler_einheit', 'schueler_id', 'unterrichtseinheit_id', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     schueler_id = db.Column(db.Integer, db.ForeignKey('schueler.id'), nullable=False)
     unterrichtseinheit_id = db.Column(db.Integer, db.ForeignKey('unterrichtseinheit.id'), nullable=False)
@@ -169,10 +290,130 @@ def load_updates():
         data_storage = []
         save_updates()
 
-# Datenbank wird bereits durch init_db() initialisiert
+# Spalten, die auf Dateien der Upload-Ablage verweisen
+upload_storage.track(ahde_vefa.image_filename, Transaction.document_filename, GalerieBild.dateiname, BlogPost.image)
+
+def anwesenheit_duplikate_entfernen():
+    """Behält je Schüler und Unterrichtseinheit nur den jüngsten Anwesenheits-Eintrag.
+
+    Bestehende Datenbanken bekommen den eindeutigen Index erst durch
+    sync_schema; mit doppelten Einträgen ließe er sich nicht anlegen.
+    """
+    inspector = inspect(db.engine)
+    if not inspector.has_table('anwesenheit'):
+        return 0
+    if any(index['name'] == 'uq_anwesenheit_schueler_einheit' for index in inspector.get_indexes('anwesenheit')):
+        return 0
+    result = db.session.execute(text(
+        'DELETE FROM anwesenheit WHERE id NOT IN '
+        '(SELECT MAX(id) FROM anwesenheit GROUP BY schueler_id, unterrichtseinheit_id)'))
+    db.session.commit()
+    if result.rowcount:
+        # SQL an den Flush-Events vorbei
+        content_versions.bump('anwesenheit')
+    return result.rowcount
+
+with app.app_context():
+    anwesenheit_duplikate_entfernen()
+
+# Tabellen und Indizes der oben definierten Modelle anlegen
+from database import sync_schema
+sync_schema(app)
+
+# --- Jahresstatistik ahde_vefa (inkrementell gepflegt) ---
+
+AHDE_VEFA_YEAR_FIELDS = ('birth_year', 'death_year')
+
+def _add_year_delta(deltas, birth_year, death_year, sign):
+    if birth_year is not None:
+        deltas[birth_year][0] += sign
+    if death_year is not None:
+        deltas[death_year][1] += sign
+
+@event.listens_for(db.session, 'before_flush')
+def _track_ahde_vefa_years(session, flush_context, instances):
+    """Ermittelt die Änderungen der Jahreszahlen aus neuen, geänderten und gelöschten Einträgen"""
+    new = [obj for obj in session.new if isinstance(obj, ahde_vefa)]
+    dirty = [obj for obj in session.dirty if isinstance(obj, ahde_vefa) and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, ahde_vefa)]
+    if not (new or dirty or deleted):
+        return
+
+    deltas = session.info.setdefault('ahde_vefa_year_deltas', defaultdict(lambda: [0, 0]))
+    # Alte Jahre aus der Datenbank, dort steht vor dem Flush noch der alte Stand
+    old_ids = [obj.id for obj in dirty + deleted if obj.id is not None]
+    if old_ids:
+        with session.no_autoflush:
+            for birth_year, death_year in session.query(ahde_vefa.birth_year, ahde_vefa.death_year) \
+                    .filter(ahde_vefa.id.in_(old_ids)):
+                _add_year_delta(deltas, birth_year, death_year, -1)
+    for obj in new + dirty:
+        _add_year_delta(deltas, obj.birth_year, obj.death_year, 1)
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_ahde_vefa_years(session, flush_context):
+    deltas = session.info.pop('ahde_vefa_year_deltas', None)
+    if not deltas:
+        return
+    table = AhdeVefaJahr.__table__
+    rows = [{'year': year, 'geburten': births, 'tode': deaths}
+            for year, (births, deaths) in deltas.items() if births or deaths]
+    if not rows:
+        return
+    connection = session.connection()
+    stmt = upsert_insert(table)
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.year],
+        set_={
+            'geburten': table.c.geburten + stmt.excluded.geburten,
+            'tode': table.c.tode + stmt.excluded.tode,
+        },
+    ), rows)
+    connection.execute(table.delete().where(table.c.geburten == 0, table.c.tode == 0))
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_ahde_vefa_years(session):
+    session.info.pop('ahde_vefa_year_deltas', None)
+
+def rebuild_ahde_vefa_jahre():
+    """Zählt die Jahresstatistik neu aus den Jahres-Spalten (zwei gruppierte Abfragen)"""
+    totals = defaultdict(lambda: [0, 0])
+    for column, index in ((ahde_vefa.birth_year, 0), (ahde_vefa.death_year, 1)):
+        for year, count in db.session.query(column, func.count()).filter(column.isnot(None)).group_by(column):
+            totals[year][index] = count
+    connection = db.session.connection()
+    connection.execute(AhdeVefaJahr.__table__.delete())
+    if totals:
+        connection.execute(AhdeVefaJahr.__table__.insert(), [
+            {'year': year, 'geburten': births, 'tode': deaths} for year, (births, deaths) in totals.items()])
+    db.session.commit()
+
+def ahde_vefa_migration_pending():
+    """True, solange birth_date/death_date noch Textspalten sind (vor 'flask db upgrade')"""
+    columns = {column['name']: column['type'] for column in inspect(db.engine).get_columns('ahde_vefa')}
+    return not all(isinstance(columns.get(name), db.Date) for name in ('birth_date', 'death_date'))
+
+with app.app_context():
+    # Die Übernahme alter Textdaten ist eine Migration (migrations/versions), nicht Teil des Starts
+    if ahde_vefa_migration_pending():
+        app.logger.warning("ahde_vefa hat noch Text-Datumsspalten, bitte 'flask db upgrade' ausführen")
+    elif AhdeVefaJahr.query.first() is None and db.session.query(ahde_vefa.id).first() is not None:
+        rebuild_ahde_vefa_jahre()
+
+# Volltextindex über die Namen im ahde_vefa-Register
+from memorial_search import memorial_search
+memorial_search.init_app(app, db)
+AHDE_VEFA_SEARCH_PAGE = 25
+AHDE_VEFA_PAGE_SIZE = 25
+AHDE_VEFA_FILTER_ARGS = ('search_name', 'search_death', 'death_from', 'death_to', 'death_year')
 
 load_updates()
 
+# Seitengrößen für Blog-Listen (Keyset-Pagination)
+from pagination import keyset_page
+LANDING_PAGE_POSTS = 6
+BLOG_PAGE_SIZE = 10
+
 @app.context_processor
 def inject_today():
     return {'today': datetime.date.today()}
@@ -187,11 +428,22 @@ def index():
 
     # prayer_times import
     from prayer_times import prayer_times
+
+    # Anonyme Besucher bekommen die fertig gerenderte Seite aus dem Cache,
+    # der Schlüssel enthält die Versionszähler aller angezeigten Tabellen
+    versions = content_versions.get('blog_post', 'event', 'galerie_album', 'galerie_bild')
+    cacheable = versions is not None and not session.get('admin')
+    cache_key = ('index', today.isoformat(), prayer_times.current_table().version, header_images.version, versions)
+    if cacheable:
+        body = page_cache.get(cache_key)
+        if body is not None:
+            return body
+
     prayer_times_data = prayer_times.get_for_date(today)
     now = datetime.datetime.now()
     
     # Posts laden
-    latest_posts = BlogPost.query.order_by(BlogPost.timestamp.desc()).all()
+    latest_posts, _ = keyset_page(BlogPost.query, BlogPost.created_at, BlogPost.id, limit=LANDING_PAGE_POSTS)
     total_posts = len(latest_posts)
     posts_per_slide = 3  # Oder passe diesen Wert an deine Anforderungen an
 
@@ -201,28 +453,23 @@ def index():
         Event.is_active == True
     ).order_by(Event.event_date.asc()).limit(5).all()
 
-    # Header-Bilder laden
-    header_dir = os.path.join(app.static_folder, 'Uploads', 'header')
-    header_images = []
-    if os.path.exists(header_dir):
-        for file in os.listdir(header_dir):
-            if file.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.gif')):
-                header_images.append(f'uploads/header/{file}')
-
-    return render_template("index.html", 
+    body = render_template("index.html", 
                            prayer_times=prayer_times_data,
                            today=today,
                            now=now,
                            latest_posts=latest_posts,
                            upcoming_events=upcoming_events,
-                           header_images=header_images,
+                           header_images=header_images.get(),
                            total_posts=total_posts,
                            posts_per_slide=posts_per_slide)
+    if cacheable:
+        page_cache.set(cache_key, body)
+    return body
 
 
 @app.route('/blog')
 def blog():
-    posts = BlogPost.query.order_by(BlogPost.timestamp.desc()).all()
+    posts, next_cursor = keyset_page(BlogPost.query, BlogPost.created_at, BlogPost.id, limit=BLOG_PAGE_SIZE)
     upcoming_events = Event.query.filter(
         Event.event_date >= datetime.datetime.utcnow(),
         Event.is_active == True
@@ -230,10 +477,30 @@ def blog():
     return render_template(
         'aktuelles.html',
         blog_posts=posts,
+        next_cursor=next_cursor,
         updates=data_storage,
         upcoming_events=upcoming_events
     )
 
+@app.route('/api/blog-posts')
+def api_blog_posts():
+    """'Mehr laden' für die Blog-Liste, setzt nach dem übergebenen Cursor fort"""
+    try:
+        posts, next_cursor = keyset_page(BlogPost.query, BlogPost.created_at, BlogPost.id,
+                                         cursor=request.args.get('cursor'), limit=BLOG_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "posts": [{
+            "id": post.id,
+            "title": post.title,
+            "created_at": post.created_at.isoformat() if post.created_at else None,
+            "url": url_for('blog_post', post_id=post.id),
+        } for post in posts],
+        "html": render_template('_blog_posts.html', blog_posts=posts),
+        "next_cursor": next_cursor,
+    })
+
 @app.route('/blog/<int:post_id>', methods=['GET', 'POST'])
 def blog_post(post_id):
     post = BlogPost.query.get_or_404(post_id)
@@ -257,13 +524,13 @@ def aktuelles():
             db.session.commit()
         return redirect(url_for('aktuelles'))
 
-    blog_posts = BlogPost.query.order_by(BlogPost.timestamp.desc()).all()
+    blog_posts, next_cursor = keyset_page(BlogPost.query, BlogPost.created_at, BlogPost.id, limit=BLOG_PAGE_SIZE)
     upcoming_events = Event.query.filter(
         Event.event_date >= datetime.datetime.utcnow(),
         Event.is_active == True
     ).order_by(Event.event_date.asc()).limit(5).all()
 
-    return render_template('aktuelles.html', blog_posts=blog_posts, upcoming_events=upcoming_events)
+    return render_template('aktuelles.html', blog_posts=blog_posts, next_cursor=next_cursor, upcoming_events=upcoming_events)
 
 @app.route('/aktuelles/<int:post_id>/kommentar', methods=['POST'])
 def aktuelles_kommentar(post_id):
@@ -294,10 +561,7 @@ def blog_new_post():
         image = request.files.get('image')
         filename = None
         if image and image.filename:
-            filename = secure_filename(image.filename)
-            upload_path = os.path.join(app.config['UPLOAD_FOLDER'], 'blog')
-            os.makedirs(upload_path, exist_ok=True)
-            image.save(os.path.join(upload_path, filename))
+            filename = upload_storage.save(image)
         new_post = BlogPost(title=title, content=content, image=filename)
         db.session.add(new_post)
         db.session.commit()
@@ -338,7 +602,7 @@ def delete_comment(comment_id):
 def admin_dashboard():
     if not session.get('admin'):
         return redirect(url_for('blog_admin_login'))
-    recent_posts = BlogPost.query.order_by(BlogPost.timestamp.desc()).limit(5).all()
+    recent_posts = BlogPost.query.order_by(BlogPost.created_at.desc(), BlogPost.id.desc()).limit(5).all()
     recent_ahde_vefa = ahde_vefa.query.order_by(ahde_vefa.id.desc()).limit(5).all()
     blog_count = BlogPost.query.count()
     ahde_vefa_count = ahde_vefa.query.count()
@@ -378,58 +642,106 @@ def blog_admin_logout():
 def gemeinde():
     return render_template('gemeinde.html')
 
+# --- Hintergrund-Berichte ---
+
+def _report_job_urls(job):
+    return {
+        'status_url': url_for('report_job_status', job_id=job['id']),
+        'download_url': url_for('report_job_download', job_id=job['id']),
+    }
+
+def render_report_job(job, title):
+    """Warteseite, die den Auftrag abfragt und nach Fertigstellung den Download startet"""
+    return render_template('report_job.html', job=report_jobs.status(job), title=title, **_report_job_urls(job))
+
+@app.route('/berichte/<task_name>', methods=['POST'])
+def report_job_submit(task_name):
+    task = report_jobs.tasks.get(task_name)
+    if task is None:
+        abort(404)
+    if task.admin and not session.get('admin'):
+        abort(403)
+    try:
+        params = task.parse_params(request.get_json(silent=True) or request.values)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Ungültige Parameter: {e}"}), 400
+    job = report_jobs.submit(task_name, **params)
+    return jsonify({**report_jobs.status(job), **_report_job_urls(job)}), 202
+
+@app.route('/berichte/job/<job_id>')
+def report_job_status(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        abort(404)
+    if report_jobs.tasks[job['task']].admin and not session.get('admin'):
+        abort(403)
+    return jsonify({**report_jobs.status(job), **_report_job_urls(job)})
+
+@app.route('/berichte/job/<job_id>/download')
+def report_job_download(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        abort(404)
+    task = report_jobs.tasks[job['task']]
+    if task.admin and not session.get('admin'):
+        abort(403)
+    path = report_jobs.artifact_path(job)
+    if path is None:
+        if job['status'] == 'done':
+            # Datei wurde aus dem Cache verdrängt: neu erzeugen statt dauerhaft 409
+            job = report_jobs.requeue(job)
+            if request.accept_mimetypes.accept_html:
+                return render_report_job(job, task.file_name(json.loads(job['params'])))
+        return jsonify(report_jobs.status(job)), 409
+    download_name = task.file_name(json.loads(job['params']))
+    # Gecachte Berichte tragen ihren Inhaltsschlüssel als ETag, Wiederholungen enden mit 304
+    return send_file(path, download_name=download_name, as_attachment=request.args.get('inline') is None,
+                     conditional=True, etag=job['cache_key'] or True, max_age=3600)
+
+@app.route('/admin/berichte/cache')
+def report_cache_stats():
+    if not session.get('admin'):
+        return redirect(url_for('blog_admin_login'))
+    return jsonify(artifact_cache.stats())
+
+def load_sterbestatistik(query=None):
+    """Sterbestatistik über alle (oder die gefilterten) ahde_vefa-Einträge, Spalten in einer Abfrage"""
+    if query is None:
+        query = db.session.query(ahde_vefa.birth_date, ahde_vefa.death_date,
+                                 ahde_vefa.birth_year, ahde_vefa.death_year)
+    return sterbestatistik.compute(query)
+
 @app.route('/statistik')
 def statistik():
-    eintraege = ahde_vefa.query.all()
-    statistik = defaultdict(lambda: {'geburten': 0, 'tode': 0})
-    for eintrag in eintraege:
-        if eintrag.birth_date:
-            try:
-                jahr = int(eintrag.birth_date[:4])
-                statistik[jahr]['geburten'] += 1
-            except:
-                pass
-        if eintrag.death_date:
-            try:
-                jahr = int(eintrag.death_date[:4])
-                statistik[jahr]['tode'] += 1
-            except:
-                pass
-    jahre = sorted(statistik.keys())
-    geburten = [statistik[jahr]['geburten'] for jahr in jahre]
-    tode = [statistik[jahr]['tode'] for jahr in jahre]
-    return render_template("statistik.html", jahre=jahre, geburten=geburten, tode=tode)
+    stats = load_sterbestatistik()
+    return render_template("statistik.html", jahre=stats.jahre, geburten=stats.geburten, tode=stats.tode)
+
+def sterbestatistik_dataset():
+    """Eingabezeilen der Sterbestatistik für den Cache-Schlüssel.
+
+    Der Inhalt selbst statt der Versionszähler: die liegen in instance/ und
+    passen nach einem Wechsel von DATABASE_URL oder einem Backup nicht mehr.
+    """
+    return db.session.query(ahde_vefa.birth_date, ahde_vefa.death_date,
+                            ahde_vefa.birth_year, ahde_vefa.death_year).order_by(ahde_vefa.id)
+
+@report_jobs.task('sterbestatistik', timeout=180, download_name='Sterbestatistik_Ditib_Fatih',
+                  dataset=sterbestatistik_dataset)
+def sterbestatistik_pdf():
+    """Sterbestatistik als PDF, läuft als Hintergrund-Job"""
+    plt, sns, pd, PdfPages = reporting.load()
+    stats = load_sterbestatistik()
+
+    # Nur Einträge mit gültigem Geburts- und Sterbedatum
+    df = pd.DataFrame({
+        'Geburtsjahr': stats.birth_years,
+        'Todesjahr': stats.death_years,
+        'Alter': stats.ages,
+    })
+    age_stats = stats.age_stats or dict.fromkeys(('min', 'max', 'mean', 'median', 'std', 'q1', 'q3'), float('nan'))
 
-@app.route('/download-statistik-pdf')
-def download_statistik_pdf():
-    eintraege = ahde_vefa.query.all()
-    
-    # Daten sammeln
-    daten = {
-        'Geburtsjahr': [], 'Todesjahr': [], 'Alter': [],
-        'Sterbemonat': [], 'Geburtsmonat': []
-    }
-    
-    for eintrag in eintraege:
-        if eintrag.birth_date and eintrag.death_date:
-            try:
-                birth_date = datetime.datetime.strptime(eintrag.birth_date, "%Y-%m-%d")
-                death_date = datetime.datetime.strptime(eintrag.death_date, "%Y-%m-%d")
-                age = (death_date - birth_date).days / 365.25
-                
-                daten['Geburtsjahr'].append(birth_date.year)
-                daten['Todesjahr'].append(death_date.year)
-                daten['Alter'].append(age)
-                daten['Sterbemonat'].append(death_date.strftime("%B"))
-                daten['Geburtsmonat'].append(birth_date.strftime("%B"))
-            except:
-                continue
-    
-    df = pd.DataFrame(daten)
-    
     # Monatsreihenfolge für Sortierung
-    monatsordnung = ['January', 'February', 'March', 'April', 'May', 'June', 
-                    'July', 'August', 'September', 'October', 'November', 'December']
+    monatsordnung = list(sterbestatistik.MONTH_NAMES)
     
     # PDF erstellen
     buf = BytesIO()
@@ -439,7 +751,7 @@ def download_statistik_pdf():
             # Logo laden mit Fallback wenn nicht vorhanden
             logo = None
             try:
-                logo_path = os.path.join(current_app.root_path, 'static', 'logo.png')
+                logo_path = os.path.join(app.root_path, 'static', 'logo.png')
                 if os.path.exists(logo_path):
                     logo = plt.imread(logo_path)
             except:
@@ -509,14 +821,14 @@ def download_statistik_pdf():
             
             # Zusätzliche Kennzahlen berechnen
             stats_data = [
-                ["Anzahl Datensätze", f"{len(df):,}"],
-                ["Jüngster Verstorbener", f"{df['Alter'].min():.1f} Jahre"],
-                ["Ältester Verstorbener", f"{df['Alter'].max():.1f} Jahre"],
-                ["Durchschnittsalter", f"{df['Alter'].mean():.1f} Jahre"],
-                ["Medianalter", f"{df['Alter'].median():.1f} Jahre"],
-                ["Standardabweichung", f"{df['Alter'].std():.1f} Jahre"],
-                ["Erste Quartil (Q1)", f"{df['Alter'].quantile(0.25):.1f} Jahre"],
-                ["Dritte Quartil (Q3)", f"{df['Alter'].quantile(0.75):.1f} Jahre"]
+                ["Anzahl Datensätze", f"{stats.count:,}"],
+                ["Jüngster Verstorbener", f"{age_stats['min']:.1f} Jahre"],
+                ["Ältester Verstorbener", f"{age_stats['max']:.1f} Jahre"],
+                ["Durchschnittsalter", f"{age_stats['mean']:.1f} Jahre"],
+                ["Medianalter", f"{age_stats['median']:.1f} Jahre"],
+                ["Standardabweichung", f"{age_stats['std']:.1f} Jahre"],
+                ["Erste Quartil (Q1)", f"{age_stats['q1']:.1f} Jahre"],
+                ["Dritte Quartil (Q3)", f"{age_stats['q3']:.1f} Jahre"]
             ]
             
             # Tabelle mit erweiterten Kennzahlen
@@ -548,7 +860,7 @@ def download_statistik_pdf():
             
             # 1. Saisonale Verteilung der Todesfälle
             ax1 = plt.subplot(2, 2, 1)
-            monat_count = df['Sterbemonat'].value_counts().reindex(monatsordnung)
+            monat_count = pd.Series(stats.death_month_counts, index=monatsordnung)
             sns.barplot(x=monat_count.index, y=monat_count.values, palette='Reds', ax=ax1)
             ax1.set_title('Todesfälle nach Monat', pad=15)
             ax1.set_xlabel('Monat')
@@ -557,7 +869,7 @@ def download_statistik_pdf():
             
             # 2. Saisonale Verteilung der Geburten
             ax2 = plt.subplot(2, 2, 2)
-            monat_count = df['Geburtsmonat'].value_counts().reindex(monatsordnung)
+            monat_count = pd.Series(stats.birth_month_counts, index=monatsordnung)
             sns.barplot(x=monat_count.index, y=monat_count.values, palette='Blues', ax=ax2)
             ax2.set_title('Geburten nach Monat', pad=15)
             ax2.set_xlabel('Monat')
@@ -600,8 +912,15 @@ def download_statistik_pdf():
         plt.close('all')
         raise e
     
-    buf.seek(0)
-    return send_file(buf, as_attachment=True, download_name="Sterbestatistik_Ditib_Fatih.pdf", mimetype='application/pdf')
+    return buf.getvalue()
+
+@app.route('/download-statistik-pdf')
+def download_statistik_pdf():
+    job = report_jobs.submit('sterbestatistik')
+    if job['status'] == 'done':
+        # Unveränderte Daten: gecachte Datei direkt ausliefern
+        return redirect(url_for('report_job_download', job_id=job['id']))
+    return render_report_job(job, 'Sterbestatistik')
 
 @app.route('/galarie')
 def galarie():
@@ -650,6 +969,27 @@ def admin_galerie_album(album_id):
 def nl2br_filter(s):
     return s.replace('\n', '<br>\n') if s else ''
 
+AHDE_VEFA_NOTE_LABELS = {'birth': 'Geburt', 'death': 'Tod'}
+
+@app.template_filter('lebensdatum')
+def lebensdatum_filter(eintrag, art):
+    """Datum eines ahde_vefa-Eintrags ('birth'/'death') für die Anzeige.
+
+    Ohne vollständiges Datum das Jahr, sonst der nicht lesbare Altwert aus
+    date_note; None, wenn nichts bekannt ist.
+    """
+    datum = getattr(eintrag, f'{art}_date')
+    if datum:
+        return datum
+    jahr = getattr(eintrag, f'{art}_year')
+    if jahr:
+        return jahr
+    prefix = AHDE_VEFA_NOTE_LABELS[art] + ': '
+    for teil in (eintrag.date_note or '').split('; '):
+        if teil.startswith(prefix):
+            return teil[len(prefix):]
+    return None
+
 @app.route('/admin/galerie/album/bearbeiten/<int:album_id>', methods=['GET', 'POST'])
 def admin_galerie_album_bearbeiten(album_id):
     if not session.get('admin'):
@@ -668,18 +1008,75 @@ def admin_galerie_album_bearbeiten(album_id):
             flash('Bitte geben Sie einen Namen für das Album ein.', 'danger')
     return render_template('admin_galerie_album_bearbeiten.html', album=album)
 
+def galerie_bild_verzeichnis(dateiname):
+    """Bilder aus der Upload-Ablage liegen relativ zum Upload-Ordner, alte direkt in galerie/"""
+    if is_blob(dateiname):
+        return app.config['UPLOAD_FOLDER']
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'galerie')
+
+def galerie_varianten_erzeugen(dateiname):
+    """Varianten zu einer Bilddatei; liegt derselbe Inhalt schon in der Galerie, werden dessen Varianten übernommen"""
+    verzeichnis = galerie_bild_verzeichnis(dateiname)
+    if is_blob(dateiname):
+        vorhanden = GalerieBild.query.filter(GalerieBild.dateiname == dateiname, GalerieBild.varianten.isnot(None)).first()
+        if vorhanden and all(os.path.exists(os.path.join(verzeichnis, name)) for name in variant_files(vorhanden.varianten)):
+            return {'breite': vorhanden.breite, 'hoehe': vorhanden.hoehe, 'varianten': vorhanden.varianten}
+    return image_derivatives.generate(verzeichnis, dateiname)
+
+def galerie_bild_varianten(bild):
+    """Erzeugt thumb/medium (JPEG, WebP, AVIF) zu einem Galerie-Bild und vermerkt sie am Bild"""
+    meta = galerie_varianten_erzeugen(bild.dateiname)
+    if meta:
+        bild.breite = meta['breite']
+        bild.hoehe = meta['hoehe']
+        bild.varianten = meta['varianten']
+    return meta is not None
+
+def galerie_bild_dateien_loeschen(bild):
+    """Löscht Original und Varianten eines alten Galerie-Bildes; Dateien der Upload-Ablage räumt deren Zähler auf"""
+    if is_blob(bild.dateiname):
+        return
+    upload_pfad = os.path.join(app.config['UPLOAD_FOLDER'], 'galerie')
+    try:
+        bildpfad = os.path.join(upload_pfad, bild.dateiname)
+        if os.path.exists(bildpfad):
+            os.remove(bildpfad)
+    except Exception as e:
+        app.logger.error(f"Fehler beim Löschen der Bilddatei: {e}")
+    image_derivatives.remove(upload_pfad, variant_files(bild.varianten))
+
+@app.cli.command('uploads-gc')
+@click.option('--dry-run', is_flag=True, help='Nur anzeigen, nichts ändern.')
+def uploads_gc_command(dry_run):
+    """Gleicht die Verweiszähler der Upload-Ablage ab und löscht Dateien ohne Verweis."""
+    korrigiert, verwaist = upload_storage.gc(dry_run=dry_run)
+    for path, count in sorted(korrigiert.items()):
+        click.echo(f"Zähler {path}: {count}")
+    for path in verwaist:
+        click.echo(f"Ohne Verweis: {path}")
+    click.echo(f"{len(korrigiert)} Zähler korrigiert, {len(verwaist)} Datei(en) {'gefunden' if dry_run else 'gelöscht'}.")
+
+@app.cli.command('galerie-varianten')
+@click.option('--alle', is_flag=True, help='Auch Bilder mit vorhandenen Varianten neu erzeugen.')
+def galerie_varianten_command(alle):
+    """Erzeugt fehlende Bildvarianten für bereits hochgeladene Galerie-Bilder."""
+    query = GalerieBild.query if alle else GalerieBild.query.filter(GalerieBild.varianten.is_(None))
+    erzeugt = fehler = 0
+    for bild in query.all():
+        if galerie_bild_varianten(bild):
+            erzeugt += 1
+        else:
+            fehler += 1
+        db.session.commit()
+    click.echo(f"{erzeugt} Bild(er) verarbeitet, {fehler} Fehler.")
+
 @app.route('/admin/galerie/album/loeschen/<int:album_id>', methods=['POST'])
 def admin_galerie_album_loeschen(album_id):
     if not session.get('admin'):
         return redirect(url_for('blog_admin_login'))
     album = GalerieAlbum.query.get_or_404(album_id)
     for bild in album.bilder:
-        try:
-            bildpfad = os.path.join(app.config['UPLOAD_FOLDER'], 'galerie', bild.dateiname)
-            if os.path.exists(bildpfad):
-                os.remove(bildpfad)
-        except Exception as e:
-            app.logger.error(f"Fehler beim Löschen der Bilddatei: {e}")
+        galerie_bild_dateien_loeschen(bild)
     db.session.delete(album)
     db.session.commit()
     flash('Album und alle dazugehörigen Bilder wurden gelöscht!', 'success')
@@ -699,21 +1096,17 @@ def admin_galerie_bild_upload():
     bilder = request.files.getlist('bilder')
     titel = request.form.get('titel', '').strip()
     beschreibung = request.form.get('beschreibung', '').strip()
-    upload_pfad = os.path.join(app.config['UPLOAD_FOLDER'], 'galerie')
-    os.makedirs(upload_pfad, exist_ok=True)
     anzahl_uploads = 0
     for bild in bilder:
         if bild and bild.filename:
-            dateiname = secure_filename(bild.filename)
-            timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-            dateiname = f"{timestamp}_{dateiname}"
-            bild.save(os.path.join(upload_pfad, dateiname))
+            dateiname = upload_storage.save(bild)
             db_bild = GalerieBild(
                 album_id=album.id if album else None,
                 dateiname=dateiname,
                 titel=titel or os.path.splitext(bild.filename)[0],
                 beschreibung=beschreibung
             )
+            galerie_bild_varianten(db_bild)
             db.session.add(db_bild)
             anzahl_uploads += 1
     if anzahl_uploads > 0:
@@ -726,18 +1119,106 @@ def admin_galerie_bild_upload():
     else:
         return redirect(url_for('admin_galerie'))
 
+# --- Stückweiser Upload vieler Bilder (siehe gallery_uploads) ---
+
+def galerie_upload_uebernehmen(staging_path, upload):
+    """Übernimmt eine vollständig empfangene Datei in die Upload-Ablage und erzeugt die Varianten (im Thread-Pool)"""
+    dateiname = upload_storage.adopt(staging_path, upload['sha256'], upload['filename'])
+    meta = galerie_varianten_erzeugen(dateiname)
+    return dateiname, meta
+
+def galerie_stapel_speichern(batch, uploads):
+    """Legt alle fertigen Bilder eines Stapels mit einem Bulk-Insert an"""
+    rows = []
+    for upload in uploads:
+        meta = upload['meta'] or {}
+        rows.append({
+            'album_id': batch['album_id'],
+            'dateiname': upload['stored_path'],
+            'titel': batch['titel'] or os.path.splitext(upload['filename'])[0],
+            'beschreibung': batch['beschreibung'],
+            'upload_datum': datetime.datetime.utcnow(),
+            'breite': meta.get('breite'),
+            'hoehe': meta.get('hoehe'),
+            'varianten': meta.get('varianten'),
+        })
+    try:
+        db.session.execute(insert(GalerieBild), rows)
+        # Bulk-Inserts laufen an den Flush-Events vorbei, Verweise daher selbst zählen
+        upload_storage.add_references(row['dateiname'] for row in rows)
+        db.session.commit()
+    except Exception:
+        # Die übernommenen Dateien haben dann keinen Verweis und fallen an 'flask uploads-gc'
+        db.session.rollback()
+        raise
+    content_versions.bump('galerie_bild')
+
+from gallery_uploads import gallery_uploads, UploadError
+gallery_uploads.init_app(app, process=galerie_upload_uebernehmen, commit=galerie_stapel_speichern)
+
+@app.route('/admin/galerie/uploads', methods=['POST'])
+def admin_galerie_upload_start():
+    """Meldet einen Stapel an: {album_id, titel, beschreibung, files: [{name, size}]}"""
+    if not session.get('admin'):
+        abort(403)
+    data = request.get_json(silent=True) or {}
+    album_id = data.get('album_id') or None
+    if album_id:
+        album_id = GalerieAlbum.query.get_or_404(int(album_id)).id
+    try:
+        batch = gallery_uploads.create_batch(data.get('files') or [], album_id=album_id,
+                                             titel=(data.get('titel') or '').strip(),
+                                             beschreibung=(data.get('beschreibung') or '').strip())
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    batch['status_url'] = url_for('admin_galerie_upload_stapel', batch_id=batch['id'])
+    for datei in batch['files']:
+        datei['url'] = url_for('admin_galerie_upload_datei', upload_id=datei['id'])
+    return jsonify(batch), 201
+
+@app.route('/admin/galerie/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def admin_galerie_upload_datei(upload_id):
+    """PUT mit Content-Range schreibt ein Stück, GET liefert den Stand zum Fortsetzen, DELETE bricht ab"""
+    if not session.get('admin'):
+        abort(403)
+    if request.method == 'GET':
+        upload = gallery_uploads.get(upload_id)
+        if upload is None:
+            abort(404)
+        return jsonify(gallery_uploads.file_status(upload))
+    if request.method == 'DELETE':
+        try:
+            return jsonify(gallery_uploads.cancel(upload_id))
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status
+
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if content_range is None or content_range.units != 'bytes' or content_range.start is None:
+        return jsonify({"error": "Content-Range fehlt"}), 400
+    try:
+        status = gallery_uploads.write_chunk(upload_id, content_range.start,
+                                             content_range.stop - content_range.start, request.stream)
+    except UploadError as e:
+        return jsonify({"error": str(e), "offset": e.offset}), e.status
+    return jsonify(status)
+
+@app.route('/admin/galerie/uploads/stapel/<batch_id>')
+def admin_galerie_upload_stapel(batch_id):
+    """Fortschritt aller Dateien eines Stapels"""
+    if not session.get('admin'):
+        abort(403)
+    batch = gallery_uploads.batch_status(batch_id)
+    if batch is None:
+        abort(404)
+    return jsonify(batch)
+
 @app.route('/admin/galerie/bild/loeschen/<int:bild_id>', methods=['POST'])
 def admin_galerie_bild_loeschen(bild_id):
     if not session.get('admin'):
         return redirect(url_for('blog_admin_login'))
     bild = GalerieBild.query.get_or_404(bild_id)
     album_id = bild.album_id
-    try:
-        bildpfad = os.path.join(app.config['UPLOAD_FOLDER'], 'galerie', bild.dateiname)
-        if os.path.exists(bildpfad):
-            os.remove(bildpfad)
-    except Exception as e:
-        app.logger.error(f"Fehler beim Löschen der Bilddatei: {e}")
+    galerie_bild_dateien_loeschen(bild)
     db.session.delete(bild)
     db.session.commit()
     flash('Bild erfolgreich gelöscht!', 'success')
@@ -785,10 +1266,64 @@ def datenschutz():
     return render_template("datenschutz.html")
 
 # prayer_times import
-from prayer_times import prayer_times
+from prayer_times import prayer_times, PRAYER_NAMES
+from static_files import send_precompressed
+prayer_times.init_app(app)
+
+# Zeitraum- und Monatsabfragen werden lange gecacht, das ETag hängt an der gb.txt-Version
+PRAYER_TIMES_MAX_RANGE_DAYS = 5 * 366
+# Zulässige Jahre für year=..., weit genug für jede gb.txt
+PRAYER_TIMES_YEARS = (1900, 2200)
+app.config.setdefault('PRAYER_TIMES_MAX_AGE', 7 * 24 * 3600)
+
+def _prayer_times_range():
+    """Ermittelt (von, bis) aus from/to oder year/month, ValueError bei ungültigen Angaben"""
+    if 'year' in request.args:
+        year = int(request.args['year'])
+        if not PRAYER_TIMES_YEARS[0] <= year <= PRAYER_TIMES_YEARS[1]:
+            raise ValueError(f"Jahr außerhalb {PRAYER_TIMES_YEARS[0]}-{PRAYER_TIMES_YEARS[1]}")
+        if 'month' not in request.args:
+            return datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+        month = int(request.args['month'])
+        if not 1 <= month <= 12:
+            raise ValueError("Monat muss zwischen 1 und 12 liegen")
+        return datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1])
+    start = datetime.date.fromisoformat(request.args['from'])
+    end = datetime.date.fromisoformat(request.args.get('to', request.args['from']))
+    return start, end
+
+def _prayer_times_bulk_response():
+    try:
+        start, end = _prayer_times_range()
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Ungültiger Zeitraum: {e}"}), 400
+    if end < start or (end - start).days >= PRAYER_TIMES_MAX_RANGE_DAYS:
+        return jsonify({"error": "Ungültiger Zeitraum"}), 400
+
+    table = prayer_times.current_table()
+    if not table:
+        return jsonify({"error": "Gebetszeiten nicht verfügbar - Datei nicht geladen"}), 503
+
+    def generate():
+        # Kompakt: Feldnamen einmal, danach eine Liste pro Tag
+        yield '{"from":"%s","to":"%s","fields":%s,"days":[' % (
+            start.isoformat(), end.isoformat(), json.dumps(["date", *PRAYER_NAMES], separators=(',', ':')))
+        separator = ''
+        for row in table.iter_rows(start, end):
+            yield separator + json.dumps(row, separators=(',', ':'))
+            separator = ','
+        yield ']}'
+
+    response = Response(generate(), mimetype='application/json')
+    response.set_etag(f"{table.version}-{start.isoformat()}-{end.isoformat()}")
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['PRAYER_TIMES_MAX_AGE']
+    return response.make_conditional(request)
 
 @app.route('/api/prayer-times', methods=['GET'])
 def api_prayer_times():
+    if any(key in request.args for key in ('from', 'to', 'year', 'month')):
+        return _prayer_times_bulk_response()
     date_str = request.args.get('date')
     try:
         if date_str:
@@ -802,8 +1337,12 @@ def api_prayer_times():
         return jsonify({"error": str(e)}), 400
 
 @app.route('/gb.txt')
+@app.route('/static/gb.txt')
 def serve_gb_file():
-    return send_file(os.path.join(app.static_folder, 'gb.txt'))
+    file_path = prayer_times.resolve_path()
+    if file_path is None:
+        abort(404)
+    return send_precompressed(os.path.abspath(file_path), 'text/plain')
 
 @app.route('/bearbeite_eintrag/<int:eintrag_id>', methods=['GET', 'POST'])
 def bearbeite_eintrag(eintrag_id):
@@ -813,15 +1352,15 @@ def bearbeite_eintrag(eintrag_id):
     if request.method == 'POST':
         if request.form.get('aktion') == 'bearbeiten':
             eintrag.name = request.form['name']
-            eintrag.birth_date = request.form['birth_date']
-            eintrag.death_date = request.form['death_date']
+            for feld in ('birth_date', 'death_date'):
+                wert = request.form.get(feld, '').strip()
+                # Reine Jahresangaben passen nicht in <input type="date">: leeres Feld lässt das Jahr stehen
+                if wert or getattr(eintrag, feld):
+                    setattr(eintrag, feld, wert)
             image = request.files.get('image')
             if image and image.filename:
-                filename = secure_filename(image.filename)
-                upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                image.save(upload_path)
-                eintrag.image_filename = filename
+                # Das alte Bild gibt der Verweiszähler frei
+                eintrag.image_filename = upload_storage.save(image)
             db.session.commit()
             return redirect(url_for('admin_ahde_vefa'))
         elif request.form.get('aktion') == 'loeschen':
@@ -839,34 +1378,111 @@ def ahde_vefa_view():
         image = request.files['image']
         filename = None
         if image and image.filename:
-            filename = secure_filename(image.filename)
-            upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            image.save(upload_path)
+            filename = upload_storage.save(image)
         eintrag = ahde_vefa(name=name, birth_date=birth_date, death_date=death_date, image_filename=filename)
         db.session.add(eintrag)
         db.session.commit()
 
-    search_name = request.args.get('search_name')
-    search_death = request.args.get('search_death')
+    search_name = (request.args.get('search_name') or '').strip()
+    query = ahde_vefa_query(request.args)
+    filter_args = {key: request.args[key] for key in AHDE_VEFA_FILTER_ARGS if request.args.get(key)}
+    page = max(request.args.get('page', 1, type=int), 1)
+    next_cursor = None
+    if search_name:
+        # Treffer nach Relevanz: Seiten mit Nummer, eine Zeile mehr zeigt eine weitere Seite an
+        eintraege = query.offset((page - 1) * AHDE_VEFA_SEARCH_PAGE).limit(AHDE_VEFA_SEARCH_PAGE + 1).all()
+        has_next = len(eintraege) > AHDE_VEFA_SEARCH_PAGE
+        eintraege = eintraege[:AHDE_VEFA_SEARCH_PAGE]
+    else:
+        eintraege, next_cursor = keyset_page(query, ahde_vefa.name, ahde_vefa.id, limit=AHDE_VEFA_PAGE_SIZE,
+                                             descending=False, parse=str)
+        has_next = False
+
+    # Die Jahresstatistik lädt der Dialog separat über ahde_vefa_statistik
+    show_form = session.get('admin', False)
+    return render_template('ahde_vefa.html', eintraege=eintraege, show_form=show_form, search_name=search_name,
+                           page=page, has_next=has_next, next_cursor=next_cursor, filter_args=filter_args)
+
+def ahde_vefa_query(args):
+    """ahde_vefa-Abfrage mit den Filtern der öffentlichen Seite (Name, Sterbedatum, Jahr)"""
     query = ahde_vefa.query
+    search_name = (args.get('search_name') or '').strip()
     if search_name:
-        query = query.filter(ahde_vefa.name.contains(search_name))
+        # FTS5: Präfixsuche ohne Akzente, sortiert nach Relevanz (ohne FTS5: LIKE)
+        query = memorial_search.filter(query, ahde_vefa.id, ahde_vefa.name, search_name)
+    # Datumsfilter laufen über die indizierten Date- und Jahres-Spalten
+    search_death, _ = sterbestatistik.parse_flexible_date(args.get('search_death'))
+    death_from, _ = sterbestatistik.parse_flexible_date(args.get('death_from'))
+    death_to, _ = sterbestatistik.parse_flexible_date(args.get('death_to'))
+    death_year = args.get('death_year', type=int)
     if search_death:
         query = query.filter(ahde_vefa.death_date == search_death)
-    eintraege = query.all()
-
-    statistik = defaultdict(float)
-    for eintrag in eintraege:
-        if eintrag.birth_date:
-            try:
-                jahr = int(eintrag.birth_date.split("-")[0])
-                statistik[jahr] += 1
-            except:
-                pass
-
-    show_form = session.get('admin', False)
-    return render_template('ahde_vefa.html', eintraege=eintraege, statistik=dict(statistik), show_form=show_form)
+    if death_from:
+        query = query.filter(ahde_vefa.death_date >= death_from)
+    if death_to:
+        query = query.filter(ahde_vefa.death_date <= death_to)
+    if death_year:
+        query = query.filter(ahde_vefa.death_year == death_year)
+    return query
+
+@app.route('/api/ahde-vefa')
+def api_ahde_vefa():
+    """'Weitere Einträge laden' für die Liste, setzt nach dem übergebenen Cursor fort"""
+    if request.args.get('search_name'):
+        return jsonify({"error": "Suchergebnisse werden seitenweise geladen"}), 400
+    try:
+        eintraege, next_cursor = keyset_page(ahde_vefa_query(request.args), ahde_vefa.name, ahde_vefa.id,
+                                             cursor=request.args.get('cursor'), limit=AHDE_VEFA_PAGE_SIZE,
+                                             descending=False, parse=str)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "html": render_template('_ahde_vefa_eintraege.html', eintraege=eintraege),
+        "slides": render_template('_ahde_vefa_slides.html', eintraege=eintraege, continued=True),
+        "next_cursor": next_cursor,
+    })
+
+@app.route('/ahde-vefa/statistik')
+def ahde_vefa_statistik():
+    """Geburten und Todesfälle je Jahr als JSON.
+
+    Ohne Filter aus der fortgeschriebenen Tabelle ahde_vefa_jahr, mit Filtern
+    per gruppierter Abfrage über die Jahres-Spalten. Die Antwort wird nach dem
+    Versionszähler von ahde_vefa gecacht und trägt ihn als ETag.
+    """
+    filter_args = tuple((key, request.args[key]) for key in AHDE_VEFA_FILTER_ARGS if request.args.get(key))
+    versions = content_versions.get('ahde_vefa')
+    etag = None
+    if versions:
+        digest = hashlib.sha1(json.dumps(filter_args).encode('utf-8')).hexdigest()[:12]
+        etag = f"ahde-vefa-{'-'.join(map(str, versions))}-{digest}"
+    if etag and request.if_none_match.contains(etag):
+        return '', 304, {'ETag': f'"{etag}"'}
+
+    cache_key = ('ahde_vefa_statistik', versions, filter_args)
+    body = page_cache.get(cache_key) if versions else None
+    if body is None:
+        if filter_args:
+            totals = defaultdict(lambda: [0, 0])
+            query = ahde_vefa_query(request.args).order_by(None)
+            for column, index in ((ahde_vefa.birth_year, 0), (ahde_vefa.death_year, 1)):
+                for year, count in query.with_entities(column, func.count()).filter(column.isnot(None)).group_by(column):
+                    totals[year][index] = count
+            rows = sorted((year, births, deaths) for year, (births, deaths) in totals.items())
+        else:
+            rows = db.session.query(AhdeVefaJahr.year, AhdeVefaJahr.geburten, AhdeVefaJahr.tode) \
+                .order_by(AhdeVefaJahr.year).all()
+        body = json.dumps({'jahre': [{'jahr': year, 'geburten': births, 'tode': deaths}
+                                     for year, births, deaths in rows]})
+        if versions:
+            page_cache.set(cache_key, body)
+
+    response = app.response_class(body, mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = 60
+    return response
 
 @app.route('/admin/ahde-vefa')
 def admin_ahde_vefa():
@@ -1152,6 +1768,207 @@ def admin_process_delete(process_id):
     flash('Vorgang erfolgreich gelöscht!', 'success')
     return redirect(url_for('admin_processes', cost_center_id=cost_center_id))
 
+# --- Materialisierte Finanzsummen ---
+
+FINANCE_FIELDS = ('amount', 'type', 'category', 'date', 'cost_center_id', 'process_id')
+
+def _finance_summary_keys(values):
+    """Alle (scope, key)-Zeilen, zu denen eine Transaktion beiträgt"""
+    keys = [('total', ''), ('category', values['category'] or '')]
+    if values['date']:
+        keys.append(('month', values['date'].strftime('%Y-%m')))
+    if values['cost_center_id']:
+        keys.append(('cost_center', str(values['cost_center_id'])))
+    if values['process_id']:
+        keys.append(('process', str(values['process_id'])))
+    return keys
+
+def _finance_amounts(values):
+    amount = float(values['amount'] or 0)
+    return (amount if values['type'] == 'Einnahme' else 0.0,
+            amount if values['type'] == 'Ausgabe' else 0.0)
+
+def _add_finance_delta(deltas, values, sign):
+    income, expense = _finance_amounts(values)
+    for key in _finance_summary_keys(values):
+        delta = deltas[key]
+        delta[0] += sign * income
+        delta[1] += sign * expense
+        delta[2] += sign
+
+@event.listens_for(db.session, 'before_flush')
+def _track_finance_changes(session, flush_context, instances):
+    """Ermittelt die Änderungen an den Summen aus neuen, geänderten und gelöschten Transaktionen"""
+    if any(isinstance(obj, (CostCenter, Process)) for obj in session.deleted):
+        # Gelöschte Kostenstellen/Vorgänge ändern Fremdschlüssel implizit
+        session.info['finance_summary_rebuild'] = True
+
+    new = [obj for obj in session.new if isinstance(obj, Transaction)]
+    dirty = [obj for obj in session.dirty if isinstance(obj, Transaction) and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Transaction)]
+    if not (new or dirty or deleted):
+        return
+
+    deltas = session.info.setdefault('finance_deltas', defaultdict(lambda: [0.0, 0.0, 0]))
+    # Alte Werte direkt aus der Datenbank, dort steht vor dem Flush noch der alte Stand
+    old_ids = [obj.id for obj in dirty + deleted if obj.id is not None]
+    if old_ids:
+        columns = [getattr(Transaction, field) for field in FINANCE_FIELDS]
+        with session.no_autoflush:
+            for row in session.query(*columns).filter(Transaction.id.in_(old_ids)):
+                _add_finance_delta(deltas, dict(zip(FINANCE_FIELDS, row)), -1)
+    for obj in new + dirty:
+        _add_finance_delta(deltas, {field: getattr(obj, field) for field in FINANCE_FIELDS}, 1)
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_finance_changes(session, flush_context):
+    deltas = session.info.pop('finance_deltas', None)
+    connection = session.connection()
+    if session.info.pop('finance_summary_rebuild', False):
+        _write_finance_summary(connection, compute_finance_summary())
+        return
+    if not deltas:
+        return
+    table = FinanceSummary.__table__
+    for (scope, key), (income, expense, count) in deltas.items():
+        if not (income or expense or count):
+            continue
+        stmt = upsert_insert(table).values(
+            scope=scope, key=key, income=income, expense=expense, balance=income - expense, count=count)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.key],
+            set_={
+                'income': table.c.income + stmt.excluded.income,
+                'expense': table.c.expense + stmt.excluded.expense,
+                'balance': table.c.balance + stmt.excluded.balance,
+                'count': table.c.count + stmt.excluded.count,
+            },
+        ))
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_finance_changes(session):
+    session.info.pop('finance_deltas', None)
+    session.info.pop('finance_summary_rebuild', None)
+
+def compute_finance_summary():
+    """Berechnet alle Summen neu aus den Transaktionen (eine gruppierte Abfrage)"""
+    income_sum = func.coalesce(func.sum(case((Transaction.type == 'Einnahme', Transaction.amount), else_=0)), 0)
+    expense_sum = func.coalesce(func.sum(case((Transaction.type == 'Ausgabe', Transaction.amount), else_=0)), 0)
+    # extract() statt strftime, damit die Abfrage auch unter PostgreSQL läuft
+    year, month = extract('year', Transaction.date), extract('month', Transaction.date)
+    group = (Transaction.cost_center_id, Transaction.process_id, Transaction.category, year, month)
+
+    totals = defaultdict(lambda: [0.0, 0.0, 0])
+    for cost_center_id, process_id, category, year_value, month_value, income, expense, count in db.session.query(
+        *group, income_sum, expense_sum, func.count(Transaction.id)
+    ).group_by(*group):
+        values = {'cost_center_id': cost_center_id, 'process_id': process_id, 'category': category, 'date': None}
+        keys = _finance_summary_keys(values)
+        if year_value is not None:
+            keys.append(('month', f"{int(year_value):04d}-{int(month_value):02d}"))
+        for key in keys:
+            total = totals[key]
+            total[0] += float(income)
+            total[1] += float(expense)
+            total[2] += count
+    return totals
+
+def _write_finance_summary(connection, totals):
+    table = FinanceSummary.__table__
+    connection.execute(table.delete())
+    rows = [
+        {'scope': scope, 'key': key, 'income': income, 'expense': expense,
+         'balance': income - expense, 'count': count}
+        for (scope, key), (income, expense, count) in totals.items()
+    ]
+    if rows:
+        connection.execute(table.insert(), rows)
+
+def rebuild_finance_summary():
+    _write_finance_summary(db.session.connection(), compute_finance_summary())
+    db.session.commit()
+
+def verify_finance_summary(tolerance=0.005):
+    """Vergleicht die gespeicherten mit frisch berechneten Summen, liefert die Abweichungen"""
+    expected = compute_finance_summary()
+    stored = {(row.scope, row.key): (row.income, row.expense, row.count) for row in FinanceSummary.query}
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        want = expected.get(key, (0.0, 0.0, 0))
+        have = stored.get(key, (0.0, 0.0, 0))
+        if abs(want[0] - have[0]) > tolerance or abs(want[1] - have[1]) > tolerance or want[2] != have[2]:
+            drift.append((key, tuple(have), tuple(want)))
+    return drift
+
+@app.cli.command('finance-summary')
+@click.option('--verify', is_flag=True, help='Nur prüfen und Abweichungen ausgeben, nichts ändern.')
+def finance_summary_command(verify):
+    """Prüft oder erneuert die materialisierten Finanzsummen."""
+    drift = verify_finance_summary()
+    for (scope, key), have, want in drift:
+        click.echo(f"{scope}:{key or '-'} gespeichert={have} erwartet={want}")
+    if verify:
+        click.echo(f"{len(drift)} Abweichung(en) gefunden.")
+        raise SystemExit(1 if drift else 0)
+    rebuild_finance_summary()
+    click.echo(f"Finanzsummen neu aufgebaut ({len(drift)} Abweichung(en) korrigiert).")
+
+def reconcile_finance_summary():
+    """Baut die Summen neu auf, wenn sie von den Buchungen abweichen; liefert die Abweichungen.
+
+    Vollständige Neuberechnung, daher nicht beim Start, sondern über
+    ``flask finance-summary`` bzw. nach finance_summary_outdated().
+    """
+    drift = verify_finance_summary()
+    if drift:
+        app.logger.info(f"Finanzsummen weichen in {len(drift)} Zeile(n) ab, werden neu aufgebaut")
+        rebuild_finance_summary()
+    return drift
+
+def finance_summary_outdated():
+    """Günstige Prüfung beim Start: passt die Anzahl der Buchungen zur Gesamtzeile?
+
+    Erkennt Buchungen aus der Zeit vor der Summentabelle und per SQL
+    eingefügte oder gelöschte; geänderte Beträge findet nur verify_finance_summary().
+    """
+    total = db.session.get(FinanceSummary, ('total', ''))
+    return (total.count if total else 0) != db.session.query(func.count(Transaction.id)).scalar()
+
+with app.app_context():
+    # Läuft in jedem Worker und jedem CLI-Aufruf: nur zählen, neu aufbauen per CLI
+    if finance_summary_outdated():
+        app.logger.warning("Finanzsummen passen nicht zu den Buchungen, bitte 'flask finance-summary' ausführen")
+
+def finance_summary():
+    """Alle Summen des Finanz-Dashboards aus der materialisierten Summentabelle.
+
+    Liefert Dicts mit (Einnahmen, Ausgaben) pro Kostenstelle, Vorgang und
+    Monat, die Ausgaben pro Kategorie, die Gesamtsummen und alle Kategorien.
+    """
+    rows = FinanceSummary.query.all()
+
+    summary = {'cost_centers': {}, 'processes': {}, 'months': {}, 'expense_categories': {},
+               'total': (0.0, 0.0), 'categories': []}
+    for row in rows:
+        if row.count <= 0:
+            continue
+        amounts = (row.income, row.expense)
+        if row.scope == 'total':
+            summary['total'] = amounts
+        elif row.scope == 'cost_center':
+            summary['cost_centers'][int(row.key)] = amounts
+        elif row.scope == 'process':
+            summary['processes'][int(row.key)] = amounts
+        elif row.scope == 'month':
+            summary['months'][row.key] = amounts
+        elif row.scope == 'category':
+            if row.expense:
+                summary['expense_categories'][row.key or None] = row.expense
+            if row.key:
+                summary['categories'].append(row.key)
+    summary['categories'].sort()
+    return summary
+
 @app.route('/admin/finanzen', methods=['GET', 'POST'])
 def admin_finanzen():
     if not session.get('admin'):
@@ -1163,7 +1980,7 @@ def admin_finanzen():
 
     # Load ALL cost centers and ALL processes for general use and forms
     # 'cost_centers' will be used by the "Neue Transaktion" form
-    cost_centers = CostCenter.query.order_by(CostCenter.name).all()
+    cost_centers = CostCenter.query.options(db.selectinload(CostCenter.processes)).order_by(CostCenter.name).all()
     # 'all_processes' is the comprehensive list of all processes
     all_processes = Process.query.order_by(Process.name).all()
 
@@ -1222,14 +2039,11 @@ def admin_finanzen():
                     errors.append('Ungültige Vorgangs-ID.')
                     process_id = None
 
-            document_filename = None
-            if document and document.filename:
-                document_filename = secure_filename(document.filename)
-                document_path = os.path.join(app.config['UPLOAD_FOLDER'], document_filename)
-                document.save(document_path)
-
             if not errors:
                 try:
+                    document_filename = None
+                    if document and document.filename:
+                        document_filename = upload_storage.save(document)
                     date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
                     transaction = Transaction(
                         description=description,
@@ -1254,7 +2068,8 @@ def admin_finanzen():
         elif aktion == 'loeschen_transaktion':
             transaction_id = request.form.get('transaction_id')
             transaction_to_delete = Transaction.query.get_or_404(transaction_id)
-            if transaction_to_delete.document_filename:
+            # Belege aus der Upload-Ablage gibt der Verweiszähler frei, alte Dateinamen werden direkt gelöscht
+            if transaction_to_delete.document_filename and not is_blob(transaction_to_delete.document_filename):
                 try:
                     # Ensure the UPLOAD_FOLDER exists and path is correct
                     file_path = os.path.join(app.config['UPLOAD_FOLDER'], transaction_to_delete.document_filename)
@@ -1322,52 +2137,37 @@ def admin_finanzen():
         # If no cost center filter, show all processes in the filter dropdown
         processes_for_current_cc = all_processes # This ensures the filter dropdown for processes is populated
 
-    transactions = transactions_query.order_by(Transaction.date.desc()).all()
+    transactions = transactions_query.options(
+        db.joinedload(Transaction.cost_center),
+        db.joinedload(Transaction.process)
+    ).order_by(Transaction.date.desc()).all()
+
+    summary = finance_summary()
 
     # Cost center and process summaries
-    # This logic assumes you want to calculate sums for each CC and Process
     for cc in cost_centers:
-        cc_transactions = Transaction.query.filter_by(cost_center_id=cc.id).all()
-        cc.total_income = sum(t.amount for t in cc_transactions if t.type == 'Einnahme' and t.amount is not None)
-        cc.total_expense = sum(t.amount for t in cc_transactions if t.type == 'Ausgabe' and t.amount is not None)
+        cc.total_income, cc.total_expense = summary['cost_centers'].get(cc.id, (0, 0))
         cc.total_balance = cc.total_income - cc.total_expense
-
-        # Ensure processes within cost centers are also calculated
-        cc.processes = Process.query.filter_by(cost_center_id=cc.id).all()
         for p in cc.processes:
-            p_transactions = Transaction.query.filter_by(process_id=p.id).all()
-            p.total_income = sum(t.amount for t in p_transactions if t.type == 'Einnahme' and t.amount is not None)
-            p.total_expense = sum(t.amount for t in p_transactions if t.type == 'Ausgabe' and t.amount is not None)
+            p.total_income, p.total_expense = summary['processes'].get(p.id, (0, 0))
             p.total_balance = p.total_income - p.total_expense
 
     # Chart data: Monthly summary
-    monthly_summary = defaultdict(lambda: {'income': 0, 'expense': 0})
-    for transaction in Transaction.query.all():
-        month_year = transaction.date.strftime('%Y-%m')
-        if transaction.type == 'Einnahme' and transaction.amount is not None:
-            monthly_summary[month_year]['income'] += float(transaction.amount)
-        elif transaction.type == 'Ausgabe' and transaction.amount is not None:
-            monthly_summary[month_year]['expense'] += float(transaction.amount)
-
-    sorted_monthly_summary = sorted(monthly_summary.items())
+    sorted_monthly_summary = [
+        (month, {'income': income, 'expense': expense})
+        for month, (income, expense) in sorted(summary['months'].items())
+    ]
 
     # Pie chart by category
-    category_data = db.session.query(
-        Transaction.category,
-        func.sum(Transaction.amount)
-    ).filter(Transaction.type == 'Ausgabe').group_by(Transaction.category).all()
-
-    category_labels = [row[0] or 'Ohne Kategorie' for row in category_data]
-    category_data_values = [float(row[1]) for row in category_data]
+    category_labels = [category or 'Ohne Kategorie' for category in summary['expense_categories']]
+    category_data_values = list(summary['expense_categories'].values())
 
     # Totals
-    total_income = db.session.query(func.sum(Transaction.amount)).filter_by(type='Einnahme').scalar() or 0
-    total_expense = db.session.query(func.sum(Transaction.amount)).filter_by(type='Ausgabe').scalar() or 0
+    total_income, total_expense = summary['total']
     total_balance = total_income - total_expense
 
     # Categories for the Datalist
-    categories = db.session.query(Transaction.category).distinct().filter(Transaction.category != None).all()
-    categories = [category[0] for category in categories]
+    categories = summary['categories']
 
     return render_template('admin_finanzen.html',
                             cost_centers=cost_centers, # For 'Neue Transaktion' form and filter
@@ -1403,9 +2203,18 @@ def download_document(id):
     if not transaction.document_filename:
         flash('Kein Beleg für diese Transaktion vorhanden.', 'danger')
         return redirect(url_for('admin_finanzen'))
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], transaction.document_filename)
+    file_path = upload_storage.full_path(transaction.document_filename)
     if os.path.exists(file_path):
-        return send_file(file_path, as_attachment=True)
+        # Dateien der Upload-Ablage heißen nach ihrem Hash, für den Download einen lesbaren Namen vergeben
+        download_name = os.path.basename(file_path)
+        if is_blob(transaction.document_filename):
+            download_name = f"Beleg_{transaction.id}{os.path.splitext(file_path)[1]}"
+        response = send_file(os.path.abspath(file_path), as_attachment=request.args.get('inline') is None,
+                             download_name=download_name, conditional=True)
+        # Belege nur für Admins: nicht in gemeinsamen Caches ablegen
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
     flash('Belegdatei nicht gefunden.', 'danger')
     return redirect(url_for('admin_finanzen'))
 
@@ -1509,9 +2318,7 @@ def admin_finanzen_edit(transaction_id):
                 if 'document' in request.files:
                     file = request.files['document']
                     if file and file.filename:
-                        filename = secure_filename(file.filename)
-                        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                        transaction.document_filename = filename
+                        transaction.document_filename = upload_storage.save(file)
                 
                 db.session.commit()
                 flash('Transaktion erfolgreich aktualisiert', 'success')
@@ -1540,26 +2347,76 @@ def admin_finanzen_loeschen(transaction_id):
     flash('Transaktion erfolgreich gelöscht!', 'success')
     return redirect(url_for('admin_finanzen'))
 
+from exports import export_response, stream_csv, stream_xlsx, EXPORT_FORMATS
+
+EXPORT_YIELD_PER = 1000
+TRANSACTION_EXPORT_HEADER = ('ID', 'Beschreibung', 'Betrag', 'Typ', 'Kategorie', 'Datum', 'Kostenstelle', 'Vorgang')
+
+def transaction_export_rows(query):
+    """Exportzeilen aus einer Spaltenabfrage, in Blöcken von EXPORT_YIELD_PER Zeilen gelesen"""
+    for t in query.execution_options(yield_per=EXPORT_YIELD_PER):
+        yield (
+            t.id,
+            t.description,
+            float(t.amount) if t.amount is not None else 0.0,
+            t.type,
+            t.category or 'Keine',
+            t.date.strftime('%d.%m.%Y') if t.date else 'N/A',
+            t.cost_center_name or "Nicht zugewiesen",
+            t.process_name or "Nicht zugewiesen",
+        )
+
+def _export_date_range():
+    """Optionaler Zeitraum aus ?from=JJJJ-MM-TT&to=JJJJ-MM-TT, wirft ValueError bei ungültigen Angaben"""
+    start = request.args.get('from') or None
+    end = request.args.get('to') or None
+    start = datetime.date.fromisoformat(start) if start else None
+    end = datetime.date.fromisoformat(end) if end else None
+    if start and end and end < start:
+        raise ValueError("Ende vor Beginn")
+    return start, end
+
+def _filter_export_dates(query, start, end):
+    if start:
+        query = query.filter(Transaction.date >= start)
+    if end:
+        query = query.filter(Transaction.date <= end)
+    return query
+
+def transaction_export_query():
+    """Buchungen mit Kostenstellen- und Vorgangsnamen in einer Abfrage, ohne ORM-Objekte"""
+    return db.session.query(
+        Transaction.id, Transaction.description, Transaction.amount, Transaction.type,
+        Transaction.category, Transaction.date,
+        CostCenter.name.label('cost_center_name'), Process.name.label('process_name'),
+    ).outerjoin(CostCenter, Transaction.cost_center_id == CostCenter.id
+    ).outerjoin(Process, Transaction.process_id == Process.id)
+
 @app.route('/admin/finanzen/export/<int:cost_center_id>', methods=['GET'])
 def admin_finanzen_export(cost_center_id):
     if not session.get('admin'):
         return redirect(url_for('blog_admin_login'))
     cost_center = CostCenter.query.get_or_404(cost_center_id)
-    transactions = Transaction.query.filter_by(cost_center_id=cost_center_id).all()
-    df = pd.DataFrame([{
-        'ID': t.id,
-        'Beschreibung': t.description,
-        'Betrag': t.amount,
-        'Typ': t.type,
-        'Kategorie': t.category or 'Keine',
-        'Datum': t.date.strftime('%d.%m.%Y'),
-        'Vorgang': Process.query.get(t.process_id).name if t.process_id else 'Keiner'
-    } for t in transactions])
-    
-    buf = BytesIO()
-    df.to_excel(buf, index=False, sheet_name='Finanzbericht')
-    buf.seek(0)
-    return send_file(buf, as_attachment=True, download_name=f"Finanzbericht_{cost_center.name}.xlsx", mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    export_format = request.args.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+    try:
+        start, end = _export_date_range()
+    except ValueError:
+        abort(400)
+
+    return export_response(COST_CENTER_EXPORT_HEADER, cost_center_export_rows(cost_center_id, start, end),
+                           f"Finanzbericht_{cost_center.name}", export_format, sheet_name='Finanzbericht')
+
+COST_CENTER_EXPORT_HEADER = ('ID', 'Beschreibung', 'Betrag', 'Typ', 'Kategorie', 'Datum', 'Vorgang')
+
+def cost_center_export_rows(cost_center_id, start=None, end=None):
+    """Zeilen wie transaction_export_rows, ohne die Spalte Kostenstelle (steht im Dateinamen)"""
+    query = transaction_export_query().filter(Transaction.cost_center_id == cost_center_id)
+    query = _filter_export_dates(query, start, end).order_by(Transaction.date, Transaction.id)
+    for row in transaction_export_rows(query):
+        yield row[:6] + row[7:]
 
 @app.route('/admin/transactions/<int:transaction_id>', methods=['GET'])
 def get_transaction_details(transaction_id):
@@ -1584,37 +2441,54 @@ def admin_finanzen_export_all():
     if not session.get('admin'):
         return redirect(url_for('blog_admin_login'))
 
-    transactions = Transaction.query.options(
-        db.joinedload(Transaction.cost_center),
-        db.joinedload(Transaction.process)
-    ).order_by(Transaction.date.desc()).all()
+    export_format = request.args.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
 
-    data = []
-    for t in transactions:
-        cost_center_name = t.cost_center.name if t.cost_center else "Nicht zugewiesen"
-        process_name = t.process.name if t.process else "Nicht zugewiesen"
-
-        data.append({
-            'ID': t.id,
-            'Beschreibung': t.description,
-            'Betrag': float(t.amount) if t.amount is not None else 0.0,
-            'Typ': t.type,
-            'Kategorie': t.category or 'Keine',
-            'Datum': t.date.strftime('%d.%m.%Y') if t.date else 'N/A',
-            'Kostenstelle': cost_center_name,
-            'Vorgang': process_name
-        })
+    try:
+        start, end = _export_date_range()
+    except ValueError:
+        abort(400)
 
-    df = pd.DataFrame(data)
+    query = _filter_export_dates(transaction_export_query(), start, end)
+    query = query.order_by(Transaction.date.desc(), Transaction.id.desc())
+    return export_response(TRANSACTION_EXPORT_HEADER, transaction_export_rows(query),
+                           f"Alle_Buchungen_{datetime.date.today().strftime('%Y%m%d')}",
+                           export_format, sheet_name='Alle Buchungen')
 
-    buf = BytesIO()
-    df.to_excel(buf, index=False, sheet_name='Alle Buchungen')
-    buf.seek(0)
+# Exporte auch als Hintergrund-Job (POST /berichte/<name>), Datei wird im Kindprozess geschrieben
+
+def _export_format(value):
+    if value not in EXPORT_FORMATS:
+        raise ValueError(f"Unbekanntes Format: {value}")
+    return value
+
+def _iso_date(value):
+    return datetime.date.fromisoformat(value).isoformat()
+
+def _optional_date(value):
+    return datetime.date.fromisoformat(value) if value else None
 
-    return send_file(buf, 
-                   as_attachment=True, 
-                   download_name=f"Alle_Buchungen_{datetime.date.today().strftime('%Y%m%d')}.xlsx", 
-                   mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+EXPORT_JOB_PARAMS = {'export_format': _export_format, 'start': _iso_date, 'end': _iso_date}
+
+@report_jobs.task('buchungen_export', params=EXPORT_JOB_PARAMS, defaults={'export_format': 'xlsx'},
+                  timeout=600, extension='{export_format}', download_name='Alle_Buchungen', admin=True)
+def buchungen_export_job(export_format='xlsx', start=None, end=None):
+    query = _filter_export_dates(transaction_export_query(), _optional_date(start), _optional_date(end))
+    query = query.order_by(Transaction.date.desc(), Transaction.id.desc())
+    rows = transaction_export_rows(query)
+    if export_format == 'csv':
+        return stream_csv(TRANSACTION_EXPORT_HEADER, rows)
+    return stream_xlsx(TRANSACTION_EXPORT_HEADER, rows, 'Alle Buchungen')
+
+@report_jobs.task('kostenstelle_export', params={'cost_center_id': int, **EXPORT_JOB_PARAMS},
+                  defaults={'export_format': 'xlsx'}, timeout=600, extension='{export_format}',
+                  download_name='Finanzbericht_{cost_center_id}', admin=True)
+def kostenstelle_export_job(cost_center_id, export_format='xlsx', start=None, end=None):
+    rows = cost_center_export_rows(cost_center_id, _optional_date(start), _optional_date(end))
+    if export_format == 'csv':
+        return stream_csv(COST_CENTER_EXPORT_HEADER, rows)
+    return stream_xlsx(COST_CENTER_EXPORT_HEADER, rows, 'Finanzbericht')
 
 
 
@@ -1983,39 +2857,118 @@ def unterricht_einheit(unterricht_id):
     )
 
 
+def anwesenheit_speichern(zeilen):
+    """Schreibt Anwesenheiten gesammelt per Upsert.
+
+    zeilen: [{'schueler_id', 'unterrichtseinheit_id', 'anwesend', 'entschuldigt'}].
+    Die vorhandenen Einträge aller betroffenen Unterrichtseinheiten kommen mit
+    einer Abfrage; geschrieben werden nur neue oder geänderte Zeilen, in einem
+    INSERT … ON CONFLICT über (schueler_id, unterrichtseinheit_id).
+    Liefert die Anzahl geschriebener Zeilen.
+    """
+    einheit_ids = {zeile['unterrichtseinheit_id'] for zeile in zeilen}
+    vorhanden = {
+        (schueler_id, einheit_id): (bool(anwesend), bool(entschuldigt))
+        for schueler_id, einheit_id, anwesend, entschuldigt in db.session.query(
+            Anwesenheit.schueler_id, Anwesenheit.unterrichtseinheit_id,
+            Anwesenheit.anwesend, Anwesenheit.entschuldigt,
+        ).filter(Anwesenheit.unterrichtseinheit_id.in_(einheit_ids))
+    }
+    geaendert = [
+        zeile for zeile in zeilen
+        if vorhanden.get((zeile['schueler_id'], zeile['unterrichtseinheit_id'])) != (zeile['anwesend'], zeile['entschuldigt'])
+    ]
+    if geaendert:
+        table = Anwesenheit.__table__
+        stmt = upsert_insert(table)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.schueler_id, table.c.unterrichtseinheit_id],
+            set_={'anwesend': stmt.excluded.anwesend, 'entschuldigt': stmt.excluded.entschuldigt},
+        ), geaendert)
+    db.session.commit()
+    if geaendert:
+        # Der Upsert läuft an den Flush-Events vorbei
+        content_versions.bump('anwesenheit')
+    return len(geaendert)
+
+
 @app.route("/anwesenheit_verwalten/<int:unterricht_id>", methods=["POST"])
 def anwesenheit_verwalten(unterricht_id):
     unterrichtseinheit = Unterrichtseinheit.query.get_or_404(unterricht_id)
-    klasse_id = unterrichtseinheit.klasse_id
+    schueler_ids = [
+        schueler_id for schueler_id, in
+        db.session.query(Schueler.id).filter_by(klasse_id=unterrichtseinheit.klasse_id)
+    ]
+    anwesenheit_speichern([
+        {
+            "schueler_id": schueler_id,
+            "unterrichtseinheit_id": unterricht_id,
+            "anwesend": f"anwesend_{schueler_id}" in request.form,
+            "entschuldigt": f"entschuldigt_{schueler_id}" in request.form,
+        }
+        for schueler_id in schueler_ids
+    ])
+    flash("Anwesenheit erfolgreich gespeichert.", "success")
+    return redirect(url_for("unterricht_einheit", unterricht_id=unterricht_id))
 
-    schueler_der_klasse = Schueler.query.filter_by(klasse_id=klasse_id).all()
 
-    for schueler in schueler_der_klasse:
-        anwesend_key = f"anwesend_{schueler.id}"
-        entschuldigt_key = f"entschuldigt_{schueler.id}"
+@app.route("/anwesenheit_verwalten", methods=["POST"])
+def anwesenheit_verwalten_stapel():
+    """Anwesenheit für viele Unterrichtseinheiten auf einmal (JSON).
 
-        anwesend = anwesend_key in request.form
-        entschuldigt = entschuldigt_key in request.form
+    {"eintraege": [{"unterrichtseinheit_id": 1, "schueler_id": 2, "anwesend": true, "entschuldigt": false}, ...]}
+    Schüler müssen zur Klasse der jeweiligen Unterrichtseinheit gehören,
+    anwesend/entschuldigt müssen JSON-Booleans sein; bei einem Fehler wird
+    nichts gespeichert.
 
-        anwesenheit_eintrag = Anwesenheit.query.filter_by(
-            schueler_id=schueler.id, unterrichtseinheit_id=unterricht_id
-        ).first()
+    Zugriff wie beim Klassenbuch (anwesenheit_verwalten, unterricht_*): ohne
+    Anmeldung, die Klassenbuch-Ansichten kennen keine Rollen. Anders als das
+    Formular nimmt der Endpunkt nur application/json an, fremde Seiten können
+    ihn daher nicht per Formular auslösen.
+    """
+    data = request.get_json(silent=True) or {}
+    eintraege = data.get("eintraege")
+    if not isinstance(eintraege, list) or not eintraege:
+        return jsonify({"error": "'eintraege' muss eine nicht leere Liste sein"}), 400
 
-        if anwesenheit_eintrag:
-            anwesenheit_eintrag.anwesend = anwesend
-            anwesenheit_eintrag.entschuldigt = entschuldigt
-        else:
-            neuer_eintrag = Anwesenheit(
-                schueler_id=schueler.id,
-                unterrichtseinheit_id=unterricht_id,
-                anwesend=anwesend,
-                entschuldigt=entschuldigt,
-            )
-            db.session.add(neuer_eintrag)
+    zeilen = []
+    for nummer, eintrag in enumerate(eintraege):
+        try:
+            zeile = {
+                "schueler_id": int(eintrag["schueler_id"]),
+                "unterrichtseinheit_id": int(eintrag["unterrichtseinheit_id"]),
+                "anwesend": eintrag.get("anwesend", False),
+                "entschuldigt": eintrag.get("entschuldigt", False),
+            }
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return jsonify({"error": f"Eintrag {nummer}: schueler_id und unterrichtseinheit_id erforderlich"}), 400
+        # bool("false") wäre True, daher nur echte JSON-Booleans
+        for feld in ("anwesend", "entschuldigt"):
+            if not isinstance(zeile[feld], bool):
+                return jsonify({"error": f"Eintrag {nummer}: {feld} muss true oder false sein"}), 400
+        zeilen.append(zeile)
+
+    # Klassen der Unterrichtseinheiten und Schüler mit je einer Abfrage prüfen
+    einheit_klassen = dict(
+        db.session.query(Unterrichtseinheit.id, Unterrichtseinheit.klasse_id)
+        .filter(Unterrichtseinheit.id.in_({zeile["unterrichtseinheit_id"] for zeile in zeilen}))
+    )
+    schueler_klassen = dict(
+        db.session.query(Schueler.id, Schueler.klasse_id)
+        .filter(Schueler.id.in_({zeile["schueler_id"] for zeile in zeilen}))
+    )
+    eindeutig = {}
+    for nummer, zeile in enumerate(zeilen):
+        klasse_id = einheit_klassen.get(zeile["unterrichtseinheit_id"])
+        if klasse_id is None:
+            return jsonify({"error": f"Eintrag {nummer}: Unterrichtseinheit {zeile['unterrichtseinheit_id']} nicht gefunden"}), 404
+        if schueler_klassen.get(zeile["schueler_id"]) != klasse_id:
+            return jsonify({"error": f"Eintrag {nummer}: Schüler {zeile['schueler_id']} gehört nicht zur Klasse der Unterrichtseinheit"}), 400
+        # Doppelte Angaben: die letzte gilt
+        eindeutig[(zeile["schueler_id"], zeile["unterrichtseinheit_id"])] = zeile
 
-    db.session.commit()
-    flash("Anwesenheit erfolgreich gespeichert.", "success")
-    return redirect(url_for("unterricht_einheit", unterricht_id=unterricht_id))
+    gespeichert = anwesenheit_speichern(list(eindeutig.values()))
+    return jsonify({"eintraege": len(eindeutig), "gespeichert": gespeichert})
 
 
 @app.route("/unterricht_bearbeiten/<int:unterricht_id>", methods=["GET", "POST"])
@@ -2116,29 +3069,38 @@ def klassenbuch_pdf(klasse_id):
     return redirect(url_for("klassenbuch_details", klasse_id=klasse_id))
 
 
-@app.route("/statistik/<int:klasse_id>")
-def statistik2(klasse_id):
+def _anwesenheits_counts(klasse_id):
+    """Anwesend/entschuldigt/unentschuldigt pro Schüler der Klasse"""
+    anwesenheits_counts = defaultdict(lambda: {"anwesend": 0, "entschuldigt": 0, "unentschuldigt": 0})
+    anwesenheiten = Anwesenheit.query.join(Schueler, Anwesenheit.schueler_id == Schueler.id).filter(
+        Schueler.klasse_id == klasse_id)
+    for anw in anwesenheiten:
+        if anw.anwesend:
+            anwesenheits_counts[anw.schueler_id]["anwesend"] += 1
+        elif anw.entschuldigt:
+            anwesenheits_counts[anw.schueler_id]["entschuldigt"] += 1
+        else:
+            anwesenheits_counts[anw.schueler_id]["unentschuldigt"] += 1
+    return anwesenheits_counts
+
+def anwesenheitsdiagramm_dataset(klasse_id):
+    """Eingaben des Diagramms für den Cache-Schlüssel: Klassenname, Schüler und ihre Anwesenheitszahlen"""
+    klasse = db.session.query(Klasse.name).filter(Klasse.id == klasse_id).all()
+    schueler = db.session.query(Schueler.id, Schueler.name, Schueler.nachname) \
+        .filter(Schueler.klasse_id == klasse_id).order_by(Schueler.id).all()
+    group = (Anwesenheit.schueler_id, Anwesenheit.anwesend, Anwesenheit.entschuldigt)
+    counts = db.session.query(*group, func.count()).join(Schueler, Anwesenheit.schueler_id == Schueler.id) \
+        .filter(Schueler.klasse_id == klasse_id).group_by(*group).order_by(*group).all()
+    return [*klasse, *schueler, *counts]
+
+@report_jobs.task('anwesenheitsdiagramm', params={'klasse_id': int}, timeout=60,
+                  extension='png', download_name='Anwesenheit_{klasse_id}', dataset=anwesenheitsdiagramm_dataset)
+def anwesenheitsdiagramm(klasse_id):
+    """Gestapeltes Balkendiagramm der Anwesenheit pro Schüler als PNG"""
+    plt = reporting.load().plt
     klasse = Klasse.query.get_or_404(klasse_id)
     schueler = Schueler.query.filter_by(klasse_id=klasse_id).all()
-
-    if not schueler:
-        flash("Keine Schüler in dieser Klasse für die Statistik.", "warning")
-        return redirect(url_for("klassenbuch_details", klasse_id=klasse_id))
-
-    # Gesamtanzahl der Unterrichtseinheiten für diese Klasse
-    total_unterrichtseinheiten = Unterrichtseinheit.query.filter_by(klasse_id=klasse_id).count()
-
-    anwesenheits_counts = defaultdict(lambda: {"anwesend": 0, "entschuldigt": 0, "unentschuldigt": 0})
-    for s in schueler:
-        # Anwesenheiten pro Schüler
-        anwesenheiten_pro_schueler = Anwesenheit.query.filter_by(schueler_id=s.id).all()
-        for anw in anwesenheiten_pro_schueler:
-            if anw.anwesend:
-                anwesenheits_counts[s.id]["anwesend"] += 1
-            elif anw.entschuldigt:
-                anwesenheits_counts[s.id]["entschuldigt"] += 1
-            else:
-                anwesenheits_counts[s.id]["unentschuldigt"] += 1
+    anwesenheits_counts = _anwesenheits_counts(klasse_id)
 
     # Diagramm für Anwesenheitsstatistik pro Schüler
     labels = [f"{s.name} {s.nachname}" for s in schueler]
@@ -2182,7 +3144,23 @@ def statistik2(klasse_id):
     plt.tight_layout()
     plt.savefig(buf, format="png")
     plt.close(fig)
-    chart_image = "data:image/png;base64," + (base64.b64encode(buf.getvalue())).decode("utf-8")
+    return buf.getvalue()
+
+@app.route("/statistik/<int:klasse_id>")
+def statistik2(klasse_id):
+    klasse = Klasse.query.get_or_404(klasse_id)
+    schueler = Schueler.query.filter_by(klasse_id=klasse_id).all()
+
+    if not schueler:
+        flash("Keine Schüler in dieser Klasse für die Statistik.", "warning")
+        return redirect(url_for("klassenbuch_details", klasse_id=klasse_id))
+
+    # Gesamtanzahl der Unterrichtseinheiten für diese Klasse
+    total_unterrichtseinheiten = Unterrichtseinheit.query.filter_by(klasse_id=klasse_id).count()
+    anwesenheits_counts = _anwesenheits_counts(klasse_id)
+
+    # Das Diagramm wird im Hintergrund erzeugt und von der Seite nachgeladen
+    chart_job = report_jobs.submit('anwesenheitsdiagramm', klasse_id=klasse_id)
 
     return render_template(
         "statistik.html",
@@ -2190,7 +3168,7 @@ def statistik2(klasse_id):
         schueler=schueler,
         anwesenheits_counts=anwesenheits_counts,
         total_unterrichtseinheiten=total_unterrichtseinheiten,
-        chart_image=chart_image,
+        chart_job=chart_job['id'],
     )
 
 
@@ -0,0 +1,135 @@
+"""
+Inhaltsadressierter Datei-Cache für erzeugte Berichte (PDFs, Diagramme)
+
+Der Schlüssel ist ein Hash über die Eingabedaten und die Parameter eines
+Berichts. Solange sich die Daten nicht ändern, wird die fertige Datei
+wiederverwendet statt neu gerendert. Der Cache ist in der Größe begrenzt und
+verdrängt die am längsten nicht genutzten Dateien (mtime dient als
+Zeitpunkt der letzten Nutzung, damit alle Worker-Prozesse dieselbe Sicht haben).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ArtifactCache:
+    def __init__(self, app=None):
+        self.root = None
+        self.max_bytes = 200 * 1024 * 1024
+        self.logger = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ARTIFACT_CACHE_DIR', os.path.join(app.instance_path, 'artifacts'))
+        app.config.setdefault('ARTIFACT_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+        self.root = app.config['ARTIFACT_CACHE_DIR']
+        self.max_bytes = app.config['ARTIFACT_CACHE_MAX_BYTES']
+        self.logger = app.logger
+        os.makedirs(self.root, exist_ok=True)
+
+    # --- Schlüssel ---
+
+    @staticmethod
+    def digest(rows):
+        """Hash über alle Zeilen eines Datenbestands (Reihenfolge zählt)"""
+        h = hashlib.sha256()
+        for row in rows:
+            h.update(repr(tuple(row)).encode('utf-8'))
+            h.update(b'\n')
+        return h.hexdigest()
+
+    @staticmethod
+    def key(name, dataset_digest, params):
+        payload = json.dumps([name, dataset_digest, params], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key, extension):
+        # Zwei Zeichen als Unterverzeichnis, damit kein Verzeichnis zu groß wird
+        return os.path.join(self.root, key[:2], f"{key}.{extension}")
+
+    # --- Zugriff ---
+
+    def lookup(self, key, extension):
+        """Pfad der gecachten Datei oder None; zählt Treffer und Fehlschläge"""
+        path = self.path(key, extension)
+        try:
+            # Nutzung vermerken (LRU)
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def get(self, key, extension):
+        """Wie lookup, aber ohne Statistik und ohne LRU-Aktualisierung (z. B. für Downloads)"""
+        path = self.path(key, extension)
+        return path if os.path.exists(path) else None
+
+    def open_for_write(self, key, extension):
+        """Liefert (temporärer Pfad, Zielpfad); nach dem Schreiben commit() aufrufen"""
+        path = self.path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{os.getpid()}.tmp", path
+
+    def commit(self, tmp_path, path):
+        os.replace(tmp_path, path)
+        self.evict()
+
+    # --- Verdrängung ---
+
+    def _entries(self):
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Löscht die am längsten ungenutzten Dateien, bis der Cache unter max_bytes liegt"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        entries = list(self._entries())
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+            'files': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'checked_at': time.time(),
+        }
+
+
+# Singleton-Instanz
+artifact_cache = ArtifactCache()
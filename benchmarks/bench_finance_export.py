@@ -0,0 +1,130 @@
+"""
+Benchmark: Export einer Kostenstelle – Abfragen und Laufzeit
+
+Legt in einer temporären SQLite-Datenbank Buchungen für eine Kostenstelle an
+und vergleicht das bisherige Verfahren (alle Buchungen laden, pro Zeile
+Process.query.get, DataFrame) mit dem gestreamten Export aus einer
+verbundenen Abfrage (/admin/finanzen/export/<id>).
+
+Aufruf:  python benchmarks/bench_finance_export.py [--rows 10000] [--processes 200]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def seed(app_module, rows, processes):
+    db = app_module.db
+    cost_center = app_module.CostCenter(name="Benchmark", code="BENCH")
+    db.session.add(cost_center)
+    db.session.flush()
+    process_ids = []
+    for i in range(processes):
+        process = app_module.Process(name=f"Vorgang {i}", code=f"BENCH-{i}", cost_center_id=cost_center.id)
+        db.session.add(process)
+        db.session.flush()
+        process_ids.append(process.id)
+
+    rnd = random.Random(42)
+    start = datetime.date(2020, 1, 1)
+    db.session.execute(app_module.Transaction.__table__.insert(), [{
+        "description": f"Buchung {i}",
+        "amount": round(rnd.uniform(1, 500), 2),
+        "type": rnd.choice(("Einnahme", "Ausgabe")),
+        "category": rnd.choice(("Spende", "Miete", "Strom", None)),
+        "date": start + datetime.timedelta(days=rnd.randrange(2000)),
+        "cost_center_id": cost_center.id,
+        "process_id": rnd.choice(process_ids) if rnd.random() < 0.8 else None,
+    } for i in range(rows)])
+    db.session.commit()
+    return cost_center.id
+
+
+def export_legacy(app_module, cost_center_id):
+    """Bisheriges Verfahren aus admin_finanzen_export"""
+    import pandas as pd
+    Transaction, Process = app_module.Transaction, app_module.Process
+    transactions = Transaction.query.filter_by(cost_center_id=cost_center_id).all()
+    df = pd.DataFrame([{
+        'ID': t.id,
+        'Beschreibung': t.description,
+        'Betrag': t.amount,
+        'Typ': t.type,
+        'Kategorie': t.category or 'Keine',
+        'Datum': t.date.strftime('%d.%m.%Y'),
+        'Vorgang': Process.query.get(t.process_id).name if t.process_id else 'Keiner'
+    } for t in transactions])
+    buf = BytesIO()
+    # to_excel braucht openpyxl; ohne wird der DataFrame als CSV geschrieben
+    try:
+        df.to_excel(buf, index=False, sheet_name='Finanzbericht')
+    except ImportError:
+        df.to_csv(buf, index=False, sep=';')
+    return buf.tell()
+
+
+def export_streaming(client, cost_center_id, export_format):
+    response = client.get(f"/admin/finanzen/export/{cost_center_id}?format={export_format}", buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return size
+
+
+def measure(label, func, app_module, counter):
+    app_module.db.session.remove()
+    counter.count = 0
+    t0 = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<16} {counter.count:6d} Abfragen   {elapsed * 1000:9.1f} ms   {size / 1024:8.0f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--processes", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Eigene Datenbank, die local.db der Anwendung bleibt unberührt
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "bench.db")
+        import app as app_module
+        from sqlalchemy import event
+
+        app = app_module.app
+        with app.app_context():
+            cost_center_id = seed(app_module, args.rows, args.processes)
+            print(f"{args.rows} Buchungen, {args.processes} Vorgänge")
+
+            counter = QueryCounter()
+            event.listen(app_module.db.engine, "before_cursor_execute", counter)
+
+            measure("bisher", lambda: export_legacy(app_module, cost_center_id), app_module, counter)
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["admin"] = True
+        with app.app_context():
+            for export_format in ("csv", "xlsx"):
+                measure(f"stream ({export_format})",
+                        lambda: export_streaming(client, cost_center_id, export_format), app_module, counter)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: Ladezeit und Speicherbedarf der Gebetszeiten-Tabelle
+
+Erzeugt eine synthetische gb.txt über mehrere Jahrzehnte und vergleicht das
+alte Dict-of-Dicts-Format mit der Array-Tabelle aus prayer_times.py und dem
+per mmap eingebundenen Binär-Cache (gb.bin).
+
+Aufruf:  python benchmarks/bench_prayer_times.py [--years 50]
+"""
+import argparse
+import datetime
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prayer_times import load_table, open_compiled, read_source, write_compiled  # noqa: E402
+
+logger = logging.getLogger("bench_prayer_times")
+
+
+def write_sample_file(path, years):
+    start = datetime.date(2000, 1, 1)
+    end = datetime.date(2000 + years, 1, 1)
+    rnd = random.Random(42)
+    with open(path, "w", encoding="utf-8") as f:
+        day = start
+        while day < end:
+            base = [270, 380, 805, 1020, 1200, 1300]
+            times = [m + rnd.randint(-60, 60) for m in base]
+            f.write(day.isoformat() + " " + " ".join(f"{m // 60:02d}:{m % 60:02d}" for m in times) + "\n")
+            day += datetime.timedelta(days=1)
+
+
+def load_legacy(path):
+    """Bisheriges Verfahren: strptime pro Zeile, Dict mit sechs Strings pro Tag"""
+    data = {}
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) >= 7:
+                date_obj = datetime.datetime.strptime(parts[0], "%Y-%m-%d").date()
+                data[date_obj] = {
+                    "fajr": parts[1], "sunrise": parts[2], "dhuhr": parts[3],
+                    "asr": parts[4], "maghrib": parts[5], "isha": parts[6],
+                }
+    return data
+
+
+def measure(label, loader, path):
+    # Zeitmessung ohne tracemalloc, da das Tracing die Ladezeit verfälscht
+    t0 = time.perf_counter()
+    loader(path)
+    elapsed = time.perf_counter() - t0
+
+    tracemalloc.start()
+    result = loader(path)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {elapsed * 1000:9.1f} ms   resident {current / 1024:9.1f} KiB   peak {peak / 1024:9.1f} KiB")
+    return result
+
+
+def measure_lookups(label, lookup, days, rounds=200000):
+    rnd = random.Random(7)
+    probes = [rnd.choice(days) for _ in range(rounds)]
+    t0 = time.perf_counter()
+    for day in probes:
+        lookup(day)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<10} {elapsed / rounds * 1e9:9.0f} ns pro Abfrage")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--years", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "gb.txt")
+        write_sample_file(path, args.years)
+        print(f"Testdatei: {args.years} Jahre, {os.path.getsize(path) / 1024:.0f} KiB")
+
+        legacy = measure("dict", load_legacy, path)
+        table = measure("array", lambda p: load_table(p, logger), path)
+
+        cache_path = os.path.join(tmp, "gb.bin")
+        stat, _, checksum = read_source(path)
+        write_compiled(table, stat, checksum, cache_path)
+        compiled = measure("mmap", lambda p: open_compiled(p, cache_path), path)
+
+        days = list(legacy.keys())
+        measure_lookups("dict", legacy.get, days)
+        measure_lookups("array", table.get, days)
+        measure_lookups("mmap", compiled.get, days)
+
+
+if __name__ == "__main__":
+    main()
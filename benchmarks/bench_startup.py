@@ -0,0 +1,83 @@
+"""
+Benchmark: Startzeit und Speicher eines Workers
+
+Importiert app.py mehrfach in frischen Python-Prozessen (wie ein gunicorn-
+Worker beim Start) und misst Importzeit und maximalen RSS. Zum Vergleich
+wird derselbe Start mit vorab geladenem matplotlib/seaborn/pandas gemessen,
+also dem früheren Verhalten. Liegt der Median über dem Budget, endet das
+Skript mit Exit-Code 1.
+
+Aufruf:  python benchmarks/bench_startup.py [--runs 5] [--budget-ms 1500] [--budget-mb 120]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+if {eager!r}:
+    import reporting
+    reporting.load()
+import app
+elapsed = time.perf_counter() - t0
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "plot_stack_loaded": any(m in sys.modules for m in ("matplotlib", "pandas", "seaborn")),
+}}))
+"""
+
+
+def run(eager, env):
+    output = subprocess.run([sys.executable, "-c", CHILD.format(root=ROOT, eager=eager)],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(label, results):
+    ms = statistics.median(r["ms"] for r in results)
+    rss = statistics.median(r["rss_mb"] for r in results)
+    loaded = any(r["plot_stack_loaded"] for r in results)
+    print(f"{label:<10} Import {ms:8.1f} ms   RSS {rss:7.1f} MiB   Plot-Stack geladen: {'ja' if loaded else 'nein'}")
+    return ms, rss, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--budget-mb", type=float, default=120)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL="sqlite:///" + os.path.join(tmp, "bench.db"))
+        # Erster Lauf legt Schema und Caches an und zählt nicht mit
+        run(False, env)
+        lazy = summarize("lazy", [run(False, env) for _ in range(args.runs)])
+        # Zum Vergleich: Plot-Stack beim Start mitgeladen wie früher
+        summarize("eager", [run(True, env) for _ in range(args.runs)])
+
+    ms, rss, loaded = lazy
+    failures = []
+    if ms > args.budget_ms:
+        failures.append(f"Importzeit {ms:.0f} ms > {args.budget_ms:.0f} ms")
+    if rss > args.budget_mb:
+        failures.append(f"RSS {rss:.0f} MiB > {args.budget_mb:.0f} MiB")
+    if loaded:
+        failures.append("matplotlib/seaborn/pandas werden beim Start geladen")
+    if failures:
+        print("Budget überschritten: " + "; ".join(failures))
+        sys.exit(1)
+    print("Innerhalb des Budgets.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Versionszähler pro Tabelle für Cache-Invalidierung
+
+Jeder Commit, der Zeilen einer Tabelle anlegt, ändert oder löscht, erhöht
+deren Zähler. Die Zähler liegen in einer kleinen SQLite-Datei, damit alle
+Worker-Prozesse dieselben Werte sehen. Caches, ETags und vorberechnete
+Auswertungen nehmen die Zähler in ihren Schlüssel auf.
+"""
+import os
+import sqlite3
+import threading
+
+from sqlalchemy import event
+
+
+class ContentVersions:
+    def __init__(self, app=None, db=None):
+        self.path = None
+        self.logger = None
+        self._local = threading.local()
+        self._subscribers = []
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('CONTENT_VERSIONS_DB', os.path.join(app.instance_path, 'content_versions.db'))
+        self.path = app.config['CONTENT_VERSIONS_DB']
+        self.logger = app.logger
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS content_version ('
+                         'name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)')
+
+        event.listen(db.session, 'after_flush', self._collect_flush)
+        event.listen(db.session, 'after_bulk_update', self._collect_bulk)
+        event.listen(db.session, 'after_bulk_delete', self._collect_bulk)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+
+    def _connect(self):
+        # Nach fork() (z. B. gunicorn --preload) eigene Verbindung öffnen, SQLite-Handles dürfen nicht geteilt werden
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- Session-Events ---
+
+    @staticmethod
+    def _pending(session):
+        return session.info.setdefault('changed_tables', set())
+
+    def _collect_flush(self, session, flush_context):
+        pending = self._pending(session)
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            table = getattr(obj, '__tablename__', None)
+            if table and (obj not in session.dirty or session.is_modified(obj)):
+                pending.add(table)
+
+    def _collect_bulk(self, context):
+        table = getattr(context.mapper.class_, '__tablename__', None)
+        if table:
+            self._pending(context.session).add(table)
+
+    def _after_commit(self, session):
+        tables = session.info.pop('changed_tables', None)
+        if tables:
+            self.bump(*tables)
+
+    def _after_rollback(self, session):
+        session.info.pop('changed_tables', None)
+
+    # --- Öffentliche API ---
+
+    def subscribe(self, callback):
+        """callback(tables) wird nach jedem Erhöhen im selben Prozess aufgerufen"""
+        self._subscribers.append(callback)
+        return callback
+
+    def bump(self, *tables):
+        try:
+            conn = self._connect()
+            conn.executemany(
+                'INSERT INTO content_version (name, version) VALUES (?, 1) '
+                'ON CONFLICT(name) DO UPDATE SET version = version + 1',
+                [(table,) for table in tables],
+            )
+        except sqlite3.Error as e:
+            self.logger.error(f"Versionszähler für {tables} nicht aktualisiert: {e}")
+            return
+        for callback in self._subscribers:
+            try:
+                callback(set(tables))
+            except Exception as e:
+                self.logger.error(f"Fehler im Versions-Subscriber {callback}: {e}")
+
+    def get(self, *tables):
+        """Liefert die aktuellen Zähler der Tabellen als Tupel (fehlende = 0).
+
+        Ist die Zählerdatei nicht lesbar, kommt None zurück; Aufrufer cachen dann nicht.
+        """
+        try:
+            rows = dict(self._connect().execute(
+                f"SELECT name, version FROM content_version WHERE name IN ({','.join('?' * len(tables))})",
+                tables,
+            ).fetchall())
+        except sqlite3.Error as e:
+            self.logger.error(f"Versionszähler nicht lesbar: {e}")
+            return None
+        return tuple(rows.get(table, 0) for table in tables)
+
+    def etag(self, *tables):
+        versions = self.get(*tables)
+        if versions is None:
+            return None
+        return '-'.join(str(version) for version in versions)
+
+
+# Singleton-Instanz
+content_versions = ContentVersions()
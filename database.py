@@ -3,6 +3,8 @@ Datenbank-Konfiguration für das professionelle Klassenbuch
 """
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
 
 # Datenbankinstanz erstellen
 db = SQLAlchemy()
@@ -15,4 +17,61 @@ def init_db(app):
     
     # Tabellen erstellen
     with app.app_context():
-        db.create_all()
\ No newline at end of file
+        db.create_all()
+
+
+def sync_schema(app):
+    """Erstellt fehlende Tabellen, Spalten und Indizes, nachdem alle Modelle importiert sind"""
+    with app.app_context():
+        db.create_all()
+        add_missing_columns(app)
+        create_missing_indexes(app)
+
+
+def add_missing_columns(app):
+    """Ergänzt neue, nullbare Spalten in bereits existierenden Tabellen per ALTER TABLE.
+
+    create_all() legt nur ganze Tabellen an; Typänderungen bestehender Spalten
+    sind hier nicht vorgesehen.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable or column.primary_key:
+                app.logger.warning(f"Spalte {table.name}.{column.name} ist nicht nullbar und wird nicht automatisch angelegt")
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            except Exception as e:
+                app.logger.warning(f"Spalte {table.name}.{column.name} konnte nicht angelegt werden: {e}")
+
+
+def create_missing_indexes(app):
+    """Legt neu definierte Indizes auch für bereits existierende Tabellen an.
+
+    create_all() erzeugt Indizes nur zusammen mit neuen Tabellen.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(db.engine, checkfirst=True)
+            except Exception as e:
+                app.logger.warning(f"Index {index.name} konnte nicht angelegt werden: {e}")
+
+
+def upsert_insert(table):
+    """insert() des aktiven Dialekts mit on_conflict_do_update()/on_conflict_do_nothing().
+
+    Unterstützt werden SQLite und PostgreSQL (DATABASE_URL).
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
@@ -0,0 +1,189 @@
+"""
+Streaming-Export von Tabellen als CSV oder XLSX
+
+Beide Writer nehmen Zeilen aus einem Iterator entgegen und geben die Datei
+stückweise als Bytes aus, der Speicherbedarf hängt also nicht von der Anzahl
+der Zeilen ab. XLSX wird direkt als Zip-Stream mit Inline-Strings geschrieben
+(kein openpyxl/xlsxwriter nötig, keine Shared-Strings-Tabelle im Speicher).
+"""
+import csv
+import io
+import re
+import unicodedata
+import zipfile
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from flask import Response, stream_with_context
+
+# Format -> (Mimetype, Dateiendung)
+EXPORT_FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+# Nach so vielen Zeilen wird der bisherige Puffer an den Client geschickt
+ROWS_PER_CHUNK = 500
+
+# In XML 1.0 nicht erlaubte Steuerzeichen
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Nicht-seekbares Ziel für zipfile, sammelt geschriebene Bytes bis zum Abholen"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _CsvLine:
+    """Minimales Dateiobjekt für csv.writer, das die zuletzt geschriebene Zeile merkt"""
+
+    def __init__(self):
+        self.value = ''
+
+    def write(self, line):
+        self.value = line
+
+
+def stream_csv(header, rows, delimiter=';'):
+    """CSV mit BOM und Semikolon, damit Excel Umlaute und Spalten richtig erkennt"""
+    line = _CsvLine()
+    writer = csv.writer(line, delimiter=delimiter)
+    writer.writerow(header)
+    chunk = ['\ufeff', line.value]
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        chunk.append(line.value)
+        if count % ROWS_PER_CHUNK == 0:
+            yield ''.join(chunk).encode('utf-8')
+            chunk.clear()
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value!r}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def stream_xlsx(header, rows, sheet_name='Tabelle1'):
+    """Schreibt eine Arbeitsmappe mit einem Blatt zeilenweise in einen Zip-Stream"""
+    # Excel erlaubt höchstens 31 Zeichen und keine []:*?/\ im Blattnamen
+    sheet_name = escape(re.sub(r'[\[\]:*?/\\]', '', sheet_name)[:31] or 'Tabelle1')
+    out = _ChunkBuffer()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(name=sheet_name))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield out.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write((_SHEET_HEAD + _xlsx_row(header)).encode('utf-8'))
+            for count, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row).encode('utf-8'))
+                if count % ROWS_PER_CHUNK == 0:
+                    data = out.drain()
+                    if data:
+                        yield data
+            sheet.write(_SHEET_TAIL.encode('utf-8'))
+    yield out.drain()
+
+
+def export_response(header, rows, filename, export_format='xlsx', sheet_name='Tabelle1'):
+    """Chunked Download-Response; rows wird erst beim Senden durchlaufen.
+
+    filename ohne Endung, die Endung ergibt sich aus export_format.
+    """
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    if export_format == 'csv':
+        body = stream_csv(header, rows)
+    else:
+        body = stream_xlsx(header, rows, sheet_name)
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers.set('Content-Disposition', 'attachment', **_disposition_names(f"{filename}.{extension}"))
+    return response
+
+
+def _disposition_names(filename):
+    """Dateiname für Content-Disposition wie bei send_file(download_name=...).
+
+    Nicht-ASCII-Namen (z. B. 'bağışı') bekommen einen ASCII-Ersatz in filename
+    und den vollständigen Namen nach RFC 5987 in filename*, sonst ließe sich
+    der Header nicht als Latin-1 senden.
+    """
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(filename, safe="!#$&+-.^_`|~")
+        return {'filename': simple, 'filename*': f"UTF-8''{quoted}"}
+    return {'filename': filename}
@@ -0,0 +1,405 @@
+"""
+Stückweiser, fortsetzbarer Upload vieler Galerie-Bilder
+
+Der Browser meldet zuerst einen Stapel an (Album, Titel, Dateinamen und
+-größen) und schickt danach jede Datei in Stücken per PUT mit Content-Range.
+Jedes Stück wird direkt aus dem Request-Stream auf die Platte geschrieben
+und dabei in einen laufenden SHA-256 eingerechnet; bricht die Verbindung ab,
+setzt der Browser am gemeldeten Offset wieder an. Ein Stück wird erst nach
+einem bedingten UPDATE (writer) geschrieben, zwei PUTs auf dieselbe Datei
+laufen daher nie gleichzeitig.
+
+Fertige Dateien gehen an einen begrenzten Thread-Pool, der die Bildvarianten
+erzeugt. Sind alle Dateien eines Stapels verarbeitet, legt ein einziger
+Bulk-Insert die Datenbankzeilen an. Der Fortschritt jeder Datei steht in einer
+kleinen SQLite-Datei, damit alle Worker-Prozesse denselben Stand sehen.
+Bleibt eine Datei länger als GALLERY_UPLOADS_PROCESSING_TIMEOUT in der
+Verarbeitung (Worker neu gestartet), stellt der nächste Statusabruf sie
+erneut in den Pool.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Status einer Datei
+UPLOADING, PROCESSING, READY, FAILED, DONE = 'uploading', 'processing', 'ready', 'failed', 'done'
+# Status eines Stapels
+OPEN, COMMITTED = 'open', 'committed'
+
+READ_BLOCK = 64 * 1024
+
+
+class UploadError(Exception):
+    """Ungültige Anfrage an den Upload, status ist der passende HTTP-Status"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class GalleryUploads:
+    def __init__(self, app=None, process=None, commit=None):
+        self.app = None
+        self.path = None
+        self.staging_dir = None
+        self.workers = 2
+        self.process = None
+        self.commit = None
+        self._local = threading.local()
+        self._hashers = {}
+        self._pool = None
+        self._pool_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, process, commit)
+
+    def init_app(self, app, process, commit):
+        """process(staging_path, upload) übernimmt eine vollständige Datei und liefert
+        (gespeicherter Name, Beschreibung der Varianten oder None); commit(batch, uploads)
+        legt die fertigen Dateien eines Stapels in einem Bulk-Insert an.
+        """
+        app.config.setdefault('GALLERY_UPLOADS_DB', os.path.join(app.instance_path, 'gallery_uploads.db'))
+        app.config.setdefault('GALLERY_UPLOADS_STAGING', os.path.join(app.instance_path, 'uploads_tmp'))
+        app.config.setdefault('GALLERY_UPLOADS_WORKERS', 2)
+        app.config.setdefault('GALLERY_UPLOADS_QUEUE', 8)
+        app.config.setdefault('GALLERY_UPLOADS_MAX_FILE', 50 * 1024 * 1024)
+        app.config.setdefault('GALLERY_UPLOADS_MAX_CHUNK', 8 * 1024 * 1024)
+        app.config.setdefault('GALLERY_UPLOADS_MAX_FILES', 500)
+        app.config.setdefault('GALLERY_UPLOADS_KEEP', 24 * 3600)
+        # Danach gelten ein begonnenes Stück bzw. eine Verarbeitung als verwaist
+        app.config.setdefault('GALLERY_UPLOADS_CHUNK_TIMEOUT', 300)
+        app.config.setdefault('GALLERY_UPLOADS_PROCESSING_TIMEOUT', 300)
+        self.app = app
+        self.process = process
+        self.commit = commit
+        self.path = app.config['GALLERY_UPLOADS_DB']
+        self.staging_dir = app.config['GALLERY_UPLOADS_STAGING']
+        self.workers = app.config['GALLERY_UPLOADS_WORKERS']
+        os.makedirs(self.staging_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS upload_batch ('
+                         'id TEXT PRIMARY KEY, album_id INTEGER, titel TEXT, beschreibung TEXT, '
+                         'status TEXT NOT NULL, created_at REAL NOT NULL, error TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS upload_file ('
+                         'id TEXT PRIMARY KEY, batch_id TEXT NOT NULL, position INTEGER NOT NULL, '
+                         'filename TEXT NOT NULL, size INTEGER NOT NULL, received INTEGER NOT NULL DEFAULT 0, '
+                         'sha256 TEXT, stored_path TEXT, meta TEXT, status TEXT NOT NULL, error TEXT, '
+                         'updated_at REAL NOT NULL)')
+            try:
+                # Spalte kam mit der Sperre für gleichzeitige Stücke hinzu
+                conn.execute('ALTER TABLE upload_file ADD COLUMN writer TEXT')
+            except sqlite3.OperationalError:
+                pass
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_upload_file_batch ON upload_file (batch_id, status)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_upload_file_status ON upload_file (status, updated_at)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- Stapel und Status ---
+
+    def create_batch(self, files, album_id=None, titel='', beschreibung=''):
+        """Meldet einen Stapel an; files ist eine Liste von {'name', 'size'}"""
+        if not files:
+            raise UploadError('Keine Dateien angegeben')
+        if len(files) > self.app.config['GALLERY_UPLOADS_MAX_FILES']:
+            raise UploadError('Zu viele Dateien in einem Stapel')
+        max_file = self.app.config['GALLERY_UPLOADS_MAX_FILE']
+        rows = []
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        for position, entry in enumerate(files):
+            try:
+                name, size = str(entry['name']), int(entry['size'])
+            except (KeyError, TypeError, ValueError):
+                raise UploadError('Jede Datei braucht name und size')
+            if not 0 < size <= max_file:
+                raise UploadError(f'{name}: Dateigröße nicht erlaubt (höchstens {max_file // (1024 * 1024)} MB)', 413)
+            rows.append((uuid.uuid4().hex, batch_id, position, name, size, UPLOADING, now))
+
+        self._cleanup(now)
+        self._recover(now)
+        conn = self._connect()
+        conn.execute('BEGIN')
+        conn.execute('INSERT INTO upload_batch (id, album_id, titel, beschreibung, status, created_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', (batch_id, album_id, titel, beschreibung, OPEN, now))
+        conn.executemany('INSERT INTO upload_file (id, batch_id, position, filename, size, status, updated_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        conn.execute('COMMIT')
+        return self.batch_status(batch_id)
+
+    def get(self, upload_id):
+        row = self._connect().execute('SELECT * FROM upload_file WHERE id = ?', (upload_id,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def file_status(row):
+        return {
+            'id': row['id'],
+            'name': row['filename'],
+            'size': row['size'],
+            'received': row['received'],
+            'status': row['status'],
+            'error': row['error'],
+        }
+
+    def batch_status(self, batch_id):
+        self._recover(time.time())
+        conn = self._connect()
+        batch = conn.execute('SELECT * FROM upload_batch WHERE id = ?', (batch_id,)).fetchone()
+        if batch is None:
+            return None
+        files = conn.execute('SELECT * FROM upload_file WHERE batch_id = ? ORDER BY position', (batch_id,)).fetchall()
+        return {
+            'id': batch['id'],
+            'album_id': batch['album_id'],
+            'status': batch['status'],
+            'error': batch['error'],
+            'files': [self.file_status(row) for row in files],
+        }
+
+    # --- Stücke empfangen ---
+
+    def _staging_path(self, upload_id):
+        return os.path.join(self.staging_dir, f"{upload_id}.part")
+
+    def _hasher(self, upload):
+        """Laufender Hash passend zum empfangenen Stand.
+
+        Liegt er nicht in diesem Prozess vor (Neustart, anderer Worker), wird
+        die bisher empfangene Datei einmal neu eingelesen.
+        """
+        cached = self._hashers.get(upload['id'])
+        if cached is not None and cached[0] == upload['received']:
+            return cached[1]
+        hasher = hashlib.sha256()
+        path = self._staging_path(upload['id'])
+        if upload['received']:
+            with open(path, 'rb') as f:
+                remaining = upload['received']
+                while remaining:
+                    block = f.read(min(READ_BLOCK, remaining))
+                    if not block:
+                        raise UploadError('Zwischendatei unvollständig, bitte neu beginnen', 409, offset=0)
+                    hasher.update(block)
+                    remaining -= len(block)
+        return hasher
+
+    def write_chunk(self, upload_id, start, length, stream):
+        """Schreibt length Bytes ab start aus stream, liefert den neuen Dateistatus.
+
+        Passt start nicht zum empfangenen Stand, gibt es einen UploadError mit
+        Status 409 und dem Offset, an dem der Browser weitermachen soll.
+        """
+        upload = self.get(upload_id)
+        if upload is None:
+            raise UploadError('Upload nicht gefunden', 404)
+        if upload['status'] != UPLOADING:
+            raise UploadError('Datei ist bereits vollständig', 409, offset=upload['received'])
+        if start != upload['received']:
+            raise UploadError('Offset passt nicht zum empfangenen Stand', 409, offset=upload['received'])
+        if length <= 0 or start + length > upload['size']:
+            raise UploadError('Content-Range außerhalb der Dateigröße', 416, offset=upload['received'])
+        if length > self.app.config['GALLERY_UPLOADS_MAX_CHUNK']:
+            raise UploadError('Stück zu groß', 413, offset=upload['received'])
+
+        # Stück für diesen Request beanspruchen; ein zweiter PUT auf dieselbe Datei bekommt 409
+        writer = uuid.uuid4().hex
+        now = time.time()
+        claimed = self._connect().execute(
+            'UPDATE upload_file SET writer = ?, updated_at = ? WHERE id = ? AND status = ? AND received = ? '
+            'AND (writer IS NULL OR updated_at < ?) RETURNING id',
+            (writer, now, upload_id, UPLOADING, start,
+             now - self.app.config['GALLERY_UPLOADS_CHUNK_TIMEOUT'])).fetchone()
+        if claimed is None:
+            current = self.get(upload_id) or upload
+            raise UploadError('Für diese Datei wird bereits ein Stück übertragen', 409, offset=current['received'])
+
+        received = start
+        hasher = None
+        try:
+            hasher = self._hasher(upload)
+            path = self._staging_path(upload_id)
+            with open(path, 'r+b' if start else 'wb') as f:
+                f.seek(start)
+                f.truncate()
+                remaining = length
+                while remaining:
+                    block = stream.read(min(READ_BLOCK, remaining))
+                    if not block:
+                        break
+                    f.write(block)
+                    hasher.update(block)
+                    remaining -= len(block)
+                    received += len(block)
+        finally:
+            if hasher is not None:
+                # Auch ein abgebrochenes Stück zählt bis zum letzten geschriebenen Byte
+                self._hashers[upload_id] = (received, hasher)
+            released = self._connect().execute(
+                'UPDATE upload_file SET received = ?, writer = NULL, updated_at = ? WHERE id = ? AND status = ? AND writer = ?',
+                (received, time.time(), upload_id, UPLOADING, writer)).rowcount
+        if not released:
+            # Abgebrochen oder nach GALLERY_UPLOADS_CHUNK_TIMEOUT von einem anderen Request übernommen
+            self._hashers.pop(upload_id, None)
+            current = self.get(upload_id) or upload
+            raise UploadError('Stück wurde nicht übernommen', 409, offset=current['received'])
+        if received < start + length:
+            raise UploadError('Verbindung während des Stücks abgebrochen', 400, offset=received)
+
+        upload['received'] = received
+        if received == upload['size']:
+            self._finish_upload(upload, hasher.hexdigest())
+            upload = self.get(upload_id)
+        return self.file_status(upload)
+
+    def _finish_upload(self, upload, sha256):
+        self._hashers.pop(upload['id'], None)
+        claimed = self._connect().execute(
+            'UPDATE upload_file SET status = ?, sha256 = ?, updated_at = ? WHERE id = ? AND status = ? RETURNING id',
+            (PROCESSING, sha256, time.time(), upload['id'], UPLOADING)).fetchone()
+        if claimed is None:
+            return
+        self._submit(upload['id'])
+
+    def cancel(self, upload_id):
+        """Bricht eine unvollständige Datei ab, damit der Rest des Stapels gespeichert werden kann"""
+        upload = self.get(upload_id)
+        if upload is None:
+            raise UploadError('Upload nicht gefunden', 404)
+        cancelled = self._connect().execute(
+            'UPDATE upload_file SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status = ? RETURNING id',
+            (FAILED, 'Abgebrochen', time.time(), upload_id, UPLOADING)).fetchone()
+        if cancelled is not None:
+            self._hashers.pop(upload_id, None)
+            try:
+                os.remove(self._staging_path(upload_id))
+            except OSError:
+                pass
+            self._complete_batch(upload['batch_id'])
+        return self.file_status(self.get(upload_id))
+
+    # --- Verarbeitung im Thread-Pool ---
+
+    def _ensure_pool(self):
+        # Pro Prozess ein Pool, erst beim ersten Upload gestartet
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='gallery-upload')
+                self._pool_pid = os.getpid()
+                # Begrenzt die wartenden Aufträge; ist die Warteschlange voll, wartet der Request
+                self._slots = threading.BoundedSemaphore(self.workers + self.app.config['GALLERY_UPLOADS_QUEUE'])
+        return self._pool
+
+    def _submit(self, upload_id):
+        pool = self._ensure_pool()
+        self._slots.acquire()
+        try:
+            pool.submit(self._run, upload_id)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _run(self, upload_id):
+        try:
+            with self.app.app_context():
+                self._process_upload(upload_id)
+        except Exception as e:
+            self.app.logger.error(f"Verarbeitung von Upload {upload_id} fehlgeschlagen: {e}")
+        finally:
+            self._slots.release()
+
+    def _process_upload(self, upload_id):
+        conn = self._connect()
+        # Beginn vermerken, die Wartezeit im Pool zählt nicht gegen GALLERY_UPLOADS_PROCESSING_TIMEOUT
+        upload = conn.execute('UPDATE upload_file SET updated_at = ? WHERE id = ? AND status = ? RETURNING *',
+                              (time.time(), upload_id, PROCESSING)).fetchone()
+        if upload is None:
+            return
+        try:
+            stored_path, meta = self.process(self._staging_path(upload_id), dict(upload))
+        except Exception as e:
+            self.app.logger.error(f"Bild {upload['filename']} konnte nicht übernommen werden: {e}")
+            conn.execute('UPDATE upload_file SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status = ?',
+                         (FAILED, str(e), time.time(), upload_id, PROCESSING))
+        else:
+            conn.execute('UPDATE upload_file SET status = ?, stored_path = ?, meta = ?, updated_at = ? '
+                         'WHERE id = ? AND status = ?',
+                         (READY, stored_path, json.dumps(meta), time.time(), upload_id, PROCESSING))
+        self._complete_batch(upload['batch_id'])
+
+    def _recover(self, now):
+        """Stellt Dateien erneut in den Pool, deren Verarbeitung verwaist ist (Worker neu gestartet)"""
+        stale = self._connect().execute(
+            'UPDATE upload_file SET updated_at = ? WHERE status = ? AND updated_at < ? RETURNING id',
+            (now, PROCESSING, now - self.app.config['GALLERY_UPLOADS_PROCESSING_TIMEOUT'])).fetchall()
+        for row in stale:
+            self.app.logger.warning(f"Upload {row['id']}: Verarbeitung verwaist, wird wiederholt")
+            self._submit(row['id'])
+
+    def _complete_batch(self, batch_id):
+        """Legt alle fertigen Dateien eines Stapels an, sobald keine mehr aussteht"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            pending = conn.execute('SELECT COUNT(*) FROM upload_file WHERE batch_id = ? AND status IN (?, ?)',
+                                   (batch_id, UPLOADING, PROCESSING)).fetchone()[0]
+            batch = conn.execute('SELECT * FROM upload_batch WHERE id = ? AND status = ?',
+                                 (batch_id, OPEN)).fetchone()
+            if pending or batch is None:
+                conn.execute('COMMIT')
+                return
+            ready = [dict(row) for row in conn.execute(
+                'SELECT * FROM upload_file WHERE batch_id = ? AND status = ? ORDER BY position', (batch_id, READY))]
+            for row in ready:
+                row['meta'] = json.loads(row['meta']) if row['meta'] else None
+            error = None
+            try:
+                if ready:
+                    self.commit(dict(batch), ready)
+            except Exception as e:
+                self.app.logger.error(f"Upload-Stapel {batch_id} konnte nicht gespeichert werden: {e}")
+                error = str(e)
+            now = time.time()
+            conn.execute('UPDATE upload_batch SET status = ?, error = ? WHERE id = ?', (COMMITTED, error, batch_id))
+            conn.execute('UPDATE upload_file SET status = ?, error = ?, updated_at = ? WHERE batch_id = ? AND status = ?',
+                         (FAILED if error else DONE, error, now, batch_id, READY))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # --- Aufräumen ---
+
+    def _cleanup(self, now):
+        """Entfernt abgebrochene Uploads und alte Stapel"""
+        conn = self._connect()
+        cutoff = now - self.app.config['GALLERY_UPLOADS_KEEP']
+        stale = conn.execute('SELECT id FROM upload_file WHERE updated_at < ?', (cutoff,)).fetchall()
+        for row in stale:
+            self._hashers.pop(row['id'], None)
+            try:
+                os.remove(self._staging_path(row['id']))
+            except OSError:
+                pass
+        conn.execute('DELETE FROM upload_file WHERE updated_at < ?', (cutoff,))
+        conn.execute('DELETE FROM upload_batch WHERE created_at < ? AND id NOT IN (SELECT batch_id FROM upload_file)',
+                     (cutoff,))
+
+
+# Singleton-Instanz
+gallery_uploads = GalleryUploads()
@@ -0,0 +1,221 @@
+"""
+Manifest der Header-Bilder für das Karussell der Startseite
+
+Statt bei jedem Aufruf von index() das Verzeichnis static/Uploads/header zu
+lesen, steht die Liste samt Maßen, Hauptfarbe und Varianten in einem
+Manifest (instance/header_manifest.json), das im Speicher gehalten wird.
+Höchstens alle HEADER_IMAGES_CHECK_INTERVAL Sekunden werden Größe und mtime
+der Originale verglichen (ein scandir, kein Öffnen der Bilder), damit auch
+an Ort und Stelle überschriebene Dateien auffallen; dazwischen kommt das
+Manifest ohne Dateizugriff aus dem Speicher.
+
+Weicht der Stand ab, gilt sofort ein vorläufiges Manifest (unveränderte
+Bilder wie gehabt, neue oder geänderte ohne Maße und Varianten), und ein
+Hintergrund-Thread baut das vollständige auf. Dabei werden nur neue oder
+geänderte Bilder geöffnet; Varianten entfernter Bilder werden gelöscht.
+'flask header-bilder' baut das Manifest von Hand neu auf.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from image_derivatives import EXTENSIONS, image_derivatives, variant_files
+from static_assets import static_assets
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+# Das Karussell ist seitenbreit, daher größere Stufen als in der Galerie
+DEFAULT_SIZES = {'small': 800, 'medium': 1280, 'large': 1920}
+
+
+class HeaderImages:
+    def __init__(self, app=None):
+        self.app = None
+        self.directory = None
+        self._manifest = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._builder = None
+        self._builder_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('HEADER_IMAGES_DIR', os.path.join(app.static_folder, 'Uploads', 'header'))
+        app.config.setdefault('HEADER_IMAGES_MANIFEST', os.path.join(app.instance_path, 'header_manifest.json'))
+        app.config.setdefault('HEADER_IMAGES_SIZES', dict(DEFAULT_SIZES))
+        app.config.setdefault('HEADER_IMAGES_CHECK_INTERVAL', 10)
+        self.app = app
+        self.directory = app.config['HEADER_IMAGES_DIR']
+        self.manifest_path = app.config['HEADER_IMAGES_MANIFEST']
+        self.sizes = app.config['HEADER_IMAGES_SIZES']
+        self.interval = app.config['HEADER_IMAGES_CHECK_INTERVAL']
+        # Pfad für url_for('static', ...), z. B. 'Uploads/header'
+        self.static_prefix = os.path.relpath(self.directory, app.static_folder).replace(os.sep, '/')
+        self._variant = re.compile(r'\.(?:%s)\.(?:%s)$' % (
+            '|'.join(map(re.escape, self.sizes)), '|'.join(EXTENSIONS.values())))
+        app.add_template_global(self.srcset, 'header_srcset')
+
+    # --- Lesen ---
+
+    def get(self):
+        """Liste der Header-Bilder: {'datei', 'breite', 'hoehe', 'farbe', 'varianten'}"""
+        return self._current()['bilder']
+
+    @property
+    def version(self):
+        """Ändert sich mit jeder Änderung der Originale und nach dem Aufbau, für Cache-Schlüssel"""
+        manifest = self._current()
+        return manifest['signatur'] + ('' if manifest['vollstaendig'] else '-vorlaeufig')
+
+    def _current(self):
+        now = time.monotonic()
+        manifest = self._manifest
+        if manifest is not None and now - self._checked < self.interval:
+            return manifest
+        self._checked = now
+        files = self._scan()
+        signatur = self._signature(files)
+        if manifest is None or manifest.get('signatur') != signatur:
+            with self._lock:
+                manifest = self._manifest
+                if manifest is None:
+                    manifest = self._load()
+                if manifest is None or manifest.get('signatur') != signatur:
+                    manifest = self._preliminary(files, signatur, manifest)
+                self._manifest = manifest
+        if not manifest['vollstaendig']:
+            self._start_build()
+        return manifest
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('sizes') != self.sizes:
+            return None
+        manifest.setdefault('vollstaendig', True)
+        return manifest
+
+    # --- Stand der Originale ---
+
+    def _scan(self):
+        """Originale mit (Größe, mtime_ns), Varianten zählen nicht"""
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return {}
+        files = {}
+        for entry in entries:
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or self._variant.search(entry.name):
+                continue
+            try:
+                info = entry.stat()
+            except OSError:
+                continue
+            files[entry.name] = (info.st_size, info.st_mtime_ns)
+        return files
+
+    @staticmethod
+    def _signature(files):
+        payload = json.dumps(sorted(files.items()), separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def _entry(self, name, size, mtime, meta):
+        return {
+            'name': name,
+            'datei': f"{self.static_prefix}/{name}",
+            'groesse': size,
+            'geaendert': mtime,
+            'breite': meta.get('breite'),
+            'hoehe': meta.get('hoehe'),
+            'farbe': meta.get('farbe'),
+            'varianten': meta.get('varianten'),
+        }
+
+    def _preliminary(self, files, signatur, previous=None):
+        """Manifest ohne Bildzugriff: unveränderte Einträge aus previous, neue ohne Maße und Varianten"""
+        known = {bild['name']: bild for bild in (previous or {}).get('bilder', [])}
+        bilder = []
+        for name, (size, mtime) in sorted(files.items()):
+            bild = known.get(name)
+            if bild is None or (bild['groesse'], bild['geaendert']) != (size, mtime):
+                # geaendert=None: build() erzeugt die Varianten in jedem Fall
+                bild = self._entry(name, size, None, {})
+            bilder.append(bild)
+        vollstaendig = all(bild['geaendert'] is not None for bild in bilder) and set(known) <= set(files)
+        return {'signatur': signatur, 'sizes': self.sizes, 'bilder': bilder, 'vollstaendig': vollstaendig}
+
+    # --- Aufbauen ---
+
+    def _start_build(self):
+        # Höchstens ein Aufbau je Prozess, außerhalb des Requests
+        with self._lock:
+            if self._builder is not None and self._builder_pid == os.getpid() and self._builder.is_alive():
+                return
+            self._builder_pid = os.getpid()
+            self._builder = threading.Thread(target=self._build_in_background, name='header-images', daemon=True)
+            self._builder.start()
+
+    def _build_in_background(self):
+        try:
+            # Vorgänger ist das zuletzt geschriebene, vollständige Manifest (für das Aufräumen der Varianten)
+            manifest = self.build(self._load())
+        except Exception as e:
+            self.app.logger.error(f"Header-Manifest konnte nicht aufgebaut werden: {e}")
+            return
+        with self._lock:
+            self._manifest = manifest
+            self._checked = time.monotonic()
+
+    def build(self, previous=None):
+        """Liest das Verzeichnis, erzeugt fehlende Varianten und schreibt das Manifest"""
+        known = {bild['name']: bild for bild in (previous or {}).get('bilder', [])}
+        files = self._scan()
+        bilder = []
+        for name, (size, mtime) in sorted(files.items()):
+            bild = known.pop(name, None)
+            if bild is None or (bild['groesse'], bild['geaendert']) != (size, mtime):
+                meta = image_derivatives.generate(self.directory, name, sizes=self.sizes) or {}
+                bild = self._entry(name, size, mtime, meta)
+            bilder.append(bild)
+        # Varianten entfernter Bilder gehören zu keinem Original mehr
+        for bild in known.values():
+            image_derivatives.remove(self.directory, variant_files(bild['varianten']))
+
+        manifest = {'signatur': self._signature(files), 'sizes': self.sizes, 'bilder': bilder, 'vollstaendig': True}
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            # Eindeutig je Thread: Hintergrund-Aufbau und 'flask header-bilder' können zugleich schreiben
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            self.app.logger.warning(f"Header-Manifest {self.manifest_path} nicht schreibbar: {e}")
+        return manifest
+
+    def rebuild(self):
+        manifest = self.build(self._load())
+        with self._lock:
+            self._manifest = manifest
+            self._checked = time.monotonic()
+        return manifest['bilder']
+
+    # --- Templates ---
+
+    def srcset(self, bild, fmt='jpeg'):
+        """srcset über alle Größen eines Formats, leer ohne Varianten"""
+        breiten = {variante[fmt]: variante['breite'] for variante in (bild['varianten'] or {}).values() if variante.get(fmt)}
+        return ', '.join(
+            f"{static_assets.url(self.static_prefix + '/' + name)} {breite}w"
+            for name, breite in sorted(breiten.items(), key=lambda item: item[1])
+        )
+
+
+# Singleton-Instanz
+header_images = HeaderImages()
@@ -0,0 +1,156 @@
+"""
+Bildvarianten für Galerie- und Header-Bilder
+
+Aus jedem Original entstehen verkleinerte Fassungen (thumb, medium) als JPEG
+sowie als WebP und AVIF, sofern Pillow diese Formate schreiben kann. Die
+EXIF-Ausrichtung wird vorher angewendet, die Varianten enthalten keine
+EXIF-Daten mehr. Sie liegen neben dem Original ('<name>.thumb.webp' usw.);
+die Beschreibung (Maße, Dateinamen) wird als JSON am Bild gespeichert.
+
+Pillow wird erst bei der ersten Erzeugung importiert. Fehlt es, bleibt es
+beim Original und die Templates fallen auf dieses zurück.
+"""
+import os
+import threading
+
+# Breite in Pixeln, Varianten werden nie vergrößert
+DEFAULT_SIZES = {'thumb': 400, 'medium': 1200}
+# Reihenfolge = Bevorzugung im <picture>-Element
+DEFAULT_FORMATS = ('avif', 'webp')
+DEFAULT_QUALITY = {'jpeg': 82, 'webp': 80, 'avif': 60}
+
+MIME_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'avif': 'image/avif'}
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'avif': 'avif'}
+PIL_FORMATS = {'jpeg': 'JPEG', 'webp': 'WEBP', 'avif': 'AVIF'}
+
+_pil = None
+_pil_lock = threading.Lock()
+
+
+def _load_pil():
+    """Liefert (Image, ImageOps, features) oder None, wenn Pillow fehlt"""
+    global _pil
+    if _pil is None:
+        with _pil_lock:
+            if _pil is None:
+                try:
+                    from PIL import Image, ImageOps, features
+                except ImportError:
+                    _pil = False
+                else:
+                    _pil = (Image, ImageOps, features)
+    return _pil or None
+
+
+def variant_name(filename, size, fmt):
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}.{size}.{EXTENSIONS[fmt]}"
+
+
+def dominant_color(image):
+    """Häufigste Farbe des auf 8 Farben reduzierten Bildes als '#rrggbb' (Platzhalter beim Laden)"""
+    small = image.convert('RGB')
+    small.thumbnail((64, 64))
+    quantized = small.quantize(colors=8)
+    _, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def variant_files(varianten):
+    """Alle Dateinamen aus einer gespeicherten Variantenbeschreibung {Größe: {...}}"""
+    names = {variant[fmt] for variant in (varianten or {}).values() for fmt in EXTENSIONS if variant.get(fmt)}
+    return sorted(names)
+
+
+class ImageDerivatives:
+    def __init__(self, app=None):
+        self.sizes = dict(DEFAULT_SIZES)
+        self.formats = DEFAULT_FORMATS
+        self.quality = dict(DEFAULT_QUALITY)
+        self.logger = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_DERIVATIVE_SIZES', dict(DEFAULT_SIZES))
+        app.config.setdefault('IMAGE_DERIVATIVE_FORMATS', DEFAULT_FORMATS)
+        app.config.setdefault('IMAGE_DERIVATIVE_QUALITY', dict(DEFAULT_QUALITY))
+        self.sizes = app.config['IMAGE_DERIVATIVE_SIZES']
+        self.formats = tuple(app.config['IMAGE_DERIVATIVE_FORMATS'])
+        self.quality = app.config['IMAGE_DERIVATIVE_QUALITY']
+        self.logger = app.logger
+
+    def available_formats(self):
+        """Konfigurierte Formate, die das installierte Pillow schreiben kann"""
+        pil = _load_pil()
+        if pil is None:
+            return ()
+        features = pil[2]
+        return tuple(fmt for fmt in self.formats if features.check(fmt))
+
+    def generate(self, directory, filename, sizes=None):
+        """Erzeugt alle Varianten zu directory/filename.
+
+        Liefert die Beschreibung {'breite', 'hoehe', 'farbe', 'varianten': {Größe:
+        {'breite', 'hoehe', 'jpeg', 'webp', 'avif'}}} oder None, wenn das Bild nicht
+        lesbar ist oder Pillow fehlt. sizes ersetzt IMAGE_DERIVATIVE_SIZES.
+        """
+        pil = _load_pil()
+        if pil is None:
+            self.logger.warning("Pillow ist nicht installiert, es werden keine Bildvarianten erzeugt")
+            return None
+        Image, ImageOps, _ = pil
+        formats = ('jpeg',) + self.available_formats()
+        path = os.path.join(directory, filename)
+        written = []
+        try:
+            with Image.open(path) as original:
+                image = ImageOps.exif_transpose(original)
+                if image.mode not in ('RGB', 'L'):
+                    # Transparenz auf Weiß, JPEG kennt keinen Alphakanal
+                    background = Image.new('RGB', image.size, (255, 255, 255))
+                    rgba = image.convert('RGBA')
+                    background.paste(rgba, mask=rgba.getchannel('A'))
+                    image = background
+                meta = {'breite': image.width, 'hoehe': image.height,
+                        'farbe': dominant_color(image), 'varianten': {}}
+                full_size = None
+                for size, width in sorted((sizes or self.sizes).items(), key=lambda item: item[1]):
+                    if width >= image.width and full_size is not None:
+                        # Kleiner als beide Größen: Dateien der ersten Variante mitbenutzen
+                        meta['varianten'][size] = full_size
+                        continue
+                    if width < image.width:
+                        height = max(1, round(image.height * width / image.width))
+                        resized = image.resize((width, height), Image.LANCZOS)
+                    else:
+                        resized = image
+                    variant = {'breite': resized.width, 'hoehe': resized.height}
+                    for fmt in formats:
+                        name = variant_name(filename, size, fmt)
+                        resized.save(os.path.join(directory, name), PIL_FORMATS[fmt],
+                                     quality=self.quality.get(fmt, 80), optimize=fmt == 'jpeg')
+                        written.append(name)
+                        variant[fmt] = name
+                    meta['varianten'][size] = variant
+                    if resized is image:
+                        full_size = variant
+                return meta
+        except Exception as e:
+            self.logger.error(f"Bildvarianten für {filename} konnten nicht erzeugt werden: {e}")
+            self.remove(directory, written)
+            return None
+
+    def remove(self, directory, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.logger.error(f"Bildvariante {name} konnte nicht gelöscht werden: {e}")
+
+
+# Singleton-Instanz
+image_derivatives = ImageDerivatives()
@@ -0,0 +1,124 @@
+"""
+Volltextsuche über die Namen im ahde_vefa-Register (SQLite FTS5)
+
+Die Namen werden in einer FTS5-Schattentabelle indiziert, die Trigger bei
+jedem Insert, Update und Delete auf ahde_vefa mitpflegen. Der Tokenizer
+entfernt Akzente (ü -> u, ş -> s, ç -> c, ğ -> g); was er nicht faltet
+(türkisches ı/İ, deutsches ß), ersetzt schon der Trigger. Suchbegriffe werden
+identisch normalisiert und als Präfixe gesucht, sortiert nach bm25.
+
+Ohne FTS5 (andere Datenbank als SQLite oder SQLite ohne FTS5) bleibt es bei
+der früheren LIKE-Suche über den Namen.
+"""
+import re
+
+from sqlalchemy import column, table, text
+
+FTS_TABLE = 'ahde_vefa_fts'
+
+# Zeichen, die unicode61 mit remove_diacritics nicht auf ASCII faltet
+FOLD = (('ı', 'i'), ('İ', 'i'), ('ß', 'ss'), ('ẞ', 'ss'))
+
+# Leichtgewichtige Tabellen-Beschreibung für Joins, bewusst nicht in db.metadata
+fts = table(FTS_TABLE, column('rowid'), column('rank'), column(FTS_TABLE))
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def _fold_sql(expression):
+    for source, target in FOLD:
+        expression = f"replace({expression}, '{source}', '{target}')"
+    return expression
+
+
+def normalize(value):
+    for source, target in FOLD:
+        value = value.replace(source, target)
+    return value
+
+
+def match_query(search):
+    """Baut aus einer Eingabe wie 'Müll ahm' die FTS5-Abfrage '"Mull"* "ahm"*'.
+
+    Jedes Wort wird als Präfix gesucht, alle Wörter müssen vorkommen.
+    Liefert None, wenn kein Suchwort übrig bleibt.
+    """
+    tokens = _TOKEN.findall(normalize(search or ''))
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+class MemorialSearch:
+    def __init__(self, app=None, db=None):
+        self.db = None
+        self.logger = None
+        # Erst nach erfolgreichem Anlegen von Index und Triggern
+        self.available = False
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """Legt Index und Trigger an und baut den Index neu auf, wenn er nicht zum Register passt"""
+        self.db = db
+        self.logger = app.logger
+        self.available = False
+        with app.app_context():
+            if db.engine.dialect.name != 'sqlite':
+                app.logger.info("Volltextindex für ahde_vefa nur unter SQLite, Namenssuche per LIKE")
+                return
+            try:
+                self._create(db)
+            except Exception as e:
+                app.logger.error(f"Volltextindex für ahde_vefa nicht verfügbar, Namenssuche per LIKE: {e}")
+                return
+            self.available = True
+
+    def _create(self, db):
+        name = _fold_sql('new.name')
+        statements = [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, tokenize = 'unicode61 remove_diacritics 2')",
+            f"CREATE TRIGGER IF NOT EXISTS ahde_vefa_fts_insert AFTER INSERT ON ahde_vefa BEGIN "
+            f"INSERT INTO {FTS_TABLE} (rowid, name) VALUES (new.id, {name}); END",
+            f"CREATE TRIGGER IF NOT EXISTS ahde_vefa_fts_delete AFTER DELETE ON ahde_vefa BEGIN "
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END",
+            f"CREATE TRIGGER IF NOT EXISTS ahde_vefa_fts_update AFTER UPDATE OF id, name ON ahde_vefa BEGIN "
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; "
+            f"INSERT INTO {FTS_TABLE} (rowid, name) VALUES (new.id, {name}); END",
+        ]
+        with db.engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+            indexed = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+            total = conn.execute(text("SELECT count(*) FROM ahde_vefa")).scalar()
+            if indexed != total:
+                self._rebuild(conn)
+                self.logger.info(f"Volltextindex ahde_vefa neu aufgebaut ({total} Einträge)")
+
+    def _rebuild(self, conn):
+        conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, name) SELECT id, {_fold_sql('name')} FROM ahde_vefa"))
+
+    def rebuild(self):
+        with self.db.engine.begin() as conn:
+            self._rebuild(conn)
+
+    def filter(self, query, id_column, name_column, search):
+        """Schränkt eine Abfrage auf Treffer ein und sortiert nach Relevanz (bm25).
+
+        Ohne verwertbare Suchwörter bleibt die Abfrage leer. Ohne Index sucht
+        LIKE nach dem Begriff im Namen, sortiert nach Name.
+        """
+        if not self.available:
+            return query.filter(name_column.contains(search)).order_by(name_column, id_column)
+        match = match_query(search)
+        if match is None:
+            return query.filter(text('0'))
+        return (query.join(fts, fts.c.rowid == id_column)
+                .filter(fts.c[FTS_TABLE].op('MATCH')(match))
+                .order_by(fts.c.rank, id_column))
+
+
+# Singleton-Instanz
+memorial_search = MemorialSearch()
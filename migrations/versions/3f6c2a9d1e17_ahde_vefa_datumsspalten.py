@@ -0,0 +1,139 @@
+"""ahde_vefa: Datumsspalten als Date, Jahres-Spalten und Übernahme alter Textdaten
+
+Bis hierher waren birth_date und death_date String(20) mit Texten in
+verschiedenen Schreibweisen. Die Werte werden in Python gelesen
+(sterbestatistik.parse_flexible_date), als 'JJJJ-MM-TT' zurückgeschrieben und
+die Jahres-Spalten gefüllt; nicht lesbare Werte landen in date_note. Erst
+danach wechseln die Spalten den Typ, unter PostgreSQL per ALTER ... USING,
+unter SQLite durch Neuanlegen der Tabelle (die FTS-Trigger aus
+memorial_search legt der nächste Start wieder an).
+
+Läuft auch auf einer von create_all angelegten Datenbank und ändert dort nur,
+was fehlt.
+
+Revision ID: 3f6c2a9d1e17
+Revises:
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+import sterbestatistik
+
+logger = logging.getLogger('alembic.env')
+
+# revision identifiers, used by Alembic.
+revision = '3f6c2a9d1e17'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+DATE_COLUMNS = ('birth_date', 'death_date')
+NEW_COLUMNS = (('birth_year', sa.Integer()), ('death_year', sa.Integer()), ('date_note', sa.String(100)))
+INDEXES = (('ix_ahde_vefa_birth_year', 'birth_year'), ('ix_ahde_vefa_death_year', 'death_year'),
+           ('ix_ahde_vefa_death_date', 'death_date'))
+
+
+def _ahde_vefa(date_type):
+    return sa.table('ahde_vefa', sa.column('id', sa.Integer), sa.column('birth_date', date_type),
+                    sa.column('death_date', date_type), sa.column('birth_year', sa.Integer),
+                    sa.column('death_year', sa.Integer), sa.column('date_note', sa.String))
+
+
+def _pending_updates(bind, date_type):
+    """Liest alle Einträge und liefert die Zeilen, deren Datum, Jahr oder Notiz sich ändert"""
+    ahde_vefa = _ahde_vefa(date_type)
+    as_date = isinstance(date_type, sa.Date)
+    updates = []
+    for row in bind.execute(sa.select(ahde_vefa).order_by(ahde_vefa.c.id)):
+        values = {'row_id': row.id, 'date_note': row.date_note}
+        unreadable = []
+        for label, name in (('Geburt', 'birth_date'), ('Tod', 'death_date')):
+            raw = getattr(row, name)
+            date, year = sterbestatistik.parse_flexible_date(raw)
+            if raw is not None and str(raw).strip() and year is None:
+                unreadable.append(f"{label}: {raw}")
+            values[name] = date if as_date or date is None else date.isoformat()
+            values[name.replace('_date', '_year')] = year
+        if unreadable:
+            logger.warning(f"ahde_vefa {row.id}: Datum nicht lesbar ({'; '.join(unreadable)})")
+            values['date_note'] = '; '.join(filter(None, [row.date_note, *unreadable]))[:100]
+        current = (row.birth_date, row.death_date, row.birth_year, row.death_year, row.date_note)
+        if current != tuple(values[name] for name in ('birth_date', 'death_date', 'birth_year',
+                                                      'death_year', 'date_note')):
+            updates.append(values)
+    return updates
+
+
+def _rebuild_year_table(bind):
+    """Zählt ahde_vefa_jahr aus den Jahres-Spalten neu (falls die Tabelle schon existiert)"""
+    if not sa.inspect(bind).has_table('ahde_vefa_jahr'):
+        return
+    ahde_vefa = _ahde_vefa(sa.String)
+    jahre = sa.table('ahde_vefa_jahr', sa.column('year', sa.Integer), sa.column('geburten', sa.Integer),
+                     sa.column('tode', sa.Integer))
+    totals = {}
+    for column, index in ((ahde_vefa.c.birth_year, 0), (ahde_vefa.c.death_year, 1)):
+        for year, count in bind.execute(sa.select(column, sa.func.count()).where(column.isnot(None))
+                                        .group_by(column)):
+            totals.setdefault(year, [0, 0])[index] = count
+    bind.execute(jahre.delete())
+    if totals:
+        bind.execute(jahre.insert(), [{'year': year, 'geburten': births, 'tode': deaths}
+                                      for year, (births, deaths) in totals.items()])
+
+
+def _change_date_type(bind, new_type, postgresql_using):
+    if bind.dialect.name == 'sqlite':
+        # Tabelle mit neuem Spaltentyp anlegen und die Werte unverändert kopieren;
+        # alter_column würde per CAST(... AS DATE) aus '1950-03-02' die Zahl 1950 machen
+        table = sa.Table('ahde_vefa', sa.MetaData(), autoload_with=bind)
+        for name in DATE_COLUMNS:
+            table.c[name].type = new_type
+        with op.batch_alter_table('ahde_vefa', copy_from=table, recreate='always'):
+            pass
+        return
+    for name in DATE_COLUMNS:
+        op.alter_column('ahde_vefa', name, type_=new_type, postgresql_using=postgresql_using.format(name=name))
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table('ahde_vefa'):
+        # Neue Datenbank: create_all legt die Tabelle gleich mit Date-Spalten an
+        return
+    columns = {column['name']: column['type'] for column in inspector.get_columns('ahde_vefa')}
+    for name, type_ in NEW_COLUMNS:
+        if name not in columns:
+            op.add_column('ahde_vefa', sa.Column(name, type_, nullable=True))
+
+    # Erst die Werte vereinheitlichen, dann den Typ ändern: danach ist jeder Wert ein gültiges Datum
+    is_date = all(isinstance(columns[name], sa.Date) for name in DATE_COLUMNS)
+    date_type = sa.Date() if is_date else sa.String(20)
+    updates = _pending_updates(bind, date_type)
+    if updates:
+        ahde_vefa = _ahde_vefa(date_type)
+        bind.execute(ahde_vefa.update().where(ahde_vefa.c.id == sa.bindparam('row_id')), updates)
+        logger.info(f"ahde_vefa: {len(updates)} Datumsangaben übernommen")
+    if not is_date:
+        _change_date_type(bind, sa.Date(), '{name}::date')
+
+    existing = {index['name'] for index in sa.inspect(bind).get_indexes('ahde_vefa')}
+    for index_name, column in INDEXES:
+        if index_name not in existing:
+            op.create_index(index_name, 'ahde_vefa', [column])
+    _rebuild_year_table(bind)
+
+
+def downgrade():
+    bind = op.get_bind()
+    for index_name, _ in INDEXES:
+        op.drop_index(index_name, table_name='ahde_vefa')
+    _change_date_type(bind, sa.String(20), "to_char({name}, 'YYYY-MM-DD')")
+    with op.batch_alter_table('ahde_vefa') as batch:
+        for name, _ in NEW_COLUMNS:
+            batch.drop_column(name)
@@ -30,12 +30,19 @@ class BlogPost(db.Model):
     content = db.Column(db.Text, nullable=False)
     summary = db.Column(db.String(200))
     image_url = db.Column(db.String(255))
+    # Bild aus dem Formular-Upload (blog_new_post), Pfad relativ zum Upload-Ordner
+    image = db.Column(db.String(200))
     published = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Foreign key to User
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    # Deckt die Sortierung (created_at, id) der Keyset-Pagination ab
+    __table_args__ = (
+        db.Index('ix_blog_post_created_at_id', 'created_at', 'id'),
+    )
     
     def __repr__(self):
         return f'<BlogPost {self.title}>'
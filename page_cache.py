@@ -0,0 +1,60 @@
+"""
+In-Process-Cache für fertig gerenderte Seiten (z. B. die Startseite)
+"""
+import threading
+import time
+
+
+class PageCache:
+    """Speichert gerenderte HTML-Bodies pro Schlüssel mit Ablaufzeit.
+
+    ``invalidate()`` erhöht die Inhaltsversion, dadurch werden alle
+    bisherigen Einträge ungültig, ohne dass Leser gesperrt werden.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.max_entries = 256
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_TTL', 60)
+        app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 256)
+        self.ttl = app.config['PAGE_CACHE_TTL']
+        self.max_entries = app.config['PAGE_CACHE_MAX_ENTRIES']
+
+    def get(self, key):
+        entry = self._entries.get((self.version, key))
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, body):
+        if not self.ttl:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Abgelaufene und veraltete Versionen zuerst entfernen, sonst den ältesten Eintrag
+                live = {k: v for k, v in self._entries.items() if k[0] == self.version and v[0] >= now}
+                if len(live) >= self.max_entries:
+                    live.pop(min(live, key=lambda k: live[k][0]))
+                self._entries = live
+            self._entries[(self.version, key)] = (now + self.ttl, body)
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries = {}
+
+
+# Singleton-Instanz
+page_cache = PageCache()
@@ -0,0 +1,50 @@
+"""
+Keyset-Pagination (Cursor aus Sortierspalte + ID statt OFFSET)
+"""
+import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(value, row_id):
+    """Cursor als lesbarer String: '<Sortierwert>~<id>'"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    return f"{value}~{row_id}"
+
+
+def decode_cursor(cursor, parse=datetime.datetime.fromisoformat):
+    """Zerlegt einen Cursor, wirft ValueError bei ungültigem Format"""
+    value, sep, row_id = (cursor or '').rpartition('~')
+    if not sep:
+        raise ValueError(f"Ungültiger Cursor: {cursor}")
+    return parse(value), int(row_id)
+
+
+def keyset_page(query, sort_column, id_column, cursor=None, limit=10, descending=True, parse=datetime.datetime.fromisoformat):
+    """Liefert (Einträge, nächster Cursor oder None).
+
+    Sortiert nach (sort_column, id_column) und setzt nach dem Cursor fort.
+    Mit einem passenden Index auf beide Spalten ist jede Seite ein Index-Seek,
+    unabhängig davon, wie weit geblättert wurde.
+    """
+    if cursor:
+        value, row_id = decode_cursor(cursor, parse)
+        if descending:
+            query = query.filter(or_(sort_column < value, and_(sort_column == value, id_column < row_id)))
+        else:
+            query = query.filter(or_(sort_column > value, and_(sort_column == value, id_column > row_id)))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    # Ein Eintrag mehr laden, um zu wissen, ob es eine weitere Seite gibt
+    items = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return items, next_cursor
@@ -1,110 +1,419 @@
 from flask import current_app
 import os
+import sys
+import mmap
+import struct
+import hashlib
 import datetime
+import threading
+import time
+from array import array
+from bisect import bisect_left
 
 LOCAL_TIME_OFFSET = datetime.timedelta(hours=2)
 
+# Reihenfolge der Spalten in gb.txt
+PRAYER_NAMES = ("fajr", "sunrise", "dhuhr", "asr", "maghrib", "isha")
+SLOTS = len(PRAYER_NAMES)
+# Markiert Tage ohne Eintrag in der Tabelle
+MISSING = -1
+# Maximaler Abstand in Tagen für geschätzte Zeiten
+MAX_FALLBACK_DAYS = 7
+
+# Vorberechnete "HH:MM"-Strings, damit pro Abfrage keine Formatierung nötig ist
+_TIME_STRINGS = tuple(f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60))
+
+
+def parse_minutes(value):
+    """Wandelt 'HH:MM' in Minuten seit Mitternacht um"""
+    hours, _, minutes = value.partition(':')
+    if not minutes:
+        raise ValueError(f"Ungültige Uhrzeit: {value}")
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minutes(minutes):
+    """Wandelt Minuten seit Mitternacht zurück in 'HH:MM'"""
+    if 0 <= minutes < len(_TIME_STRINGS):
+        return _TIME_STRINGS[minutes]
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_date_ordinal(value):
+    """Schnelles Parsen von 'YYYY-MM-DD' ohne strptime"""
+    if len(value) != 10 or value[4] != '-' or value[7] != '-':
+        raise ValueError(f"Ungültiges Datum: {value}")
+    return datetime.date(int(value[:4]), int(value[5:7]), int(value[8:])).toordinal()
+
+
+class PrayerTimeTable:
+    """Kompakte Gebetszeiten-Tabelle.
+
+    Die Zeiten liegen als Minuten seit Mitternacht in einem flachen Array,
+    indiziert über den Tages-Ordinalwert (``date.toordinal()``). ``ordinals``
+    enthält die sortierten Tage mit Eintrag für die Suche nach dem nächsten Tag.
+    """
+
+    __slots__ = ("first_ordinal", "minutes", "ordinals", "version")
+
+    def __init__(self, first_ordinal=0, minutes=None, ordinals=None, version=''):
+        self.first_ordinal = first_ordinal
+        self.minutes = minutes if minutes is not None else array('h')
+        self.ordinals = ordinals if ordinals is not None else array('i')
+        # Kurzform der Prüfsumme von gb.txt, Grundlage für ETags
+        self.version = version
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Baut die Tabelle aus (ordinal, [6 Minutenwerte]) Paaren"""
+        rows = list(rows)
+        if not rows:
+            return cls()
+        first = min(row[0] for row in rows)
+        last = max(row[0] for row in rows)
+        minutes = array('h', [MISSING]) * ((last - first + 1) * SLOTS)
+        for ordinal, values in rows:
+            offset = (ordinal - first) * SLOTS
+            minutes[offset:offset + SLOTS] = array('h', values)
+        ordinals = array('i', sorted({row[0] for row in rows}))
+        return cls(first, minutes, ordinals)
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def __contains__(self, date):
+        return self._offset(date.toordinal()) is not None
+
+    def _offset(self, ordinal):
+        index = ordinal - self.first_ordinal
+        if index < 0:
+            return None
+        offset = index * SLOTS
+        if offset >= len(self.minutes) or self.minutes[offset] == MISSING:
+            return None
+        return offset
+
+    def minutes_for(self, date):
+        """Liefert die sechs Minutenwerte eines Tages oder None"""
+        offset = self._offset(date.toordinal())
+        if offset is None:
+            return None
+        return tuple(self.minutes[offset:offset + SLOTS])
+
+    def get(self, date):
+        """Liefert die Zeiten eines Tages als Dict mit 'HH:MM'-Strings oder None"""
+        offset = self._offset(date.toordinal())
+        if offset is None:
+            return None
+        return self._as_dict(offset)
+
+    def nearest(self, date, max_distance=MAX_FALLBACK_DAYS):
+        """Sucht per Binärsuche den nächsten Tag mit Eintrag (bei Gleichstand den früheren)"""
+        if not self.ordinals:
+            return None
+        ordinal = date.toordinal()
+        pos = bisect_left(self.ordinals, ordinal)
+        candidates = []
+        if pos > 0:
+            candidates.append(self.ordinals[pos - 1])
+        if pos < len(self.ordinals):
+            candidates.append(self.ordinals[pos])
+        best = None
+        for candidate in candidates:
+            distance = abs(candidate - ordinal)
+            if distance <= max_distance and (best is None or distance < abs(best - ordinal)):
+                best = candidate
+        if best is None:
+            return None
+        return datetime.date.fromordinal(best)
+
+    def iter_rows(self, start, end):
+        """Liefert [Datum, fajr, ..., isha] für alle Tage mit Eintrag im Bereich"""
+        first = max(start.toordinal(), self.first_ordinal)
+        last = min(end.toordinal(), self.first_ordinal + len(self.minutes) // SLOTS - 1)
+        minutes = self.minutes
+        for ordinal in range(first, last + 1):
+            offset = (ordinal - self.first_ordinal) * SLOTS
+            if minutes[offset] == MISSING:
+                continue
+            row = [datetime.date.fromordinal(ordinal).isoformat()]
+            row.extend(map(format_minutes, minutes[offset:offset + SLOTS]))
+            yield row
+
+    def _as_dict(self, offset):
+        return dict(zip(PRAYER_NAMES, map(format_minutes, self.minutes[offset:offset + SLOTS])))
+
+
+def parse_table(lines, logger):
+    """Baut aus den Zeilen von gb.txt eine PrayerTimeTable"""
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        try:
+            # Beispiel-Format: 2024-01-01 05:30 07:15 12:45 15:30 17:45 19:30
+            parts = line.split()
+            if len(parts) >= 7:
+                rows.append((
+                    parse_date_ordinal(parts[0]),
+                    [parse_minutes(value) for value in parts[1:7]],
+                ))
+        except (ValueError, IndexError) as e:
+            logger.warning(f"Ungültige Zeile in gb.txt: {line} - Fehler: {e}")
+            continue
+    return PrayerTimeTable.from_rows(rows)
+
+
+def load_table(file_path, logger):
+    """Liest gb.txt ein und liefert eine PrayerTimeTable"""
+    with open(file_path, "r", encoding="utf-8") as file:
+        return parse_table(file, logger)
+
+
+def read_source(file_path):
+    """Liest gb.txt genau einmal: (stat, Inhalt, sha256 des Inhalts).
+
+    stat kommt vom geöffneten Handle vor dem Lesen. Wird die Datei währenddessen
+    ersetzt oder weitergeschrieben, passt sie danach nicht mehr zu stat und
+    Prüfsumme, und open_compiled verwirft den Cache.
+    """
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        data = f.read()
+    return stat, data, hashlib.sha256(data).digest()
+
+
+# Binärformat der kompilierten Tabelle (gb.bin):
+# Header | minutes (int16, native) | ordinals (int32, native)
+CACHE_MAGIC = b'GBT1'
+CACHE_HEADER = struct.Struct('<4scxxxqq32siII')
+_BYTEORDER = b'L' if sys.byteorder == 'little' else b'B'
+
+
+def file_checksum(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha.digest()
+
+
+def write_compiled(table, source_stat, checksum, cache_path):
+    """Schreibt die Tabelle atomar als Binärdatei neben die Quelle-Metadaten.
+
+    source_stat und checksum müssen zu den Bytes gehören, aus denen table
+    gebaut wurde (siehe read_source), nicht zum aktuellen Stand der Datei.
+    """
+    header = CACHE_HEADER.pack(
+        CACHE_MAGIC, _BYTEORDER, source_stat.st_mtime_ns, source_stat.st_size,
+        checksum, table.first_ordinal,
+        len(table.minutes), len(table.ordinals),
+    )
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(array('h', table.minutes).tobytes())
+        f.write(array('i', table.ordinals).tobytes())
+    # os.replace ist atomar, parallel startende Worker sehen nie eine halbe Datei
+    os.replace(tmp_path, cache_path)
+
+
+def open_compiled(source_path, cache_path):
+    """Bildet gb.bin read-only in den Speicher ab.
+
+    Liefert None, wenn die Datei fehlt, beschädigt ist oder nicht mehr zur
+    Quelle passt. Bei geänderter mtime/Größe entscheidet die Prüfsumme.
+    """
+    try:
+        with open(cache_path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(buffer) < CACHE_HEADER.size:
+        buffer.close()
+        return None
+    (magic, byteorder, mtime_ns, size, checksum,
+     first_ordinal, n_minutes, n_ordinals) = CACHE_HEADER.unpack_from(buffer)
+    expected_size = CACHE_HEADER.size + n_minutes * 2 + n_ordinals * 4
+    if magic != CACHE_MAGIC or byteorder != _BYTEORDER or len(buffer) != expected_size:
+        buffer.close()
+        return None
+
+    stat = os.stat(source_path)
+    if (stat.st_mtime_ns, stat.st_size) != (mtime_ns, size) and file_checksum(source_path) != checksum:
+        buffer.close()
+        return None
+
+    view = memoryview(buffer)
+    start = CACHE_HEADER.size
+    minutes = view[start:start + n_minutes * 2].cast('h')
+    start += n_minutes * 2
+    ordinals = view[start:start + n_ordinals * 4].cast('i')
+    return PrayerTimeTable(first_ordinal, minutes, ordinals, checksum.hex()[:16])
+
+
 # Klassenbasierte Lösung
 class PrayerTimes:
     def __init__(self, app=None):
-        self.data = {}
+        self.table = PrayerTimeTable()
+        # Anzahl erfolgreicher Neuladungen seit dem Start
+        self.reload_count = 0
+        self._source_key = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
         if app:
             self.init_app(app)
-    
+
     def init_app(self, app):
         self.app = app
-        self.data = self._load_data()
-        
+        app.config.setdefault('PRAYER_TIMES_CACHE', os.path.join(app.instance_path, 'gb.bin'))
+        # Sekunden zwischen zwei stat()-Prüfungen von gb.txt, 0 deaktiviert das Neuladen
+        app.config.setdefault('PRAYER_TIMES_RELOAD_INTERVAL', 60)
+        self.table = self._load_data()
+        self._schedule_next_check()
+
+    def _schedule_next_check(self):
+        self._next_check = time.monotonic() + (self.app.config['PRAYER_TIMES_RELOAD_INTERVAL'] or 0)
+
+    def _maybe_reload(self):
+        """Startet höchstens einmal pro Intervall eine Prüfung im Hintergrund.
+
+        Der Lesepfad vergleicht nur einen Zeitstempel; stat(), Parsen und
+        Kompilieren laufen im Thread, die fertige Tabelle wird per einfacher
+        Zuweisung ausgetauscht.
+        """
+        if not self.app.config['PRAYER_TIMES_RELOAD_INTERVAL'] or time.monotonic() < self._next_check:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        self._schedule_next_check()
+        threading.Thread(target=self._reload_in_background, name='prayer-times-reload', daemon=True).start()
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        finally:
+            self._reload_lock.release()
+
+    def reload(self, force=False):
+        """Lädt gb.txt neu, wenn sich die Datei geändert hat. Liefert True bei Austausch."""
+        file_path = self.resolve_path()
+        if file_path is None:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        if not force and (stat.st_mtime_ns, stat.st_size) == self._source_key:
+            return False
+
+        table = self._load_data()
+        if not table:
+            # Fehlerhafte Datei: alte Tabelle behalten
+            self.app.logger.warning("Neue gb.txt enthält keine gültigen Zeilen, alte Gebetszeiten bleiben aktiv")
+            return False
+        self.table = table
+        self.reload_count += 1
+        self.app.logger.info(f"Gebetszeiten neu geladen ({len(table)} Tage, Reload #{self.reload_count})")
+        return True
+
+    def resolve_path(self):
+        file_path = os.path.join(self.app.static_folder, 'gb.txt')
+
+        # Fallback: Versuche verschiedene Pfade
+        if not os.path.exists(file_path):
+            # Alternativer Pfad im Projektverzeichnis
+            file_path = os.path.join(os.path.dirname(__file__), 'static', 'gb.txt')
+
+        if not os.path.exists(file_path):
+            # Noch ein alternativer Pfad
+            file_path = 'gb.txt'
+
+        if not os.path.exists(file_path):
+            return None
+        return file_path
+
     def _load_data(self):
-        prayer_times_data = {}
         try:
-            file_path = os.path.join(self.app.static_folder, 'gb.txt')
-            
-            # Fallback: Versuche verschiedene Pfade
-            if not os.path.exists(file_path):
-                # Alternativer Pfad im Projektverzeichnis
-                file_path = os.path.join(os.path.dirname(__file__), 'static', 'gb.txt')
-            
-            if not os.path.exists(file_path):
-                # Noch ein alternativer Pfad
-                file_path = 'gb.txt'
-            
-            if not os.path.exists(file_path):
-                self.app.logger.error(f"gb.txt nicht gefunden. Suchpfade: {file_path}")
-                return {}
-            
-            with open(file_path, "r", encoding="utf-8") as file:
-                for line in file:
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-                    
+            file_path = self.resolve_path()
+            if file_path is None:
+                self.app.logger.error("gb.txt nicht gefunden")
+                return PrayerTimeTable()
+
+            # Stand vor dem Lesen; gilt erst als geladen, wenn die Tabelle gültig ist
+            stat = os.stat(file_path)
+
+            cache_path = self.app.config['PRAYER_TIMES_CACHE']
+            table = open_compiled(file_path, cache_path)
+            if table is None:
+                stat, data, checksum = read_source(file_path)
+                table = parse_table(data.decode('utf-8').splitlines(), self.app.logger)
+                # Eine leere Tabelle nicht kompilieren: gb.bin trüge sonst mtime/Größe
+                # der fehlerhaften Datei und würde eine gleich große Korrektur verdecken
+                if table:
                     try:
-                        # Beispiel-Format: 2024-01-01,05:30,07:15,12:45,15:30,17:45,19:30
-                        parts = line.split()
-                        if len(parts) >= 7:
-                            date_str = parts[0]
-                            date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-                            
-                            prayer_times_data[date_obj] = {
-                                "fajr": parts[1],
-                                "sunrise": parts[2], 
-                                "dhuhr": parts[3],
-                                "asr": parts[4],
-                                "maghrib": parts[5],
-                                "isha": parts[6]
-                            }
-                    except (ValueError, IndexError) as e:
-                        self.app.logger.warning(f"Ungültige Zeile in gb.txt: {line} - Fehler: {e}")
-                        continue
-                        
-            self.app.logger.info(f"Gebetszeiten für {len(prayer_times_data)} Tage geladen")
-                        
+                        write_compiled(table, stat, checksum, cache_path)
+                        self.app.logger.info(f"Gebetszeiten nach {cache_path} kompiliert")
+                        # Neu einlesen, damit alle Worker dieselben Seiten teilen
+                        table = open_compiled(file_path, cache_path) or table
+                    except OSError as e:
+                        self.app.logger.warning(f"Gebetszeiten-Cache nicht schreibbar: {e}")
+                if not table.version:
+                    table.version = checksum.hex()[:16]
+
+            if table:
+                # Sonst versucht reload() es nach dem nächsten Intervall erneut
+                self._source_key = (stat.st_mtime_ns, stat.st_size)
+            self.app.logger.info(f"Gebetszeiten für {len(table)} Tage geladen")
+            return table
+
         except FileNotFoundError:
             self.app.logger.error("gb.txt Datei nicht gefunden")
         except Exception as e:
             self.app.logger.error(f"Fehler beim Laden der Gebetszeiten: {str(e)}")
-            
-        return prayer_times_data
+
+        return PrayerTimeTable()
+
+    def current_table(self):
+        """Aktuelle Tabelle; stößt bei Bedarf die Prüfung auf eine geänderte gb.txt an"""
+        self._maybe_reload()
+        return self.table
 
     def get_for_date(self, date):
-        if not self.data:
+        table = self.current_table()
+        if not table:
             return {"error": "Gebetszeiten nicht verfügbar - Datei nicht geladen"}
-        
-        result = self.data.get(date)
+
+        result = table.get(date)
         if result:
             return result
-        else:
-            # Fallback: Versuche benachbarte Daten
-            for i in range(1, 8):  # Suche bis zu 7 Tage vor/nach
-                prev_date = date - datetime.timedelta(days=i)
-                next_date = date + datetime.timedelta(days=i)
-                
-                if prev_date in self.data:
-                    result = self.data[prev_date].copy()
-                    result["note"] = f"Geschätzte Zeiten (von {prev_date})"
-                    return result
-                    
-                if next_date in self.data:
-                    result = self.data[next_date].copy()
-                    result["note"] = f"Geschätzte Zeiten (von {next_date})"
-                    return result
-            
-            return {
-                "error": f"Keine Gebetszeiten für {date} verfügbar",
-                "fajr": "--:--",
-                "sunrise": "--:--", 
-                "dhuhr": "--:--",
-                "asr": "--:--",
-                "maghrib": "--:--",
-                "isha": "--:--"
-            }
+
+        # Fallback: nächster Tag mit Eintrag (bis zu 7 Tage vor/nach)
+        nearest = table.nearest(date)
+        if nearest is not None:
+            result = table.get(nearest)
+            result["note"] = f"Geschätzte Zeiten (von {nearest})"
+            return result
+
+        return {
+            "error": f"Keine Gebetszeiten für {date} verfügbar",
+            "fajr": "--:--",
+            "sunrise": "--:--",
+            "dhuhr": "--:--",
+            "asr": "--:--",
+            "maghrib": "--:--",
+            "isha": "--:--"
+        }
 
 # Singleton-Instanz
 prayer_times = PrayerTimes()
 
 # Legacy-Funktion für Kompatibilität
 def get_prayer_times_for_date(date):
-    if not prayer_times.data:
+    if not prayer_times.table:
         raise RuntimeError("Call prayer_times.init_app() first")
-    return prayer_times.get_for_date(date)
\ No newline at end of file
+    return prayer_times.get_for_date(date)
@@ -0,0 +1,373 @@
+"""
+Hintergrund-Jobs für aufwendige Berichte (PDFs, Diagramme, Exporte)
+
+Aufträge landen in einer kleinen SQLite-Tabelle, die alle Worker-Prozesse
+teilen. Ein Dispatcher-Thread pro Prozess holt wartende Aufträge ab und
+startet für jeden einen eigenen Kindprozess (höchstens REPORT_JOBS_WORKERS
+gleichzeitig). Das Ergebnis wird als Datei abgelegt und über Status- und
+Download-Endpunkte abgeholt. Gleiche Aufträge, die noch laufen, werden nicht
+doppelt angenommen; überschreitet ein Auftrag sein Zeitlimit, wird der
+Kindprozess beendet.
+
+Die Kindprozesse stammen aus einem Forkserver (wo nicht verfügbar: spawn),
+nicht aus fork() im Dispatcher-Thread. Der Forkserver importiert nur die
+preload-Module (schwere Bibliotheken) vorab; das App-Modul mit seinen
+Nebenwirkungen beim Import lädt erst der Kindprozess selbst.
+
+Berichte mit einer dataset-Funktion landen im ArtifactCache: Ist für den
+aktuellen Datenbestand schon eine Datei vorhanden, gilt der Auftrag sofort
+als erledigt.
+"""
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+# Status eines Auftrags
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+IN_FLIGHT = (QUEUED, RUNNING)
+
+
+class ReportTask:
+    """Registrierter Berichtstyp.
+
+    params bildet Parameternamen auf Prüf-/Umwandlungsfunktionen ab, die einen
+    JSON-fähigen Wert liefern, defaults ergänzt fehlende Parameter. extension
+    und download_name dürfen Platzhalter für Parameter enthalten, z. B.
+    '{export_format}'. dataset(**params) liefert die Eingabezeilen, über die
+    der Cache-Schlüssel gebildet wird (z. B. eine Spaltenabfrage, None = nicht
+    cachen); version bei Änderungen am Layout erhöhen.
+    """
+
+    def __init__(self, name, func, params, defaults, timeout, extension, download_name, admin, dataset, version):
+        self.name = name
+        self.func = func
+        self.params = params
+        self.defaults = defaults
+        self.dataset = dataset
+        self.version = version
+        self.timeout = timeout
+        self.extension = extension
+        self.download_name = download_name
+        self.admin = admin
+
+    def parse_params(self, values):
+        """Übernimmt die bekannten Parameter aus einem Dict, wirft ValueError bei ungültigen Werten"""
+        return {name: convert(values[name]) for name, convert in self.params.items()
+                if values.get(name) not in (None, '')}
+
+    def file_name(self, params, job_id=None):
+        extension = self.extension.format(**params)
+        if job_id:
+            return f"{job_id}.{extension}"
+        return self.download_name.format(**params) + '.' + extension
+
+
+class ReportJobs:
+    def __init__(self, app=None, db=None, cache=None, preload=None):
+        self.app = None
+        self.db = None
+        self.cache = None
+        self.preload = []
+        self.path = None
+        self.artifact_dir = None
+        self.workers = 2
+        self.poll_interval = 0.5
+        self.tasks = {}
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._dispatcher = None
+        self._dispatcher_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, cache, preload)
+
+    def init_app(self, app, db, cache=None, preload=None):
+        """preload: Modulnamen, die der Forkserver einmal importiert, damit die Kindprozesse
+        schwere Bibliotheken bereits geladen erben statt sie je Auftrag zu importieren.
+        Das App-Modul gehört nicht dazu, sonst liefen create_all, Schema-Abgleich usw. im Forkserver.
+        """
+        app.config.setdefault('REPORT_JOBS_DB', os.path.join(app.instance_path, 'report_jobs.db'))
+        app.config.setdefault('REPORT_JOBS_DIR', os.path.join(app.instance_path, 'reports'))
+        app.config.setdefault('REPORT_JOBS_WORKERS', 2)
+        app.config.setdefault('REPORT_JOBS_TIMEOUT', 120)
+        app.config.setdefault('REPORT_JOBS_KEEP', 24 * 3600)
+        self.app = app
+        self.db = db
+        self.cache = cache
+        self.preload = list(preload or ())
+        self.path = app.config['REPORT_JOBS_DB']
+        self.artifact_dir = app.config['REPORT_JOBS_DIR']
+        self.workers = app.config['REPORT_JOBS_WORKERS']
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS report_job ('
+                         'id TEXT PRIMARY KEY, task TEXT NOT NULL, params TEXT NOT NULL, '
+                         'dedupe_key TEXT NOT NULL, status TEXT NOT NULL, '
+                         'created_at REAL NOT NULL, started_at REAL, finished_at REAL, '
+                         'timeout REAL NOT NULL, artifact TEXT, error TEXT)')
+            try:
+                # Spalte kam mit dem Artefakt-Cache hinzu
+                conn.execute('ALTER TABLE report_job ADD COLUMN cache_key TEXT')
+            except sqlite3.OperationalError:
+                pass
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_report_job_dedupe ON report_job (dedupe_key, status)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_report_job_status ON report_job (status, created_at)')
+
+    def _connect(self):
+        # Nach fork() eigene Verbindung öffnen, SQLite-Handles dürfen nicht geteilt werden
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- Registrierung ---
+
+    def task(self, name, params=None, defaults=None, timeout=None, extension='pdf', download_name=None,
+             admin=False, dataset=None, version=1):
+        """Dekorator: func(**params) liefert die Bytes des Berichts oder einen Iterator über Bytes-Blöcke"""
+        def decorator(func):
+            self.tasks[name] = ReportTask(name, func, params or {}, defaults or {}, timeout, extension,
+                                          download_name or name, admin, dataset, version)
+            return func
+        return decorator
+
+    # --- Öffentliche API ---
+
+    @staticmethod
+    def dedupe_key(task_name, params):
+        payload = json.dumps([task_name, params], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def submit(self, task_name, **params):
+        """Nimmt einen Auftrag an und liefert dessen Datensatz.
+
+        Läuft bereits ein Auftrag mit denselben Parametern, wird dieser zurückgegeben.
+        """
+        task = self.tasks[task_name]
+        params = {**task.defaults, **params}
+        cache_key = cached = None
+        dataset = task.dataset(**params) if task.dataset is not None and self.cache is not None else None
+        if dataset is not None:
+            digest = self.cache.digest(dataset)
+            cache_key = self.cache.key(task_name, digest, {**params, '_version': task.version})
+            cached = self.cache.lookup(cache_key, task.extension.format(**params))
+        # Mit Cache-Schlüssel gelten nur Aufträge über denselben Datenbestand als gleich
+        key = cache_key or self.dedupe_key(task_name, params)
+        timeout = task.timeout or self.app.config['REPORT_JOBS_TIMEOUT']
+        statuses = (DONE,) if cached else IN_FLIGHT
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                f"SELECT * FROM report_job WHERE dedupe_key = ? AND status IN ({','.join('?' * len(statuses))}) "
+                "ORDER BY created_at DESC LIMIT 1", (key, *statuses)).fetchone()
+            if row is None:
+                job_id = uuid.uuid4().hex
+                now = time.time()
+                if cached:
+                    # Datei liegt schon im Cache, kein Rendern nötig
+                    conn.execute(
+                        'INSERT INTO report_job (id, task, params, dedupe_key, status, created_at, started_at, '
+                        'finished_at, timeout, cache_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (job_id, task_name, json.dumps(params, default=str), key, DONE, now, now, now,
+                         timeout, cache_key))
+                else:
+                    conn.execute(
+                        'INSERT INTO report_job (id, task, params, dedupe_key, status, created_at, timeout, cache_key) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (job_id, task_name, json.dumps(params, default=str), key, QUEUED, now, timeout, cache_key))
+                row = conn.execute('SELECT * FROM report_job WHERE id = ?', (job_id,)).fetchone()
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if not cached:
+            self._ensure_dispatcher()
+            self._wakeup.set()
+        return dict(row)
+
+    def requeue(self, job):
+        """Stellt einen erledigten Auftrag erneut ein, dessen Datei nicht mehr da ist
+        (z. B. vom ArtifactCache verdrängt), und liefert den neuen Datensatz.
+        """
+        conn = self._connect()
+        conn.execute(
+            'UPDATE report_job SET status = ?, created_at = ?, started_at = NULL, finished_at = NULL, '
+            'artifact = NULL, error = NULL WHERE id = ? AND status = ?',
+            (QUEUED, time.time(), job['id'], DONE))
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        return self.get(job['id'])
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT * FROM report_job WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def status(self, job):
+        """Öffentliche Sicht auf einen Auftrag (ohne Pfade)"""
+        return {
+            'id': job['id'],
+            'task': job['task'],
+            'status': job['status'],
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at'],
+            'error': job['error'],
+        }
+
+    def _extension(self, job):
+        return self.tasks[job['task']].extension.format(**json.loads(job['params']))
+
+    def artifact_path(self, job):
+        if job['status'] != DONE:
+            return None
+        if job['cache_key']:
+            return self.cache.get(job['cache_key'], self._extension(job))
+        if not job['artifact']:
+            return None
+        path = os.path.join(self.artifact_dir, job['artifact'])
+        return path if os.path.exists(path) else None
+
+    # --- Dispatcher ---
+
+    def _ensure_dispatcher(self):
+        # Pro Prozess ein Thread, erst beim ersten Auftrag gestartet (nicht schon beim Import)
+        with self._lock:
+            if self._dispatcher is not None and self._dispatcher_pid == os.getpid() and self._dispatcher.is_alive():
+                return
+            self._dispatcher_pid = os.getpid()
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name='report-jobs', daemon=True)
+            self._dispatcher.start()
+
+    def _claim(self):
+        """Übernimmt den ältesten wartenden Auftrag, atomar gegenüber anderen Prozessen"""
+        return self._connect().execute(
+            'UPDATE report_job SET status = ?, started_at = ? '
+            'WHERE id = (SELECT id FROM report_job WHERE status = ? ORDER BY created_at LIMIT 1) AND status = ? '
+            'RETURNING *', (RUNNING, time.time(), QUEUED, QUEUED)).fetchone()
+
+    def _finish(self, job_id, status, artifact=None, error=None):
+        self._connect().execute(
+            'UPDATE report_job SET status = ?, finished_at = ?, artifact = ?, error = ? WHERE id = ? AND status = ?',
+            (status, time.time(), artifact, error, job_id, RUNNING))
+
+    def _context(self):
+        # fork() aus einem Thread heraus kann Sperren anderer Threads im gesperrten Zustand erben
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(self.preload)
+            return context
+        return multiprocessing.get_context('spawn')
+
+    def _dispatch_loop(self):
+        running = {}
+        last_cleanup = 0
+        context = self._context()
+        while True:
+            self._wakeup.clear()
+            try:
+                now = time.time()
+                for job_id, (process, deadline) in list(running.items()):
+                    if not process.is_alive():
+                        process.join()
+                        running.pop(job_id)
+                        if process.exitcode != 0:
+                            self._finish(job_id, FAILED, error=f"Prozess beendet mit Code {process.exitcode}")
+                    elif now > deadline:
+                        process.terminate()
+                        process.join(5)
+                        running.pop(job_id)
+                        self._finish(job_id, FAILED, error='Zeitlimit überschritten')
+                        self.app.logger.warning(f"Bericht {job_id} nach Zeitlimit abgebrochen")
+
+                while len(running) < self.workers:
+                    job = self._claim()
+                    if job is None:
+                        break
+                    process = context.Process(target=_run_job, args=(self.app.import_name, dict(job)), daemon=True)
+                    process.start()
+                    running[job['id']] = (process, now + job['timeout'])
+
+                if now - last_cleanup > 60:
+                    self._cleanup(now)
+                    last_cleanup = now
+            except Exception as e:
+                self.app.logger.error(f"Fehler im Berichts-Dispatcher: {e}")
+
+            self._wakeup.wait(self.poll_interval if running else 5)
+
+    def _cleanup(self, now):
+        """Verwaiste Aufträge (Prozess abgestürzt) und alte Ergebnisse aufräumen"""
+        conn = self._connect()
+        conn.execute('UPDATE report_job SET status = ?, finished_at = ?, error = ? '
+                     'WHERE status = ? AND started_at + timeout + 60 < ?',
+                     (FAILED, now, 'Auftrag verwaist', RUNNING, now))
+        expired = conn.execute('SELECT id, artifact FROM report_job WHERE status IN (?, ?) AND finished_at < ?',
+                               (DONE, FAILED, now - self.app.config['REPORT_JOBS_KEEP'])).fetchall()
+        for row in expired:
+            if row['artifact']:
+                try:
+                    os.remove(os.path.join(self.artifact_dir, row['artifact']))
+                except OSError:
+                    pass
+        conn.executemany('DELETE FROM report_job WHERE id = ?', [(row['id'],) for row in expired])
+
+    def _run(self, job):
+        """Läuft im Kindprozess: Bericht erzeugen, Datei schreiben, Status setzen"""
+        task = self.tasks[job['task']]
+        params = json.loads(job['params'])
+        if job['cache_key']:
+            artifact = None
+            tmp_path, path = self.cache.open_for_write(job['cache_key'], self._extension(job))
+        else:
+            artifact = task.file_name(params, job['id'])
+            path = os.path.join(self.artifact_dir, artifact)
+            tmp_path = path + '.tmp'
+        try:
+            with self.app.app_context():
+                # Vom Forkserver geerbte Datenbankverbindungen nicht weiterverwenden
+                self.db.engine.dispose(close=False)
+                result = task.func(**params)
+                with open(tmp_path, 'wb') as f:
+                    if isinstance(result, (bytes, bytearray)):
+                        f.write(result)
+                    else:
+                        for chunk in result:
+                            f.write(chunk)
+            if job['cache_key']:
+                self.cache.commit(tmp_path, path)
+            else:
+                os.replace(tmp_path, path)
+            self._finish(job['id'], DONE, artifact=artifact)
+        except Exception as e:
+            self.app.logger.error(f"Bericht {job['task']} ({job['id']}) fehlgeschlagen: {e}\n{traceback.format_exc()}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            self._finish(job['id'], FAILED, error=str(e))
+
+
+def _run_job(app_module, job):
+    """Einstieg im Kindprozess: das App-Modul registriert beim Import die Berichte.
+
+    Unter '__main__' (python app.py) hat multiprocessing es bereits als __mp_main__ geladen.
+    """
+    importlib.import_module(app_module)
+    report_jobs._run(job)
+
+
+# Singleton-Instanz
+report_jobs = ReportJobs()
@@ -0,0 +1,44 @@
+"""
+Plot- und Datenstack (matplotlib, seaborn, pandas) für Berichte
+
+Die Bibliotheken werden erst beim ersten Bericht geladen, nicht beim Start
+der Anwendung. Worker, die nie einen Bericht erzeugen, sparen sich damit
+Importzeit und Speicher. matplotlib läuft immer mit dem Agg-Backend, da es
+auf dem Server kein Display gibt.
+
+PRELOAD_MODULES importiert der Forkserver der Berichts-Jobs (report_jobs)
+vorab; MPLBACKEND sorgt dafür, dass pyplot dort gleich mit Agg startet.
+"""
+import os
+import threading
+from collections import namedtuple
+
+BACKEND = 'Agg'
+PRELOAD_MODULES = ('matplotlib.pyplot', 'matplotlib.backends.backend_pdf', 'pandas', 'seaborn')
+
+os.environ.setdefault('MPLBACKEND', BACKEND)
+
+PlotStack = namedtuple('PlotStack', 'plt sns pd PdfPages')
+
+_stack = None
+_lock = threading.Lock()
+
+
+def load():
+    """Liefert PlotStack(plt, sns, pd, PdfPages), importiert beim ersten Aufruf"""
+    global _stack
+    if _stack is None:
+        with _lock:
+            if _stack is None:
+                import matplotlib
+                matplotlib.use(BACKEND, force=True)
+                import matplotlib.pyplot as plt
+                import pandas as pd
+                import seaborn as sns
+                from matplotlib.backends.backend_pdf import PdfPages
+                _stack = PlotStack(plt, sns, pd, PdfPages)
+    return _stack
+
+
+def is_loaded():
+    return _stack is not None
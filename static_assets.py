@@ -0,0 +1,125 @@
+"""
+Unveränderliche URLs für statische Dateien
+
+asset_url('logo.png') liefert '/assets/<fingerprint>/logo.png', der
+Fingerprint ist der Anfang des SHA-256 der Datei. Ändert sich die Datei,
+ändert sich auch die URL; Browser und Proxys dürfen die Antwort daher ein
+Jahr lang ohne Rückfrage verwenden (Cache-Control: immutable).
+
+Dateien der Upload-Ablage (upload_storage) tragen ihren Hash schon im Namen
+und werden dafür nicht gelesen. Für alle anderen wird der Hash einmal
+berechnet und im Speicher gehalten, solange mtime und Größe gleich bleiben.
+
+Mit STATIC_ASSETS_SENDFILE = 'x-sendfile' (Apache, lighttpd) oder
+'x-accel-redirect' (nginx) liefert der vorgeschaltete Webserver die Bytes
+aus; Flask setzt dann nur noch die Header. Für nginx muss
+STATIC_ASSETS_ACCEL_PREFIX auf eine interne location zeigen, z. B.
+
+    location /_static/ { internal; alias /pfad/zur/app/static/; }
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from flask import abort, current_app, redirect, request, url_for
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+FINGERPRINT_LENGTH = 12
+ONE_YEAR = 365 * 24 * 3600
+READ_BLOCK = 64 * 1024
+# Original in der Upload-Ablage: blobs/ab/cd/<sha256>.<endung>; abgeleitete Varianten zählen nicht
+_BLOB_NAME = re.compile(r'(?:^|/)blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(?:\.[a-z0-9]{1,10})?$')
+SENDFILE_MODES = (None, 'x-sendfile', 'x-accel-redirect')
+
+
+class StaticAssets:
+    def __init__(self, app=None):
+        self.app = None
+        # absoluter Pfad -> ((mtime_ns, Größe), Fingerprint)
+        self._fingerprints = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STATIC_ASSETS_URL_PATH', '/assets')
+        app.config.setdefault('STATIC_ASSETS_MAX_AGE', ONE_YEAR)
+        app.config.setdefault('STATIC_ASSETS_SENDFILE', None)
+        app.config.setdefault('STATIC_ASSETS_ACCEL_PREFIX', '/_static/')
+        if app.config['STATIC_ASSETS_SENDFILE'] not in SENDFILE_MODES:
+            raise ValueError(f"STATIC_ASSETS_SENDFILE muss einer von {SENDFILE_MODES} sein")
+        self.app = app
+        app.add_url_rule(app.config['STATIC_ASSETS_URL_PATH'] + '/<fingerprint>/<path:filename>',
+                         'static_asset', self.serve)
+        app.add_template_global(self.url, 'asset_url')
+
+    def _resolve(self, filename):
+        return safe_join(self.app.static_folder, filename)
+
+    def fingerprint(self, filename):
+        """Fingerprint einer Datei unter static/, None wenn es sie nicht gibt"""
+        match = _BLOB_NAME.search(filename)
+        if match:
+            return match.group(1)[:FINGERPRINT_LENGTH]
+        path = self._resolve(filename)
+        if path is None:
+            return None
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(info.st_mode):
+            return None
+        key = (info.st_mtime_ns, info.st_size)
+        cached = self._fingerprints.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        hasher = hashlib.sha256()
+        try:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(READ_BLOCK), b''):
+                    hasher.update(block)
+        except OSError:
+            return None
+        fingerprint = hasher.hexdigest()[:FINGERPRINT_LENGTH]
+        self._fingerprints[path] = (key, fingerprint)
+        return fingerprint
+
+    def url(self, filename, **values):
+        """Ersatz für url_for('static', filename=...); ohne Datei bleibt es bei der normalen URL"""
+        fingerprint = self.fingerprint(filename)
+        if fingerprint is None:
+            return url_for('static', filename=filename, **values)
+        return url_for('static_asset', fingerprint=fingerprint, filename=filename, **values)
+
+    def serve(self, fingerprint, filename):
+        path = self._resolve(filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        current = self.fingerprint(filename)
+        if current != fingerprint:
+            # Alte URL aus einer zwischengespeicherten Seite: auf die aktuelle Fassung verweisen
+            return redirect(self.url(filename))
+
+        mode = current_app.config['STATIC_ASSETS_SENDFILE']
+        if mode == 'x-accel-redirect':
+            response = current_app.response_class()
+            response.headers['X-Accel-Redirect'] = (
+                current_app.config['STATIC_ASSETS_ACCEL_PREFIX'].rstrip('/') + '/' + quote(filename))
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        else:
+            response = send_file(path, request.environ, conditional=True,
+                                 max_age=current_app.config['STATIC_ASSETS_MAX_AGE'],
+                                 use_x_sendfile=(mode == 'x-sendfile'),
+                                 response_class=current_app.response_class)
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['STATIC_ASSETS_MAX_AGE']
+        response.cache_control.immutable = True
+        return response
+
+
+# Singleton-Instanz
+static_assets = StaticAssets()
@@ -0,0 +1,146 @@
+"""
+Auslieferung großer statischer Dateien mit vorkomprimierten Varianten
+
+Neben den Varianten (.gz/.br) liegt eine kleine JSON-Datei mit mtime, Größe
+und SHA-256 der Quelle, aus der sie erzeugt wurden (wie der Kopf von gb.bin
+in prayer_times). Stimmen mtime und Größe nicht mehr, entscheidet die
+Prüfsumme; ein Vergleich der mtimes allein übersieht z. B. zurückgespielte
+ältere Fassungen.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from flask import current_app, request, send_file
+
+try:
+    import brotli
+except ImportError:  # brotli ist optional, dann nur gzip
+    brotli = None
+
+
+# Content-Encoding -> (Dateiendung, Kompressionsfunktion)
+ENCODINGS = {
+    'gzip': ('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+}
+if brotli is not None:
+    ENCODINGS['br'] = ('.br', lambda data: brotli.compress(data, quality=11))
+
+# Reihenfolge der Bevorzugung bei gleicher Qualität
+PREFERRED_ENCODINGS = ('br', 'gzip')
+
+META_SUFFIX = '.precompressed.json'
+READ_BLOCK = 1 << 16
+
+
+def file_checksum(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_BLOCK), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        return meta if {'mtime_ns', 'size', 'sha256', 'encodings'} <= meta.keys() else None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _write_atomic(path, data):
+    # Eindeutig je Prozess und Thread, parallele Requests schreiben nie dieselbe Zwischendatei
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def ensure_precompressed(path):
+    """Legt .gz/.br neben der Datei an bzw. erneuert veraltete Varianten.
+
+    Liefert ein Dict Encoding -> Pfad der aktuell gültigen Varianten.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    meta_path = path + META_SUFFIX
+    meta = _read_meta(meta_path)
+    source_key = (stat.st_mtime_ns, stat.st_size)
+
+    fresh = same_key = meta is not None and (meta['mtime_ns'], meta['size']) == source_key
+    if meta is not None and not fresh:
+        # mtime/Größe geändert: der Inhalt kann trotzdem gleich sein (z. B. erneut ausgerollt)
+        try:
+            fresh = file_checksum(path) == meta['sha256']
+        except OSError:
+            return {}
+    variants = {}
+    if fresh:
+        for encoding in meta['encodings']:
+            if encoding in ENCODINGS and os.path.exists(path + ENCODINGS[encoding][0]):
+                variants[encoding] = path + ENCODINGS[encoding][0]
+    if fresh and same_key and len(variants) == len(ENCODINGS):
+        return variants
+
+    if fresh and len(variants) == len(ENCODINGS):
+        # Nur mtime/Größe neu, Inhalt gleich
+        checksum = meta['sha256']
+    else:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return variants
+        # Prüfsumme über genau die komprimierten Bytes; mtime/Größe stammen von vor dem Lesen,
+        # eine Änderung dazwischen fällt beim nächsten Aufruf über die Prüfsumme auf
+        checksum = hashlib.sha256(data).hexdigest()
+        if not fresh or checksum != meta['sha256']:
+            variants = {}
+        for encoding, (suffix, compress) in ENCODINGS.items():
+            if encoding in variants:
+                continue
+            try:
+                _write_atomic(path + suffix, compress(data))
+                variants[encoding] = path + suffix
+            except OSError as e:
+                current_app.logger.warning(f"Vorkomprimierte Variante {path + suffix} nicht schreibbar: {e}")
+
+    meta = {'mtime_ns': source_key[0], 'size': source_key[1], 'sha256': checksum, 'encodings': sorted(variants)}
+    try:
+        _write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+    except OSError as e:
+        current_app.logger.warning(f"Metadaten {meta_path} nicht schreibbar: {e}")
+    return variants
+
+
+def choose_encoding(variants):
+    """Wählt anhand von Accept-Encoding die beste verfügbare Variante"""
+    best, best_quality = None, 0
+    for encoding in PREFERRED_ENCODINGS:
+        if encoding not in variants:
+            continue
+        quality = request.accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def send_precompressed(path, mimetype, max_age=3600):
+    """send_file mit gzip/brotli-Aushandlung, ETag, If-Modified-Since und Range"""
+    encoding = choose_encoding(ensure_precompressed(path))
+    file_path = path + ENCODINGS[encoding][0] if encoding else path
+
+    # conditional=True liefert 304 und 206 (Range) direkt aus werkzeug
+    response = send_file(file_path, mimetype=mimetype, download_name=os.path.basename(path),
+                         conditional=True, max_age=max_age)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    return response
@@ -0,0 +1,171 @@
+"""
+Sterbestatistik der ehemaligen Mitglieder (ahde_vefa)
+
+Geburts- und Sterbedaten kommen als date-Objekte aus den Date-Spalten und
+werden mit NumPy als datetime64 für alle Einträge auf einmal verarbeitet,
+die Jahre aus den indizierten Jahres-Spalten. Texte im Format 'JJJJ-MM-TT'
+werden ebenfalls angenommen und als Byte-Matrix zerlegt. Das Ergebnis dient
+der Statistikseite, der Jahres-Tabelle auf /ahde-vefa und dem PDF-Bericht.
+
+NumPy wird erst beim ersten Aufruf importiert, wie der Plot-Stack in reporting.py.
+"""
+import datetime
+
+DATE_WIDTH = 10
+MONTH_NAMES = ('January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December')
+
+
+# Angenommene Schreibweisen beim Einlesen und bei der Übernahme alter Einträge
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d.%m.%y', '%d/%m/%Y', '%Y/%m/%d', '%Y.%m.%d', '%d-%m-%Y')
+
+
+def parse_flexible_date(value):
+    """Liefert (date oder None, Jahr oder None) für Formulareingaben und Altbestände.
+
+    Reine Jahresangaben ('1950') und 'JJJJ-MM' ergeben nur das Jahr.
+    """
+    if value is None:
+        return None, None
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    if isinstance(value, datetime.date):
+        return value, value.year
+    text = str(value).strip()
+    if not text:
+        return None, None
+    candidates = (text, text[:DATE_WIDTH]) if len(text) > DATE_WIDTH else (text,)
+    for candidate in candidates:
+        for fmt in DATE_FORMATS:
+            try:
+                parsed = datetime.datetime.strptime(candidate, fmt).date()
+            except ValueError:
+                continue
+            return parsed, parsed.year
+    if len(text) in (4, 7) and text[:4].isdigit() and (len(text) == 4 or text[4] in '-./'):
+        return None, int(text[:4])
+    return None, None
+
+
+class DateColumn:
+    """Zerlegte Datumsspalte aus date-Objekten (None = fehlt) oder Texten 'JJJJ-MM-TT'.
+
+    years ersetzt die aus den Daten abgeleiteten Jahre, z. B. aus birth_year,
+    damit auch Einträge mit reiner Jahresangabe im Histogramm zählen.
+    """
+
+    def __init__(self, values, years=None):
+        import numpy as np
+
+        values = list(values)
+        if any(isinstance(value, str) for value in values):
+            self._from_text(np, values)
+        else:
+            dates = np.array(values, dtype='datetime64[D]')
+            self.valid = ~np.isnat(dates)
+            self.date = np.where(self.valid, dates, np.datetime64('1970-01-01', 'D'))
+            months = self.date.astype('datetime64[M]').astype(np.int64)
+            self.year = months // 12 + 1970
+            self.month = months % 12 + 1
+            self.year_valid = self.valid.copy()
+
+        if years is not None:
+            years = np.array([year if year is not None else np.nan for year in years], dtype=float)
+            self.year_valid = ~np.isnan(years)
+            self.year = np.where(self.year_valid, years, 0).astype(np.int64)
+
+    def _from_text(self, np, values):
+        # Ein Zeichen mehr als nötig, damit zu lange Werte erkennbar bleiben
+        width = DATE_WIDTH + 1
+        values = [value.isoformat() if isinstance(value, datetime.date) else (value or '') for value in values]
+        try:
+            raw = np.array(values, dtype=f'S{width}')
+        except UnicodeEncodeError:
+            raw = np.char.encode(np.array(values, dtype=str), 'ascii', 'replace').astype(f'S{width}')
+        exact_length = np.char.str_len(raw) == DATE_WIDTH
+        # Jede Zeile als Byte-Zeile, fehlende Stellen sind 0
+        chars = raw.view(np.uint8).reshape(len(raw), width)[:, :DATE_WIDTH]
+        digits = chars.astype(np.int64) - ord('0')
+        is_digit = (digits >= 0) & (digits <= 9)
+
+        self.year_valid = is_digit[:, :4].all(axis=1)
+        self.year = digits[:, :4] @ np.array([1000, 100, 10, 1])
+        month = digits[:, 5] * 10 + digits[:, 6]
+        day = digits[:, 8] * 10 + digits[:, 9]
+        self.valid = (self.year_valid & exact_length & is_digit[:, [5, 6, 8, 9]].all(axis=1)
+                      & (chars[:, 4] == ord('-')) & (chars[:, 7] == ord('-'))
+                      & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31))
+
+        year = np.where(self.valid, self.year, 1970)
+        month = np.where(self.valid, month, 1)
+        day = np.where(self.valid, day, 1)
+        months = (year - 1970) * 12 + (month - 1)
+        self.date = months.astype('datetime64[M]').astype('datetime64[D]') + (day - 1)
+        # 31.02. o. Ä. läuft in den Folgemonat über und gilt als ungültig
+        self.valid &= self.date.astype('datetime64[M]').astype(np.int64) == months
+        self.month = month
+
+
+class SterbeStatistik:
+    """Ergebnis aus einem Durchlauf über alle Geburts- und Sterbedaten.
+
+    per_year:      {Jahr: {'geburten': n, 'tode': n}} aufsteigend sortiert
+    jahre/geburten/tode: dieselben Werte als Listen für Diagramme
+    birth_years, death_years, ages, birth_months, death_months:
+                   Arrays nur für Einträge mit beiden gültigen Daten
+    birth_month_counts, death_month_counts: Anzahl je Monat (Januar zuerst)
+    age_stats:     Kennzahlen des Sterbealters
+    """
+
+    def __init__(self, birth_dates, death_dates, birth_years=None, death_years=None):
+        import numpy as np
+
+        birth = DateColumn(birth_dates, birth_years)
+        death = DateColumn(death_dates, death_years)
+
+        birth_years = birth.year[birth.year_valid]
+        death_years = death.year[death.year_valid]
+        years, inverse = np.unique(np.concatenate([birth_years, death_years]), return_inverse=True)
+        births = np.bincount(inverse[:len(birth_years)], minlength=len(years))
+        deaths = np.bincount(inverse[len(birth_years):], minlength=len(years))
+        self.jahre = years.tolist()
+        self.geburten = births.tolist()
+        self.tode = deaths.tolist()
+        self.per_year = {year: {'geburten': b, 'tode': d} for year, b, d in zip(self.jahre, self.geburten, self.tode)}
+
+        both = birth.valid & death.valid
+        self.count = int(both.sum())
+        self.birth_years = birth.year[both]
+        self.death_years = death.year[both]
+        self.ages = (death.date[both] - birth.date[both]).astype(np.int64) / 365.25
+        self.birth_months = birth.month[both]
+        self.death_months = death.month[both]
+        self.birth_month_counts = np.bincount(self.birth_months - 1, minlength=12)[:12].tolist()
+        self.death_month_counts = np.bincount(self.death_months - 1, minlength=12)[:12].tolist()
+        self.age_stats = self._age_stats(np, self.ages)
+
+    @staticmethod
+    def _age_stats(np, ages):
+        if not len(ages):
+            return None
+        q1, median, q3 = np.quantile(ages, [0.25, 0.5, 0.75])
+        return {
+            'min': float(ages.min()),
+            'max': float(ages.max()),
+            'mean': float(ages.mean()),
+            'median': float(median),
+            'std': float(ages.std(ddof=1)) if len(ages) > 1 else 0.0,
+            'q1': float(q1),
+            'q3': float(q3),
+        }
+
+    def month_names(self, numbers):
+        return [MONTH_NAMES[n - 1] for n in numbers]
+
+
+def compute(rows):
+    """Statistik aus (birth_date, death_date[, birth_year, death_year])-Zeilen, z. B. einer Spaltenabfrage"""
+    columns = list(zip(*rows))
+    if not columns:
+        return SterbeStatistik([], [])
+    return SterbeStatistik(*columns)
@@ -0,0 +1,56 @@
+"""
+Test-Umgebung: app.py wird einmal mit eigener SQLite-Datei importiert.
+
+Das Arbeitsverzeichnis wechselt vorher in ein temporäres Verzeichnis, weil
+der Upload-Ordner (static/Uploads) relativ dazu angelegt wird. Auch
+instance/ liegt dort, damit Versionszähler, Auftrags- und Upload-Datenbanken
+sowie der Artefakt-Cache nicht mit der echten Instanz geteilt werden.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix='web-cami-tests-')
+
+app_module = None
+
+
+def pytest_sessionstart(session):
+    # Erst hier, damit pytest seine Pfade noch relativ zum Projekt auflöst
+    global app_module
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'test.db')
+    os.environ['INSTANCE_PATH'] = os.path.join(WORKDIR, 'instance')
+    os.chdir(WORKDIR)
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    # Alle aus instance_path abgeleiteten Pfade müssen im Arbeitsverzeichnis landen
+    for key in ('CONTENT_VERSIONS_DB', 'ARTIFACT_CACHE_DIR', 'REPORT_JOBS_DB', 'REPORT_JOBS_DIR',
+                'GALLERY_UPLOADS_DB', 'GALLERY_UPLOADS_STAGING', 'HEADER_IMAGES_MANIFEST', 'PRAYER_TIMES_CACHE'):
+        assert app_module.app.config[key].startswith(WORKDIR), key
+
+
+@pytest.fixture
+def app():
+    app_module.app.config['TESTING'] = True
+    with app_module.app.app_context():
+        yield app_module.app
+        # Jeder Test beginnt mit leeren Tabellen
+        app_module.db.session.rollback()
+        for table in reversed(app_module.db.metadata.sorted_tables):
+            app_module.db.session.execute(table.delete())
+        app_module.db.session.commit()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as session:
+        session['admin'] = True
+    return client
@@ -0,0 +1,137 @@
+import datetime
+import os
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from flask_migrate import Migrate, downgrade, upgrade
+from flask_sqlalchemy import SQLAlchemy
+from werkzeug.datastructures import MultiDict
+
+from app import AhdeVefaJahr, ahde_vefa, ahde_vefa_query, db
+from memorial_search import memorial_search
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def add_entry(**values):
+    entry = ahde_vefa(name='Test', **values)
+    db.session.add(entry)
+    db.session.commit()
+    return entry
+
+
+def test_year_only_entry_is_shown_with_its_year(admin_client):
+    add_entry(birth_date='1950', death_date='2020-03-04')
+    html = admin_client.get('/admin/ahde-vefa').get_data(as_text=True)
+    assert '1950' in html
+    assert '2020-03-04' in html
+
+
+def test_edit_form_does_not_render_none(admin_client):
+    entry = add_entry(birth_date='1950')
+    html = admin_client.get(f'/bearbeite_eintrag/{entry.id}').get_data(as_text=True)
+    assert 'value="None"' not in html
+    assert 'Bisher: 1950' in html
+
+
+def test_saving_empty_date_keeps_year_only_value(admin_client):
+    entry = add_entry(birth_date='1950', death_date='2020-03-04')
+    response = admin_client.post(f'/bearbeite_eintrag/{entry.id}', data={
+        'aktion': 'bearbeiten', 'name': 'Test', 'birth_date': '', 'death_date': '',
+    })
+    assert response.status_code == 302
+
+    db.session.refresh(entry)
+    assert entry.birth_year == 1950
+    # Ein gesetztes Datum lässt sich weiterhin leeren
+    assert entry.death_date is None and entry.death_year is None
+    assert db.session.get(AhdeVefaJahr, 2020) is None
+
+
+def search(term):
+    return [entry.name for entry in ahde_vefa_query(MultiDict({'search_name': term}))]
+
+
+@pytest.fixture
+def names(app):
+    for name in ('Işık Yılmaz', 'İbrahim Şahin', 'Günter Strauß', 'Hans Müller'):
+        add_entry().name = name
+    db.session.commit()
+
+
+@pytest.mark.parametrize('term, expected', [
+    ('isik', 'Işık Yılmaz'),
+    ('IŞIK', 'Işık Yılmaz'),
+    ('ibrahim sahin', 'İbrahim Şahin'),
+    ('strauss', 'Günter Strauß'),
+    ('Strauß', 'Günter Strauß'),
+    ('gunt', 'Günter Strauß'),
+    ('mul', 'Hans Müller'),
+])
+def test_name_search_folds_turkish_and_german_letters(names, term, expected):
+    assert memorial_search.available
+    assert search(term) == [expected]
+
+
+def test_name_search_falls_back_to_like_without_index(names, client, monkeypatch):
+    monkeypatch.setattr(memorial_search, 'available', False)
+    response = client.get('/ahde-vefa?search_name=Yıl')
+    assert response.status_code == 200
+    assert 'Işık Yılmaz' in response.get_data(as_text=True)
+    assert search('Yıl') == ['Işık Yılmaz']
+    assert search('a') == ['Günter Strauß', 'Hans Müller', 'Işık Yılmaz', 'İbrahim Şahin']
+
+
+@pytest.fixture
+def migration_db(tmp_path):
+    """Eigene, leere Datenbank mit Flask-Migrate für die Migrationen unter migrations/"""
+    migration_app = Flask(__name__, instance_path=str(tmp_path))
+    migration_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'migration.db')
+    database = SQLAlchemy(migration_app)
+    Migrate(migration_app, database, directory=MIGRATIONS)
+    with migration_app.app_context():
+        yield database.engine
+
+
+def test_migration_converts_legacy_text_dates(migration_db):
+    # Stand vor der Umstellung: Datumsangaben als Text, ohne Jahres-Spalten
+    with migration_db.begin() as conn:
+        conn.exec_driver_sql('CREATE TABLE ahde_vefa (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, '
+                             'birth_date VARCHAR(20), death_date VARCHAR(20), image_filename VARCHAR(100))')
+        conn.exec_driver_sql('CREATE TABLE ahde_vefa_jahr (year INTEGER PRIMARY KEY, '
+                             'geburten INTEGER NOT NULL, tode INTEGER NOT NULL)')
+        conn.exec_driver_sql("INSERT INTO ahde_vefa (id, name, birth_date, death_date) VALUES "
+                             "(1, 'A', '02.03.1940', '2010/05/06'), (2, 'B', '1950', NULL), "
+                             "(3, 'C', 'unbekannt', '1960-05-05T00:00')")
+
+    upgrade()
+    columns = {column['name']: column['type'] for column in sa.inspect(migration_db).get_columns('ahde_vefa')}
+    assert isinstance(columns['birth_date'], sa.Date) and isinstance(columns['death_date'], sa.Date)
+
+    table = sa.Table('ahde_vefa', sa.MetaData(), autoload_with=migration_db)
+    with migration_db.connect() as conn:
+        rows = {row.id: row for row in conn.execute(sa.select(table))}
+        jahre = dict(conn.execute(sa.text('SELECT year, geburten FROM ahde_vefa_jahr WHERE geburten > 0')).all())
+    assert (rows[1].birth_date, rows[1].death_date) == (datetime.date(1940, 3, 2), datetime.date(2010, 5, 6))
+    assert (rows[2].birth_date, rows[2].birth_year) == (None, 1950)
+    assert rows[3].birth_date is None and rows[3].date_note == 'Geburt: unbekannt'
+    assert (rows[3].death_date, rows[3].death_year) == (datetime.date(1960, 5, 5), 1960)
+    assert jahre == {1940: 1, 1950: 1}
+
+    # Rückweg: wieder Textspalten im Format JJJJ-MM-TT
+    downgrade(revision='base')
+    with migration_db.connect() as conn:
+        assert conn.exec_driver_sql('SELECT birth_date FROM ahde_vefa WHERE id = 1').scalar() == '1940-03-02'
+
+
+def test_migration_leaves_a_current_schema_alone(migration_db):
+    # Von create_all angelegt, wie bei einer neuen Installation
+    ahde_vefa.__table__.create(migration_db)
+    with migration_db.begin() as conn:
+        conn.execute(ahde_vefa.__table__.insert(), {'name': 'A', 'birth_date': datetime.date(1940, 3, 2),
+                                                    'birth_year': 1940})
+    upgrade()
+    with migration_db.connect() as conn:
+        row = conn.execute(sa.select(ahde_vefa.__table__)).one()
+    assert (row.birth_date, row.birth_year, row.date_note) == (datetime.date(1940, 3, 2), 1940, None)
@@ -0,0 +1,76 @@
+import datetime
+
+import pytest
+
+from app import Anwesenheit, Klasse, Schueler, Unterrichtseinheit, anwesenheit_speichern, db
+
+
+@pytest.fixture
+def klasse(app):
+    klasse = Klasse(name='1a', schuljahr='2024/2025')
+    db.session.add(klasse)
+    db.session.flush()
+    schueler = [Schueler(name=name, nachname='Test', klasse_id=klasse.id) for name in ('Ali', 'Zeynep')]
+    einheit = Unterrichtseinheit(datum=datetime.date(2024, 9, 2), stunden='1', thema='Elif-Ba', klasse_id=klasse.id)
+    db.session.add_all(schueler + [einheit])
+    db.session.commit()
+    return {'schueler': [s.id for s in schueler], 'einheit': einheit.id}
+
+
+def stand(einheit_id):
+    return {
+        a.schueler_id: (a.anwesend, a.entschuldigt)
+        for a in Anwesenheit.query.filter_by(unterrichtseinheit_id=einheit_id)
+    }
+
+
+def test_upsert_writes_only_changed_rows(klasse):
+    ali, zeynep = klasse['schueler']
+    zeilen = [
+        {'schueler_id': ali, 'unterrichtseinheit_id': klasse['einheit'], 'anwesend': True, 'entschuldigt': False},
+        {'schueler_id': zeynep, 'unterrichtseinheit_id': klasse['einheit'], 'anwesend': False, 'entschuldigt': True},
+    ]
+    assert anwesenheit_speichern(zeilen) == 2
+    assert anwesenheit_speichern(zeilen) == 0
+
+    zeilen[0]['anwesend'] = False
+    assert anwesenheit_speichern(zeilen) == 1
+    assert stand(klasse['einheit']) == {ali: (False, False), zeynep: (False, True)}
+    assert Anwesenheit.query.count() == 2
+
+
+def test_batch_endpoint_keeps_last_of_duplicate_entries(client, klasse):
+    ali, _ = klasse['schueler']
+    eintrag = {'schueler_id': ali, 'unterrichtseinheit_id': klasse['einheit']}
+    response = client.post('/anwesenheit_verwalten', json={'eintraege': [
+        dict(eintrag, anwesend=True), dict(eintrag, anwesend=False, entschuldigt=True),
+    ]})
+    assert response.status_code == 200
+    assert response.get_json() == {'eintraege': 1, 'gespeichert': 1}
+    assert stand(klasse['einheit']) == {ali: (False, True)}
+
+
+@pytest.mark.parametrize('wert', ['false', 0, 1, None])
+def test_batch_endpoint_rejects_non_boolean_flags(client, klasse, wert):
+    ali, _ = klasse['schueler']
+    response = client.post('/anwesenheit_verwalten', json={'eintraege': [
+        {'schueler_id': ali, 'unterrichtseinheit_id': klasse['einheit'], 'anwesend': wert},
+    ]})
+    assert response.status_code == 400
+    assert Anwesenheit.query.count() == 0
+
+
+def test_batch_endpoint_rejects_student_of_another_class(client, klasse):
+    andere = Klasse(name='2b', schuljahr='2024/2025')
+    db.session.add(andere)
+    db.session.flush()
+    fremd = Schueler(name='Emre', nachname='Test', klasse_id=andere.id)
+    db.session.add(fremd)
+    db.session.commit()
+
+    response = client.post('/anwesenheit_verwalten', json={'eintraege': [
+        {'schueler_id': klasse['schueler'][0], 'unterrichtseinheit_id': klasse['einheit'], 'anwesend': True},
+        {'schueler_id': fremd.id, 'unterrichtseinheit_id': klasse['einheit'], 'anwesend': True},
+    ]})
+    assert response.status_code == 400
+    assert Anwesenheit.query.count() == 0
@@ -0,0 +1,83 @@
+import datetime
+
+from sqlalchemy import text
+
+from app import (COST_CENTER_EXPORT_HEADER, CostCenter, Transaction, db, finance_summary,
+                 finance_summary_outdated, reconcile_finance_summary, verify_finance_summary)
+
+
+def add_transaction(amount, type_='Einnahme', **values):
+    transaction = Transaction(description='Test', amount=amount, type=type_,
+                              date=values.pop('date', datetime.date(2024, 5, 1)), **values)
+    db.session.add(transaction)
+    db.session.commit()
+    return transaction
+
+
+def test_summary_follows_orm_changes(app):
+    center = CostCenter(name='Moschee', code='M1')
+    db.session.add(center)
+    db.session.commit()
+
+    spende = add_transaction(100, cost_center_id=center.id, category='Spende')
+    add_transaction(30, 'Ausgabe', category='Strom', date=datetime.date(2024, 6, 3))
+    spende.amount = 120
+    db.session.commit()
+    add_transaction(7, 'Ausgabe')
+    db.session.delete(Transaction.query.filter_by(amount=7).one())
+    db.session.commit()
+
+    summary = finance_summary()
+    assert summary['total'] == (120.0, 30.0)
+    assert summary['cost_centers'][center.id] == (120.0, 0.0)
+    assert summary['months'] == {'2024-05': (120.0, 0.0), '2024-06': (0.0, 30.0)}
+    assert summary['expense_categories'] == {'Strom': 30.0}
+    assert verify_finance_summary() == []
+
+
+def test_reconcile_picks_up_bookings_written_past_the_session(app):
+    # Buchung aus der Zeit vor der Summentabelle bzw. per SQL
+    db.session.execute(text(
+        "INSERT INTO \"transaction\" (description, amount, type, date) "
+        "VALUES ('Altbestand', 100, 'Einnahme', '2024-01-15')"))
+    db.session.commit()
+    add_transaction(5)
+    assert verify_finance_summary()
+    assert finance_summary_outdated()
+
+    assert reconcile_finance_summary()
+    assert not finance_summary_outdated()
+    assert finance_summary()['total'] == (105.0, 0.0)
+    assert verify_finance_summary() == []
+    assert reconcile_finance_summary() == []
+
+
+def test_cost_center_export_uses_the_shared_row_builder(admin_client):
+    center = CostCenter(name='Moschee', code='M1')
+    db.session.add(center)
+    db.session.commit()
+    add_transaction(12.5, cost_center_id=center.id)
+    add_transaction(99, 'Ausgabe')
+
+    response = admin_client.get(f'/admin/finanzen/export/{center.id}?format=csv')
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).lstrip('\ufeff').splitlines()
+    assert lines[0].split(';') == list(COST_CENTER_EXPORT_HEADER)
+    assert lines[1:] == [f'{Transaction.query.filter_by(amount=12.5).one().id};Test;12.5;Einnahme;Keine;01.05.2024;Nicht zugewiesen']
+
+
+def test_cost_center_export_with_turkish_name_can_be_downloaded(admin_client):
+    center = CostCenter(name='Kurban bağışı', code='K1')
+    db.session.add(center)
+    db.session.commit()
+    add_transaction(40, cost_center_id=center.id)
+
+    response = admin_client.get(f'/admin/finanzen/export/{center.id}?format=csv')
+    assert response.status_code == 200
+    disposition = response.headers['Content-Disposition']
+    # Muss sich wie jeder Header als Latin-1 senden lassen
+    disposition.encode('latin-1')
+    assert "filename*=UTF-8''Finanzbericht_Kurban%20ba%C4%9F%C4%B1%C5%9F%C4%B1.csv" in disposition
+    # ASCII-Ersatz wie bei send_file: ğ/ş zerlegt, ı ohne ASCII-Entsprechung entfällt
+    assert 'filename="Finanzbericht_Kurban bags.csv"' in disposition
+    assert 'Test;40.0' in response.get_data(as_text=True)
@@ -0,0 +1,74 @@
+import io
+import time
+
+import pytest
+from PIL import Image
+
+from app import GalerieBild
+from gallery_uploads import PROCESSING, UploadError, gallery_uploads
+
+
+def png_bytes():
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 24), 'green').save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def new_upload(content):
+    batch = gallery_uploads.create_batch([{'name': 'bild.png', 'size': len(content)}])
+    return batch['id'], batch['files'][0]['id']
+
+
+def wait_for_batch(batch_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        batch = gallery_uploads.batch_status(batch_id)
+        if batch['status'] == 'committed':
+            return batch
+        time.sleep(0.1)
+    raise AssertionError(f"Stapel nicht gespeichert: {batch}")
+
+
+class ConcurrentStream(io.BytesIO):
+    """Startet beim ersten Lesen einen zweiten PUT auf dieselbe Datei"""
+
+    def __init__(self, content, upload_id):
+        super().__init__(content)
+        self.upload_id = upload_id
+        self.error = None
+
+    def read(self, size=-1):
+        if self.error is None:
+            with pytest.raises(UploadError) as excinfo:
+                gallery_uploads.write_chunk(self.upload_id, 0, 4, io.BytesIO(b'xxxx'))
+            self.error = excinfo.value
+        return super().read(size)
+
+
+def test_concurrent_put_at_same_offset_is_rejected(app):
+    content = png_bytes()
+    batch_id, upload_id = new_upload(content)
+
+    stream = ConcurrentStream(content, upload_id)
+    status = gallery_uploads.write_chunk(upload_id, 0, len(content), stream)
+    assert stream.error.status == 409
+    assert status['received'] == len(content)
+    assert wait_for_batch(batch_id)['files'][0]['status'] == 'done'
+
+
+def test_stale_processing_file_is_requeued(app, monkeypatch):
+    content = png_bytes()
+    batch_id, upload_id = new_upload(content)
+    # Worker stirbt, nachdem er die Datei zur Verarbeitung übernommen hat
+    monkeypatch.setattr(gallery_uploads, '_submit', lambda upload_id: None)
+    gallery_uploads.write_chunk(upload_id, 0, len(content), io.BytesIO(content))
+    monkeypatch.undo()
+    assert gallery_uploads.get(upload_id)['status'] == PROCESSING
+
+    # Noch nicht verwaist: bleibt liegen
+    assert gallery_uploads.batch_status(batch_id)['files'][0]['status'] == PROCESSING
+    gallery_uploads._connect().execute('UPDATE upload_file SET updated_at = 0 WHERE id = ?', (upload_id,))
+
+    batch = wait_for_batch(batch_id)
+    assert batch['files'][0]['status'] == 'done'
+    assert GalerieBild.query.count() == 1
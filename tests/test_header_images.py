@@ -0,0 +1,53 @@
+import os
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from header_images import HeaderImages
+
+
+@pytest.fixture
+def header(tmp_path):
+    app = Flask(__name__, static_folder=str(tmp_path / 'static'), instance_path=str(tmp_path / 'instance'))
+    app.config['HEADER_IMAGES_CHECK_INTERVAL'] = 0
+    app.config['HEADER_IMAGES_SIZES'] = {'small': 100}
+    os.makedirs(os.path.join(app.static_folder, 'Uploads', 'header'))
+    return HeaderImages(app)
+
+
+def save_image(header, name, size):
+    Image.new('RGB', size, 'blue').save(os.path.join(header.directory, name), 'JPEG')
+
+
+def finish_build(header):
+    header._builder.join(30)
+    return header.get()
+
+
+def test_first_request_does_not_wait_for_the_build(header):
+    save_image(header, 'moschee.jpg', (400, 300))
+
+    bilder = header.get()
+    assert [bild['name'] for bild in bilder] == ['moschee.jpg']
+    assert header.version.endswith('-vorlaeufig')
+
+    bild, = finish_build(header)
+    assert (bild['breite'], bild['hoehe']) == (400, 300)
+    assert not header.version.endswith('-vorlaeufig')
+    assert os.path.exists(header.manifest_path)
+
+
+def test_overwritten_image_is_detected_without_directory_change(header):
+    save_image(header, 'moschee.jpg', (400, 300))
+    header.get()
+    finish_build(header)
+    version = header.version
+    directory_mtime = os.stat(header.directory).st_mtime_ns
+
+    save_image(header, 'moschee.jpg', (640, 480))
+    os.utime(header.directory, ns=(directory_mtime, directory_mtime))
+
+    assert header.version != version
+    bild, = finish_build(header)
+    assert (bild['breite'], bild['hoehe']) == (640, 480)
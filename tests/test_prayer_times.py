@@ -0,0 +1,97 @@
+import datetime
+import os
+
+import pytest
+from flask import Flask
+
+from prayer_times import PrayerTimes, parse_table, prayer_times
+
+GUELTIG = "2024-05-01 04:10 06:00 13:30 17:20 20:50 22:30\n"
+KORRIGIERT = "2024-05-01 04:15 06:05 13:35 17:25 20:55 22:35\n"
+DATUM = datetime.date(2024, 5, 1)
+
+
+@pytest.fixture
+def times(tmp_path):
+    app = Flask(__name__, static_folder=str(tmp_path / 'static'), instance_path=str(tmp_path / 'instance'))
+    app.config['PRAYER_TIMES_RELOAD_INTERVAL'] = 0
+    os.makedirs(app.static_folder)
+    write_source(app, GUELTIG)
+    return PrayerTimes(app)
+
+
+def write_source(app, content, mtime_ns=None):
+    path = os.path.join(app.static_folder, 'gb.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+def test_fixed_file_with_same_stat_as_broken_one_is_loaded(times):
+    assert times.get_for_date(DATUM)['fajr'] == '04:10'
+
+    # Defekte Datei: alte Tabelle bleibt, der Stand gilt aber nicht als geladen
+    mtime_ns = 1_700_000_000_000_000_000
+    write_source(times.app, 'x' * len(KORRIGIERT), mtime_ns)
+    assert not times.reload()
+    assert times.get_for_date(DATUM)['fajr'] == '04:10'
+
+    # Korrektur mit gleicher Größe und mtime wie die defekte Datei
+    write_source(times.app, KORRIGIERT, mtime_ns)
+    assert times.reload()
+    assert times.get_for_date(DATUM)['fajr'] == '04:15'
+
+
+class SyncThread:
+    """Führt die Hintergrundprüfung sofort im Test-Thread aus"""
+
+    def __init__(self, target, **kwargs):
+        self.start = target
+
+
+def test_current_table_checks_for_changed_source(times, monkeypatch):
+    monkeypatch.setattr('prayer_times.threading.Thread', SyncThread)
+    times.app.config['PRAYER_TIMES_RELOAD_INTERVAL'] = 60
+    times._next_check = 0.0
+    write_source(times.app, KORRIGIERT)
+
+    assert times.current_table().get(DATUM)['fajr'] == '04:15'
+
+
+def test_compiled_cache_matches_the_parsed_bytes(times, monkeypatch):
+    import prayer_times
+
+    os.remove(times.app.config['PRAYER_TIMES_CACHE'])
+    parse_table = prayer_times.parse_table
+
+    def parse_while_file_is_replaced(lines, logger):
+        # gb.txt wird zwischen Lesen und Kompilieren ersetzt (gleich groß, andere mtime)
+        write_source(times.app, KORRIGIERT, 1_600_000_000_000_000_000)
+        return parse_table(lines, logger)
+
+    monkeypatch.setattr(prayer_times, 'parse_table', parse_while_file_is_replaced)
+    assert times.reload(force=True)
+    monkeypatch.undo()
+
+    # gb.bin gehört zum alten Inhalt, ein neuer Worker darf ihm nicht trauen
+    fresh = PrayerTimes(times.app)
+    assert fresh.get_for_date(DATUM)['fajr'] == '04:15'
+
+
+@pytest.mark.parametrize('query', ['year=9999&month=12', 'year=2024&month=0', 'year=2024&month=13',
+                                   'year=2024&month=', 'year=0'])
+def test_invalid_year_or_month_is_rejected(client, query):
+    response = client.get(f'/api/prayer-times?{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_month_range_ends_on_last_day_of_month(client, monkeypatch):
+    lines = [f"{day} 05:00 06:30 12:30 15:30 18:00 19:30" for day in ('2024-02-28', '2024-02-29', '2024-03-01')]
+    table = parse_table(lines, client.application.logger)
+    monkeypatch.setattr(prayer_times, 'current_table', lambda: table)
+
+    days = client.get('/api/prayer-times?year=2024&month=2').get_json()['days']
+    assert [day[0] for day in days] == ['2024-02-28', '2024-02-29']
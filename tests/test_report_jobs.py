@@ -0,0 +1,86 @@
+import datetime
+import os
+import time
+
+from sqlalchemy import text
+
+from app import Klasse, Transaction, anwesenheitsdiagramm_dataset, db
+from artifact_cache import artifact_cache
+from report_jobs import report_jobs
+
+
+def wait_for(client, status_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(status_url).get_json()
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.2)
+    raise AssertionError(f"Auftrag nicht fertig: {job}")
+
+
+def test_export_job_runs_in_child_process(admin_client, app):
+    db.session.add(Transaction(description='Kermes', amount=250, type='Einnahme', date=datetime.date(2024, 5, 1)))
+    db.session.commit()
+
+    response = admin_client.post('/berichte/buchungen_export', json={'export_format': 'csv'})
+    assert response.status_code == 202
+    job = wait_for(admin_client, response.get_json()['status_url'])
+    assert job['status'] == 'done', job['error']
+
+    download = admin_client.get(job['download_url'])
+    assert download.status_code == 200
+    assert 'Kermes' in download.get_data(as_text=True)
+
+
+def test_admin_job_status_requires_admin(admin_client, app):
+    response = admin_client.post('/berichte/buchungen_export', json={'export_format': 'csv'})
+    urls = response.get_json()
+
+    guest = app.test_client()
+    assert guest.get(urls['status_url']).status_code == 403
+    assert guest.get(urls['download_url']).status_code == 403
+    wait_for(admin_client, urls['status_url'])
+
+
+def test_evicted_artifact_is_rendered_again(client, app):
+    klasse = Klasse(name='1a', schuljahr='2024/2025')
+    db.session.add(klasse)
+    db.session.commit()
+
+    urls = client.post('/berichte/anwesenheitsdiagramm', json={'klasse_id': klasse.id}).get_json()
+    job = wait_for(client, urls['status_url'])
+    assert job['status'] == 'done', job['error']
+    # Unveränderte Daten: derselbe Auftrag kommt aus dem Cache
+    again = client.post('/berichte/anwesenheitsdiagramm', json={'klasse_id': klasse.id}).get_json()
+    assert again['status'] == 'done'
+
+    os.remove(report_jobs.artifact_path(report_jobs.get(job['id'])))
+    response = client.get(urls['download_url'], headers={'Accept': 'application/json'})
+    assert response.status_code == 409
+    assert response.get_json()['status'] in ('queued', 'running')
+
+    assert wait_for(client, urls['status_url'])['status'] == 'done'
+    assert client.get(urls['download_url']).status_code == 200
+
+
+def test_dataset_key_follows_the_data_not_the_counters(app):
+    klasse = Klasse(name='1b', schuljahr='2024/2025')
+    db.session.add(klasse)
+    db.session.commit()
+    digest = artifact_cache.digest(anwesenheitsdiagramm_dataset(klasse.id))
+    assert artifact_cache.digest(anwesenheitsdiagramm_dataset(klasse.id)) == digest
+
+    # Per SQL an den Versionszählern vorbei, wie nach einem Backup oder Datenbankwechsel
+    db.session.execute(text("UPDATE klasse SET name = '1c' WHERE id = :id"), {'id': klasse.id})
+    db.session.commit()
+    assert artifact_cache.digest(anwesenheitsdiagramm_dataset(klasse.id)) != digest
+
+
+def test_forkserver_preloads_only_libraries(app):
+    from multiprocessing import forkserver
+
+    report_jobs._context()
+    # Das App-Modul lädt erst der Kindprozess (create_all, Schema-Abgleich usw.)
+    assert app.import_name not in forkserver._forkserver._preload_modules
+    assert list(forkserver._forkserver._preload_modules) == list(report_jobs.preload)
@@ -0,0 +1,37 @@
+import gzip
+import os
+
+from static_files import ENCODINGS, META_SUFFIX, ensure_precompressed
+
+
+def write(path, content, mtime_ns=None):
+    with open(path, 'wb') as f:
+        f.write(content)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_variants_follow_content_not_mtime(app, tmp_path):
+    path = str(tmp_path / 'gb.txt')
+    write(path, b'2024-05-01 04:10 06:00\n' * 50)
+    variants = ensure_precompressed(path)
+    assert set(variants) == set(ENCODINGS)
+    assert os.path.exists(path + META_SUFFIX)
+
+    # Ältere Fassung gleicher Größe zurückgespielt: mtime liegt vor der Variante
+    old_mtime = os.stat(variants['gzip']).st_mtime_ns - 10**9
+    write(path, b'2024-05-01 04:11 06:01\n' * 50, mtime_ns=old_mtime)
+    variants = ensure_precompressed(path)
+    with gzip.open(variants['gzip']) as f:
+        assert f.read() == b'2024-05-01 04:11 06:01\n' * 50
+
+
+def test_touched_source_keeps_its_variants(app, tmp_path):
+    path = str(tmp_path / 'gb.txt')
+    write(path, b'Gebetszeiten\n' * 50)
+    gz_path = ensure_precompressed(path)['gzip']
+    written = os.stat(gz_path).st_ino
+
+    os.utime(path, ns=(1, 1))
+    assert ensure_precompressed(path)['gzip'] == gz_path
+    assert os.stat(gz_path).st_ino == written
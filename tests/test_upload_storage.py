@@ -0,0 +1,117 @@
+import datetime
+import hashlib
+import io
+import os
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from app import Transaction, ahde_vefa, db
+from upload_storage import UploadBlob, upload_storage
+
+CONTENT = b'\xff\xd8\xff\xe0 gleiches Bild'
+
+
+def upload(filename, content=CONTENT):
+    return upload_storage.save(FileStorage(io.BytesIO(content), filename=filename))
+
+
+def add_entry(image_filename):
+    entry = ahde_vefa(name='Test', image_filename=image_filename)
+    db.session.add(entry)
+    db.session.commit()
+    return entry
+
+
+def refcount(path):
+    blob = db.session.get(UploadBlob, path)
+    return blob.refcount if blob else None
+
+
+def test_same_content_is_stored_once_and_released_with_last_reference(app):
+    first = add_entry(upload('a.jpg'))
+    second = add_entry(upload('b.jpeg'))
+    path = first.image_filename
+    assert second.image_filename == path
+    assert refcount(path) == 2
+
+    db.session.delete(first)
+    db.session.commit()
+    assert refcount(path) == 1
+    assert os.path.exists(upload_storage.full_path(path))
+
+    db.session.delete(second)
+    db.session.commit()
+    assert refcount(path) is None
+    assert not os.path.exists(upload_storage.full_path(path))
+
+
+def test_replacing_an_image_releases_the_old_file(app):
+    entry = add_entry(upload('alt.jpg'))
+    old_path = entry.image_filename
+    entry.image_filename = upload('neu.jpg', b'anderes Bild')
+    db.session.commit()
+    assert refcount(old_path) is None
+    assert not os.path.exists(upload_storage.full_path(old_path))
+    assert refcount(entry.image_filename) == 1
+
+
+@pytest.fixture
+def twin_blobs(app):
+    """Derselbe Inhalt als zwei Originale (.jpg, .jpeg) mit gemeinsamer Variante, wie vor der Zusammenführung möglich"""
+    sha = hashlib.sha256(b'zwilling').hexdigest()
+    base = f"blobs/{sha[:2]}/{sha[2:4]}/{sha}"
+    paths = {'jpg': base + '.jpg', 'jpeg': base + '.jpeg', 'thumb': base + '.thumb.webp'}
+    for path in paths.values():
+        os.makedirs(os.path.dirname(upload_storage.full_path(path)), exist_ok=True)
+        with open(upload_storage.full_path(path), 'wb') as f:
+            f.write(b'zwilling')
+    return paths
+
+
+def test_collect_keeps_files_of_another_original_with_the_same_hash(twin_blobs):
+    upload_storage.add_references([twin_blobs['jpeg']])
+    add_entry(twin_blobs['jpeg'])
+    db.session.add(UploadBlob(path=twin_blobs['jpg'], sha256='x', refcount=0))
+    db.session.commit()
+
+    assert upload_storage.collect([twin_blobs['jpg']]) == [twin_blobs['jpg']]
+    assert not os.path.exists(upload_storage.full_path(twin_blobs['jpg']))
+    assert os.path.exists(upload_storage.full_path(twin_blobs['jpeg']))
+    assert os.path.exists(upload_storage.full_path(twin_blobs['thumb']))
+
+
+def test_gc_matches_originals_by_exact_path(twin_blobs, monkeypatch):
+    monkeypatch.setattr(upload_storage, 'grace', -1)
+    add_entry(twin_blobs['jpeg'])
+
+    fixed, orphans = upload_storage.gc()
+    assert fixed == {}
+    # Die Ablage ist für alle Tests dieselbe, daher nur die eigenen Dateien prüfen
+    assert upload_storage.full_path(twin_blobs['jpg']) in orphans
+    assert upload_storage.full_path(twin_blobs['jpeg']) not in orphans
+    assert upload_storage.full_path(twin_blobs['thumb']) not in orphans
+    assert os.path.exists(upload_storage.full_path(twin_blobs['jpeg']))
+    assert os.path.exists(upload_storage.full_path(twin_blobs['thumb']))
+
+
+def test_static_path_of_legacy_names_points_into_upload_root(app):
+    assert upload_storage.static_path('alt.jpg', 'galerie') == 'Uploads/galerie/alt.jpg'
+    assert upload_storage.static_path('alt.jpg') == 'Uploads/alt.jpg'
+
+
+def test_receipt_is_only_served_privately_to_admins(admin_client):
+    transaction = Transaction(description='Strom', amount=80, type='Ausgabe', date=datetime.date(2024, 5, 1),
+                              document_filename=upload('rechnung.pdf', b'%PDF-1.4 Beleg'))
+    db.session.add(transaction)
+    db.session.commit()
+    url = f'/download_document/{transaction.id}?inline=1'
+
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    assert response.cache_control.private
+    assert 'immutable' not in response.headers['Cache-Control']
+    assert response.get_data() == b'%PDF-1.4 Beleg'
+
+    guest = admin_client.application.test_client()
+    assert guest.get(url).status_code == 302
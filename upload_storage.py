@@ -0,0 +1,379 @@
+"""
+Inhaltsadressierte Ablage für hochgeladene Dateien
+
+Uploads werden nicht mehr unter ihrem Originalnamen gespeichert, sondern
+unter ihrem SHA-256 in einem zweistufigen Verzeichnisbaum unterhalb des
+Upload-Ordners: 'blobs/ab/cd/abcd….jpg'. Gleiche Dateien liegen damit nur
+einmal auf der Platte, gleichnamige überschreiben sich nicht mehr, und eine
+Datei ändert sich nie, solange ihr Pfad gilt.
+
+In den Modellen steht dieser Pfad relativ zum Upload-Ordner. Die Tabelle
+upload_blob zählt, wie viele Zeilen auf eine Datei verweisen; die Zähler
+werden im selben Flush fortgeschrieben wie die Zeilen selbst (siehe track()).
+Fällt ein Zähler auf 0, wird die Datei nach dem Commit gelöscht, samt der
+daraus abgeleiteten Dateien mit gleichem Namensstamm (z. B. Bildvarianten).
+Ältere Einträge mit einfachem Dateinamen bleiben gültig und werden nicht gezählt.
+"""
+import datetime
+import hashlib
+import os
+import re
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+from sqlalchemy import event, text
+from werkzeug.utils import secure_filename
+
+from database import db, upsert_insert
+
+BLOB_DIR = 'blobs'
+READ_BLOCK = 64 * 1024
+_EXTENSION = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+
+class UploadBlob(db.Model):
+    """Eine gespeicherte Datei und die Anzahl der Zeilen, die auf sie verweisen"""
+    __tablename__ = 'upload_blob'
+    path = db.Column(db.String(120), primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UploadBlob {self.path} x{self.refcount}>"
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_DIR + '/')
+
+
+def blob_path(sha256, filename):
+    """Relativer Pfad einer Datei mit diesem Hash, die Endung kommt aus dem Originalnamen"""
+    extension = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    if not _EXTENSION.match(extension):
+        extension = ''
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def _sha256_from_path(path):
+    return os.path.basename(path).split('.', 1)[0]
+
+
+def _is_original(name):
+    """'<sha>' oder '<sha>.<endung>'; abgeleitete Dateien heißen '<sha>.<größe>.<format>'"""
+    return name.count('.') <= 1
+
+
+class UploadStorage:
+    def __init__(self, app=None, db=None):
+        self.root = None
+        self.tmp_dir = None
+        self.logger = None
+        self.tracked = defaultdict(list)
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('UPLOAD_STORE_ROOT', app.config['UPLOAD_FOLDER'])
+        # Verwaiste Dateien erst nach dieser Zeit aufräumen (laufende Uploads)
+        app.config.setdefault('UPLOAD_STORE_GC_GRACE', 3600)
+        self.root = app.config['UPLOAD_STORE_ROOT']
+        self.tmp_dir = os.path.join(self.root, BLOB_DIR, 'tmp')
+        self.grace = app.config['UPLOAD_STORE_GC_GRACE']
+        self.logger = app.logger
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        event.listen(db.session, 'before_flush', self._track_references)
+        event.listen(db.session, 'after_flush', self._apply_references)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+
+    def track(self, *columns):
+        """Zählt Verweise aus diesen Modell-Spalten, z. B. track(ahde_vefa.image_filename)"""
+        for column in columns:
+            self.tracked[column.class_].append(column.key)
+
+    # --- Pfade ---
+
+    def full_path(self, name, legacy_dir=''):
+        """Dateipfad zu einem gespeicherten Namen; alte Namen liegen in legacy_dir"""
+        if is_blob(name):
+            return os.path.join(self.root, *name.split('/'))
+        return os.path.join(self.root, legacy_dir, name)
+
+    def static_path(self, name, legacy_dir=''):
+        """Pfad für url_for('static', ...); alte Namen liegen unter '<legacy_dir>/' in der Ablage"""
+        root = os.path.basename(os.path.normpath(self.root))
+        if is_blob(name):
+            return f"{root}/{name}"
+        return '/'.join(part for part in (root, legacy_dir, name) if part)
+
+    # --- Speichern ---
+
+    def save(self, file_storage):
+        """Speichert einen Upload (werkzeug FileStorage) und liefert den relativen Pfad.
+
+        Die Datei wird beim Lesen gehasht; existiert der Inhalt schon, bleibt
+        es bei der vorhandenen Datei. Der Verweis zählt erst, wenn eine Zeile
+        mit diesem Pfad committet wird.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix='.part')
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    block = file_storage.stream.read(READ_BLOCK)
+                    if not block:
+                        break
+                    hasher.update(block)
+                    f.write(block)
+                    size += len(block)
+            path = self._path_for(hasher.hexdigest(), file_storage.filename)
+            self._place(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        # Temporäre Kopie bis zum Commit behalten, falls die Datei zwischenzeitlich aufgeräumt wird
+        pending = db.session.info.setdefault('upload_blob_sources', {})
+        previous = pending.pop(path, None)
+        if previous:
+            self._remove(previous)
+        pending[path] = tmp_path
+        return path
+
+    def adopt(self, source_path, sha256, filename):
+        """Übernimmt eine bereits gehashte Datei (z. B. aus dem stückweisen Upload) in die Ablage"""
+        path = self._path_for(sha256, filename)
+        self._place(source_path, path)
+        self._remove(source_path)
+        return path
+
+    def _path_for(self, sha256, filename):
+        """Pfad für diesen Inhalt; liegt er schon unter anderer Endung vor (a.jpg, b.jpeg), wird dieser Pfad benutzt"""
+        existing = db.session.query(UploadBlob.path).filter(UploadBlob.sha256 == sha256) \
+            .order_by(UploadBlob.refcount.desc()).limit(1).scalar()
+        if existing:
+            return existing
+        path = blob_path(sha256, filename)
+        directory = os.path.dirname(self.full_path(path))
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return path
+        for name in sorted(names):
+            if _is_original(name) and name.split('.', 1)[0] == sha256:
+                return '/'.join([os.path.dirname(path), name])
+        return path
+
+    def _place(self, source_path, path):
+        """Legt die Datei per Hardlink an ihren Pfad; gibt es sie schon, wird sie weiterverwendet"""
+        target = self.full_path(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source_path, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Dateisystem ohne Hardlinks: kopieren und atomar umbenennen
+            tmp_target = f"{target}.{uuid.uuid4().hex}.tmp"
+            with open(source_path, 'rb') as src, open(tmp_target, 'wb') as dst:
+                while True:
+                    block = src.read(READ_BLOCK)
+                    if not block:
+                        break
+                    dst.write(block)
+            if os.path.exists(target):
+                os.remove(tmp_target)
+            else:
+                os.replace(tmp_target, target)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.error(f"Datei {path} konnte nicht gelöscht werden: {e}")
+
+    # --- Referenzzähler ---
+
+    def _values(self, obj):
+        return [getattr(obj, key) for key in self.tracked.get(type(obj), ())]
+
+    def _track_references(self, session, flush_context, instances):
+        """Ermittelt die Änderungen der Verweise aus neuen, geänderten und gelöschten Zeilen"""
+        new = [obj for obj in session.new if type(obj) in self.tracked]
+        dirty = [obj for obj in session.dirty if type(obj) in self.tracked and session.is_modified(obj)]
+        deleted = [obj for obj in session.deleted if type(obj) in self.tracked]
+        if not (new or dirty or deleted):
+            return
+
+        deltas = session.info.setdefault('upload_blob_deltas', defaultdict(int))
+        # Alte Werte direkt aus der Datenbank, dort steht vor dem Flush noch der alte Stand
+        old = defaultdict(list)
+        for obj in dirty + deleted:
+            if obj.id is not None:
+                old[type(obj)].append(obj.id)
+        with session.no_autoflush:
+            for model, ids in old.items():
+                columns = [getattr(model, key) for key in self.tracked[model]]
+                for row in session.query(*columns).filter(model.id.in_(ids)):
+                    for value in row:
+                        if is_blob(value):
+                            deltas[value] -= 1
+            for obj in new + dirty:
+                for value in self._values(obj):
+                    if is_blob(value):
+                        deltas[value] += 1
+
+    def add_references(self, paths, session=None):
+        """Zählt Verweise aus Zeilen, die an den Flush-Events vorbei angelegt wurden (Bulk-Insert)"""
+        session = session or db.session
+        deltas = defaultdict(int)
+        for path in paths:
+            if is_blob(path):
+                deltas[path] += 1
+        self._write_deltas(session, deltas)
+
+    def _apply_references(self, session, flush_context):
+        deltas = session.info.pop('upload_blob_deltas', None)
+        if deltas:
+            self._write_deltas(session, deltas)
+
+    def _write_deltas(self, session, deltas):
+        rows = [{'path': path, 'delta': delta} for path, delta in deltas.items() if delta]
+        if not rows:
+            return
+        connection = session.connection()
+        table = UploadBlob.__table__
+        sources = session.info.get('upload_blob_sources', {})
+        for row in rows:
+            path = row['path']
+            target = self.full_path(path)
+            if row['delta'] > 0 and not os.path.exists(target) and path in sources:
+                # Zwischen Speichern und Flush aufgeräumt: aus der temporären Kopie wiederherstellen
+                self._place(sources[path], path)
+            try:
+                size = os.path.getsize(target)
+            except OSError:
+                size = 0
+            stmt = upsert_insert(table).values(
+                path=path, sha256=_sha256_from_path(path), size=size,
+                refcount=row['delta'], created_at=datetime.datetime.utcnow())
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.path],
+                set_={'refcount': table.c.refcount + stmt.excluded.refcount},
+            ))
+            if row['delta'] < 0:
+                session.info.setdefault('upload_blob_released', set()).add(path)
+
+    def _after_commit(self, session):
+        for tmp_path in session.info.pop('upload_blob_sources', {}).values():
+            self._remove(tmp_path)
+        released = session.info.pop('upload_blob_released', None)
+        if released:
+            self.collect(released)
+
+    def _after_rollback(self, session):
+        session.info.pop('upload_blob_deltas', None)
+        session.info.pop('upload_blob_released', None)
+        # Die temporären Kopien bleiben bis zum nächsten Commit oder bis zum Aufräumen liegen
+
+    def collect(self, paths):
+        """Löscht Dateien ohne Verweise.
+
+        Zeile und Datei verschwinden in derselben Schreibtransaktion, damit ein
+        gleichzeitiger Upload desselben Inhalts die Datei danach neu anlegt
+        statt auf eine gelöschte Datei zu verweisen.
+        """
+        table = UploadBlob.__table__
+        with db.engine.begin() as conn:
+            removed = conn.execute(
+                table.delete().where(table.c.path.in_(list(paths)), table.c.refcount <= 0)
+                .returning(table.c.path)).scalars().all()
+            for path in removed:
+                self._remove_with_derivatives(path)
+        return removed
+
+    def _remove_with_derivatives(self, path):
+        """Löscht genau dieses Original; abgeleitete Dateien nur, wenn kein Original desselben Inhalts bleibt"""
+        target = self.full_path(path)
+        self._remove(target)
+        directory = os.path.dirname(target)
+        stem = _sha256_from_path(path)
+        try:
+            names = [name for name in os.listdir(directory) if name.split('.', 1)[0] == stem]
+        except FileNotFoundError:
+            return
+        if any(_is_original(name) for name in names):
+            return
+        for name in names:
+            self._remove(os.path.join(directory, name))
+
+    # --- Prüfen und Aufräumen ---
+
+    def count_references(self):
+        """Zählt alle Verweise neu aus den registrierten Spalten"""
+        counts = defaultdict(int)
+        for model, keys in self.tracked.items():
+            for key in keys:
+                column = getattr(model, key)
+                for value, count in db.session.query(column, db.func.count()) \
+                        .filter(column.like(BLOB_DIR + '/%')).group_by(column):
+                    counts[value] += count
+        return counts
+
+    def gc(self, dry_run=False):
+        """Gleicht die Zähler mit den Tabellen ab und löscht Dateien ohne Verweis.
+
+        Dateien, die jünger als UPLOAD_STORE_GC_GRACE sind, bleiben liegen,
+        damit laufende Uploads nicht getroffen werden. Liefert (korrigierte
+        Zähler, gelöschte Dateien).
+        """
+        counts = self.count_references()
+        stored = {row.path: row.refcount for row in UploadBlob.query}
+        fixed = {path: count for path, count in counts.items() if stored.get(path) != count}
+        fixed.update({path: 0 for path, count in stored.items() if path not in counts and count != 0})
+        cutoff = time.time() - self.grace
+        # Originale zählen nur mit exaktem Pfad, abgeleitete Dateien über den Hash ihres Originals
+        referenced_stems = {path.split('.', 1)[0] for path in counts}
+        orphans = []
+        blob_root = os.path.join(self.root, BLOB_DIR)
+        for directory, _, files in os.walk(blob_root):
+            if os.path.abspath(directory).startswith(os.path.abspath(self.tmp_dir)):
+                orphans.extend(os.path.join(directory, name) for name in files
+                               if os.path.getmtime(os.path.join(directory, name)) < cutoff)
+                continue
+            for name in files:
+                full = os.path.join(directory, name)
+                relative = '/'.join([BLOB_DIR, *os.path.relpath(full, blob_root).split(os.sep)])
+                if _is_original(name):
+                    referenced = relative in counts
+                else:
+                    referenced = relative.split('.', 1)[0] in referenced_stems
+                if not referenced and os.path.getmtime(full) < cutoff:
+                    orphans.append(full)
+        if dry_run:
+            return fixed, orphans
+
+        table = UploadBlob.__table__
+        for path, count in fixed.items():
+            db.session.execute(text('UPDATE upload_blob SET refcount = :count WHERE path = :path'),
+                               {'count': count, 'path': path})
+            if path not in stored:
+                db.session.execute(upsert_insert(table).values(
+                    path=path, sha256=_sha256_from_path(path), refcount=count, size=0,
+                    created_at=datetime.datetime.utcnow()).on_conflict_do_nothing())
+        db.session.commit()
+        self.collect([path for path, count in fixed.items() if count <= 0])
+        for full in orphans:
+            self._remove(full)
+        return fixed, orphans
+
+
+# Singleton-Instanz
+upload_storage = UploadStorage()